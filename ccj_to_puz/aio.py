@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+"""Convert CCJ crosswords from asyncio code without blocking the event loop
+
+Parsing and writing are CPU-bound, so calling ParsedCCJ directly from
+a coroutine stalls everything else on the event loop.  An
+AsyncConverter runs the conversions in a pool of worker processes (or
+threads) instead, and at most max_concurrent of them at once, so that
+any number of coroutines can ask for conversions without
+oversubscribing the cores:
+
+  converter = AsyncConverter(workers=4)
+  puz = await converter.convert(ccj_bytes, title="Cryptic 1234")
+  ipuz = await converter.convert(reader, output_format='ipuz')
+  converter.shutdown()
+
+The input can be bytes, or an asyncio.StreamReader (or anything else
+with a coroutine read() method, like an aiofiles file), or an async
+iterable of chunks of bytes.  The keyword arguments are the metadata
+keys of batch.convert_file.  For a one-off there's also:
+
+  puz = await convert(ccj_bytes, copyright_message="(c) Me")
+
+which uses an AsyncConverter shared by the whole process.
+
+A CCJ file that can't be parsed raises CCJParseError (with the offset
+of the problem, as usual) and anything else that goes wrong raises a
+subclass of ConversionError.  This needs Python 3.7 or later."""
+
+import asyncio
+import concurrent.futures
+
+from ccj_to_puz.batch import default_number_of_processes, \
+    parse_with_metadata
+from ccj_to_puz.commonccj import CCJParseError
+from ccj_to_puz.formats import PreparedPuzzle, serializer_for
+
+# The keyword arguments that convert() accepts as metadata:
+METADATA_KEYS = ('title', 'author', 'puzzle_number', 'copyright_message',
+                 'date_string', 'checksums', 'cache_directory',
+                 'cache_max_bytes')
+READ_CHUNK_SIZE = 64 * 1024
+
+class ConversionError(Exception):
+    """The base class of the errors from an AsyncConverter, except parsing"""
+    pass
+
+class ConverterBusy(ConversionError):
+    """There were already max_pending conversions waiting"""
+    pass
+
+class ConversionTimeout(ConversionError):
+    """A conversion took longer than the converter's timeout"""
+    pass
+
+class InputTooLarge(ConversionError):
+    """A stream had more than the converter's max_input_size bytes"""
+    pass
+
+class WorkerFailed(ConversionError):
+    """A worker process died (e.g. it was killed for using too much memory)"""
+    pass
+
+class ConversionFailed(ConversionError):
+    """The conversion raised some other exception, which is its __cause__"""
+    pass
+
+def convert_to_bytes(data, metadata, output_format='puz'):
+    """Convert the CCJ file in data, returning the bytes of the output
+
+    This is what runs in the workers; metadata is a dictionary with
+    the same keys as for batch.convert_file."""
+    parsed = parse_with_metadata(data, metadata)
+    prepared = PreparedPuzzle(parsed,
+                              checksums=metadata.get('checksums', False))
+    return prepared.serialize(output_format)
+
+async def read_input(source, max_size=None):
+    """Return the bytes of source: bytes, a stream or an async iterable"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = bytes(source)
+        if max_size is not None and len(data) > max_size:
+            raise InputTooLarge("The input is larger than {0} bytes".format(
+                max_size))
+        return data
+    chunks = []
+    size = 0
+    if hasattr(source, 'read'):
+        async def iterate():
+            while True:
+                chunk = await source.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        chunk_iterator = iterate()
+    elif hasattr(source, '__aiter__'):
+        chunk_iterator = source
+    else:
+        message = "Can't read a CCJ file from a {0}"
+        raise TypeError(message.format(source.__class__.__name__))
+    async for chunk in chunk_iterator:
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise InputTooLarge("The input is larger than {0} bytes".format(
+                max_size))
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def call_soon_threadsafe(loop, callback, *args):
+    """Call callback in loop's thread, unless loop has already closed"""
+    try:
+        loop.call_soon_threadsafe(callback, *args)
+    except RuntimeError:
+        pass
+
+class AsyncConverter:
+    """A class for converting crosswords in a pool from asyncio code
+
+    workers is the size of the pool (by default one per core), which
+    is of threads if use_threads is True and of processes otherwise;
+    or pass your own executor, which is left running by shutdown().
+    At most max_concurrent conversions (by default one per worker)
+    are given to the pool at once, and the rest wait their turn, or
+    if max_pending are already running or waiting, fail straight away
+    with ConverterBusy.  A conversion that takes longer than timeout
+    seconds fails with ConversionTimeout, although a worker process
+    carries on with it, since it can't be interrupted - so it keeps
+    its place among the max_concurrent and max_pending until the
+    worker has finished with it, so that abandoned conversions can't
+    pile up in the pool.  defaults are metadata used for every
+    conversion unless they're overridden."""
+
+    def __init__(self,
+                 workers=None,
+                 use_threads=False,
+                 executor=None,
+                 max_concurrent=None,
+                 max_pending=None,
+                 timeout=None,
+                 max_input_size=None,
+                 defaults=None):
+        if workers is None:
+            workers = default_number_of_processes()
+        self.workers = workers
+        self.use_threads = use_threads
+        self.owns_executor = executor is None
+        self.executor = executor or self.make_executor()
+        self.max_concurrent = max_concurrent or workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.max_input_size = max_input_size
+        self.defaults = dict(defaults or {})
+        self.pending = 0
+        self.semaphore = None
+        self.semaphore_loop = None
+
+    def make_executor(self):
+        if self.use_threads:
+            return concurrent.futures.ThreadPoolExecutor(self.workers)
+        return concurrent.futures.ProcessPoolExecutor(self.workers)
+
+    def get_semaphore(self):
+        """Return the semaphore limiting the conversions on the running loop"""
+        # (Before Python 3.10 a semaphore belongs to the loop that was
+        # current when it was made, so make one for each loop used.)
+        loop = asyncio.get_running_loop()
+        if self.semaphore_loop is not loop:
+            self.semaphore = asyncio.Semaphore(self.max_concurrent)
+            self.semaphore_loop = loop
+        return self.semaphore
+
+    def shutdown(self, wait=True):
+        if self.owns_executor:
+            self.executor.shutdown(wait=wait)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.shutdown(wait=False)
+
+    async def convert(self, source, output_format='puz', **metadata):
+        """Convert the CCJ file from source, returning the output's bytes
+
+        output_format is the name of one of the formats in
+        formats.SERIALIZERS."""
+        for k in metadata:
+            if k not in METADATA_KEYS:
+                raise TypeError("Unknown metadata keyword: " + k)
+        serializer_for(output_format)
+        if self.max_pending is not None and self.pending >= self.max_pending:
+            raise ConverterBusy("Too many conversions in progress")
+        self.pending += 1
+        try:
+            data = await read_input(source, self.max_input_size)
+            job_metadata = dict(self.defaults)
+            job_metadata.update(metadata)
+            semaphore = self.get_semaphore()
+            await semaphore.acquire()
+        except BaseException:
+            self.pending -= 1
+            raise
+        return await self.run_in_executor(semaphore, data, job_metadata,
+                                          output_format)
+
+    def conversion_finished(self, semaphore):
+        semaphore.release()
+        self.pending -= 1
+
+    async def run_in_executor(self, semaphore, data, metadata,
+                              output_format):
+        """Run one conversion in the pool, with semaphore acquired for it
+
+        The semaphore is released (and the conversion stops counting
+        as pending) when the pool has finished with the conversion,
+        rather than when this stops waiting for it."""
+        loop = asyncio.get_running_loop()
+        try:
+            try:
+                future = self.executor.submit(convert_to_bytes,
+                                              data,
+                                              metadata,
+                                              output_format)
+            except BaseException:
+                self.conversion_finished(semaphore)
+                raise
+            future.add_done_callback(
+                lambda _: call_soon_threadsafe(loop, self.conversion_finished,
+                                               semaphore))
+            return await asyncio.wait_for(asyncio.wrap_future(future),
+                                          self.timeout)
+        except asyncio.TimeoutError:
+            raise ConversionTimeout("The conversion took longer than "
+                                    "{0}s".format(self.timeout))
+        except concurrent.futures.BrokenExecutor as e:
+            # Start a new pool for later conversions:
+            if self.owns_executor:
+                self.executor = self.make_executor()
+            raise WorkerFailed("A worker process failed") from e
+        except CCJParseError:
+            raise
+        except Exception as e:
+            raise ConversionFailed("{0}: {1}".format(e.__class__.__name__,
+                                                     e)) from e
+
+_default_converter = None
+
+def get_default_converter():
+    """Return the AsyncConverter shared within this process"""
+    global _default_converter
+    if _default_converter is None:
+        _default_converter = AsyncConverter()
+    return _default_converter
+
+async def convert(source, output_format='puz', **metadata):
+    """Convert the CCJ file from source with the shared AsyncConverter"""
+    return await get_default_converter().convert(source,
+                                                 output_format,
+                                                 **metadata)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Convert the .ccj files in zip and tar archives without extracting them
+
+Back catalogues of crosswords tend to be kept as zip or tar.gz files
+of many small .ccj files, and extracting them all to disk first is
+slower than converting them.  The functions here read each .ccj
+member of an archive into memory and convert it from there; the
+.puz files can be written to a directory or to an output zip file.
+When a member is stored uncompressed (in a zip file with the "stored"
+method, or in an uncompressed tar file) its bytes are sliced straight
+out of an mmap of the archive rather than read through zipfile or
+tarfile.
+
+ccj-to-puz-batch uses this for any of its inputs whose names end in
+one of ARCHIVE_SUFFIXES.  The members are converted by a Scheduler, so
+one that hangs or crashes a worker can't hold up the rest."""
+
+from __future__ import print_function
+
+import io
+import mmap
+import os
+import posixpath
+import struct
+import tarfile
+import time
+import zipfile
+import zlib
+
+from ccj_to_puz.batch import ConversionResult, parse_with_metadata
+from ccj_to_puz.fingerprint import claim_for_job, release_for_job
+from ccj_to_puz.fsutil import atomic_write, makedirs_if_missing
+from ccj_to_puz.scheduler import Scheduler
+from ccj_to_puz.stats import ParseStats
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2',
+                    '.tar.xz', '.txz')
+# The fixed-size part of a zip file's local file header; the member's
+# data starts after it, the file name and the "extra" field:
+ZIP_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+ZIP_LOCAL_HEADER_SIGNATURE = b'PK\003\004'
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_SUFFIXES)
+
+def is_ccj_member(name):
+    return name.lower().endswith('.ccj')
+
+def output_name_for(member_name):
+    """Return the relative path of the .puz file for an archive member
+
+    The directories within the archive are kept, but any absolute or
+    '..' parts of the name are dropped so that nothing can be
+    written outside the output directory."""
+    parts = [p for p in member_name.replace('\\', '/').split('/')
+             if p not in ('', '.', '..')]
+    return posixpath.splitext('/'.join(parts))[0] + '.puz'
+
+def map_file(f):
+    """Return a read-only mmap of the whole of the open file f"""
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def stored_zip_member(mapped, info):
+    """Return the bytes of an uncompressed zip member from mapped
+
+    Returns None if the member is compressed or encrypted, or its
+    local header doesn't look right, so that zipfile should be used
+    instead."""
+    if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1:
+        return None
+    start = info.header_offset
+    header = mapped[start:start + ZIP_LOCAL_HEADER.size]
+    if len(header) < ZIP_LOCAL_HEADER.size:
+        return None
+    fields = ZIP_LOCAL_HEADER.unpack(header)
+    if fields[0] != ZIP_LOCAL_HEADER_SIGNATURE:
+        return None
+    name_length, extra_length = fields[10], fields[11]
+    start += ZIP_LOCAL_HEADER.size + name_length + extra_length
+    data = mapped[start:start + info.file_size]
+    if len(data) != info.file_size or \
+            zlib.crc32(data) & 0xffffffff != info.CRC:
+        return None
+    return data
+
+def iterate_zip(path):
+    """Generate (member name, bytes) for each .ccj member of a zip file"""
+    with open(path, 'rb') as f:
+        mapped = map_file(f)
+        try:
+            with zipfile.ZipFile(f) as archive:
+                for info in archive.infolist():
+                    if info.filename.endswith('/') or \
+                            not is_ccj_member(info.filename):
+                        continue
+                    data = stored_zip_member(mapped, info)
+                    if data is None:
+                        data = archive.read(info)
+                    yield info.filename, data
+        finally:
+            mapped.close()
+
+def iterate_tar(path):
+    """Generate (member name, bytes) for each .ccj member of a tar file"""
+    try:
+        archive = tarfile.open(path, 'r:')
+    except tarfile.ReadError:
+        archive = None
+    if archive is None:
+        # It's compressed, so there's no way to avoid decompressing
+        # it from the start, but at least we only need to do that
+        # once if we read it sequentially:
+        archive = tarfile.open(path, 'r|*')
+        try:
+            for member in archive:
+                if member.isfile() and is_ccj_member(member.name):
+                    yield member.name, archive.extractfile(member).read()
+        finally:
+            archive.close()
+        return
+    try:
+        with open(path, 'rb') as f:
+            mapped = map_file(f)
+            try:
+                for member in archive.getmembers():
+                    if member.isfile() and is_ccj_member(member.name):
+                        start = member.offset_data
+                        yield member.name, mapped[start:start + member.size]
+            finally:
+                mapped.close()
+    finally:
+        archive.close()
+
+def iterate_archive(path):
+    """Generate (member name, bytes) for each .ccj file in an archive"""
+    if path.lower().endswith('.zip'):
+        return iterate_zip(path)
+    return iterate_tar(path)
+
+def read_input(path):
+    """Return the contents of the file at path, or the exception reading it"""
+    try:
+        with io.open(path, 'rb') as f:
+            return f.read()
+    except EnvironmentError as e:
+        return e
+
+def iterate_inputs(paths, read_files=True):
+    """Generate (source name, output name, bytes) for paths
+
+    Each of paths may be an archive, in which case its .ccj members
+    are generated, or a .ccj file.  If an archive or file can't be
+    read, the exception is generated in place of the bytes.  If
+    read_files is False, None is generated in place of the bytes of
+    a .ccj file, for convert_member to read it itself."""
+    for path in paths:
+        if is_archive(path):
+            try:
+                for member_name, data in iterate_archive(path):
+                    yield (path + ':' + member_name,
+                           output_name_for(member_name),
+                           data)
+            except (EnvironmentError, tarfile.TarError,
+                    zipfile.BadZipfile) as e:
+                yield path, None, e
+        else:
+            output_name = \
+                os.path.splitext(os.path.basename(path))[0] + '.puz'
+            yield path, output_name, read_input(path) if read_files else None
+
+def convert_member(job):
+    """Convert one .ccj file already in memory, returning a ConversionResult
+
+    job is a tuple of (source name, output name, bytes, metadata),
+    where metadata is as for batch.convert_file; if the bytes are
+    None, the source is a .ccj file to read.  The .puz file is left
+    in the result's output_data for the caller to write (it's None if
+    the conversion failed, or the puzzle duplicates one already
+    converted)."""
+    source_name, output_name, data, metadata = job
+    result = ConversionResult(source_name, output_name)
+    start = time.time()
+    stats = None
+    if metadata.get('stats'):
+        stats = ParseStats()
+    try:
+        if data is None:
+            with io.open(source_name, 'rb') as f:
+                data = f.read()
+        elif isinstance(data, Exception):
+            raise data
+        result.bytes_read = len(data)
+        parsed = parse_with_metadata(data, metadata, stats)
+        result.encodings_used = parsed.encodings_used
+        result.duplicate_of = claim_for_job(parsed, source_name, output_name,
+                                            metadata)
+        if result.duplicate_of is None:
+            result.output_data = parsed.to_puz_bytes(
+                checksums=metadata.get('checksums', False),
+                stats=stats)
+    except Exception as e:
+        result.set_error(e)
+        if isinstance(job[2], Exception):
+            # It was read before the job was made, so trying the job
+            # again wouldn't read it again:
+            result.transient = False
+        if result.duplicate_of is None:
+            release_for_job(source_name, metadata)
+    result.seconds = time.time() - start
+    if stats is not None:
+        result.stats = stats.to_dictionary()
+    return result
+
+class DirectoryWriter:
+    """A class for writing output files under a directory"""
+    def __init__(self, directory):
+        self.directory = directory
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, *name.split('/'))
+        makedirs_if_missing(os.path.dirname(path))
+        atomic_write(path, data)
+        return path
+
+    def close(self):
+        pass
+
+class ZipWriter:
+    """A class for writing output files into a new zip file
+
+    If the same name is written more than once (e.g. from different
+    input archives), a number is added to the later ones."""
+    def __init__(self, path):
+        self.path = path
+        self.archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        self.names = set()
+
+    def write(self, name, data):
+        base, extension = posixpath.splitext(name)
+        n = 1
+        while name in self.names:
+            n += 1
+            name = "{0}-{1}{2}".format(base, n, extension)
+        self.names.add(name)
+        self.archive.writestr(name, data)
+        return self.path + ':' + name
+
+    def close(self):
+        self.archive.close()
+
+def convert_inputs(paths, writer, metadata=None, processes=None,
+                   **scheduler_options):
+    """Convert the .ccj files in paths (and in archives among them)
+
+    The .puz files are passed to writer.write.  The conversions are
+    run by a scheduler.Scheduler with processes worker processes (by
+    default one per core), so scheduler_options can be its timeout,
+    memory_limit, retries and quarantine_directory, and only the
+    members being converted are held in memory.  Returns a list of
+    ConversionResult objects, in the order of the inputs."""
+    if metadata is None:
+        metadata = {}
+    scheduler = Scheduler(processes, function=convert_member,
+                          **scheduler_options)
+    jobs = (source + (metadata,)
+            for source in iterate_inputs(paths, read_files=False))
+    results = {}
+    for index, result in scheduler.results(jobs):
+        if result.output_data is not None:
+            try:
+                result.output_path = writer.write(result.output_path,
+                                                  result.output_data)
+            except EnvironmentError as e:
+                result.error = "{0}: {1}".format(e.__class__.__name__, e)
+                release_for_job(result.input_path, metadata)
+            result.output_data = None
+        results[index] = result
+    return [results[i] for i in range(len(results))]
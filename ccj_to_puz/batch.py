@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Convert whole directories of CCJ crosswords to .puz in one go
+
+This is the batch counterpart of the ccj-to-puz script: rather than
+reading one puzzle on standard input, it takes a list of directories
+or glob patterns, and writes a .puz file for each .ccj file it finds
+into an output directory.  The conversions are spread over a pool of
+worker processes, one per core by default, and at the end it reports
+the throughput and any files that couldn't be converted.  Each file
+gets a limited time (and optionally memory), and with --quarantine
+the files that fail are moved out of the way (see scheduler.py).
+With --fingerprints, puzzles already converted from another source
+(e.g. the same syndicated puzzle in another feed) are skipped (see
+fingerprint.py).
+
+Zip and tar files among the inputs are read without extracting them
+(see archive.py), and with --output-zip the .puz files are written
+into a zip file instead of a directory.  Their members get the same
+time and memory limits and retries as files, but a member that fails
+is left in its archive rather than quarantined."""
+
+from __future__ import print_function
+
+import errno
+import glob
+import io
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from optparse import OptionParser
+
+from ccj_to_puz.cache import DEFAULT_MAX_BYTES, get_cache
+from ccj_to_puz.ccj_parse import ParsedCCJ, ensure_sys_argv_is_decoded
+from ccj_to_puz.fingerprint import claim_for_job, release_for_job
+from ccj_to_puz.formats import SERIALIZERS, PreparedPuzzle, serializer_for
+from ccj_to_puz.fsutil import atomic_write
+from ccj_to_puz.stats import ParseStats
+
+def find_ccj_files(inputs):
+    """Expand a list of directories, globs and filenames to .ccj files
+
+    Directories are searched (non-recursively) for files ending in
+    .ccj; anything else is treated as a glob pattern.  The result has
+    no duplicates, and is in the order the inputs were given."""
+    result = []
+    seen = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            matches = sorted(os.path.join(pattern, x)
+                             for x in os.listdir(pattern)
+                             if x.lower().endswith('.ccj'))
+        else:
+            matches = sorted(glob.glob(pattern))
+        for path in matches:
+            if os.path.isfile(path) and path not in seen:
+                seen.add(path)
+                result.append(path)
+    return result
+
+def output_path_for(input_path, output_directory):
+    """Return the path of the .puz file to write for input_path"""
+    basename = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_directory, basename + '.puz')
+
+def parse_with_metadata(data, metadata, stats=None):
+    """Parse the CCJ file in data, returning a ParsedCCJ
+
+    metadata is a dictionary like the one described in convert_file;
+    if it has a 'cache_directory' the ConversionCache there is used."""
+    if metadata.get('cache_directory'):
+        cache = get_cache(metadata['cache_directory'],
+                          metadata.get('cache_max_bytes', DEFAULT_MAX_BYTES))
+        return cache.parse(data,
+                           metadata.get('title'),
+                           metadata.get('author'),
+                           metadata.get('puzzle_number'),
+                           metadata.get('copyright_message'),
+                           metadata.get('date_string'),
+                           stats=stats)
+    parsed = ParsedCCJ()
+    parsed.read_from_bytes(data,
+                           metadata.get('title'),
+                           metadata.get('author'),
+                           metadata.get('puzzle_number'),
+                           metadata.get('copyright_message'),
+                           metadata.get('date_string'),
+                           stats=stats)
+    return parsed
+
+class ConversionResult:
+    """A class for recording how the conversion of one file went
+
+    If it failed, error describes why, error_type is the name of the
+    exception's class, error_offset is the byte of the input where a
+    CCJParseError was found, and transient says whether the failure
+    was an I/O error that might not happen if it's tried again.  If
+    nothing was written because the puzzle had already been converted
+    from another source, duplicate_of is that source.  output_data is
+    the .puz file, for conversions whose output is written by the
+    parent process rather than the worker (see archive.py)."""
+    def __init__(self, input_path, output_path):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.error = None
+        self.error_type = None
+        self.error_offset = None
+        self.transient = False
+        self.attempts = 1
+        self.quarantined_path = None
+        self.duplicate_of = None
+        self.output_data = None
+        self.bytes_read = 0
+        self.seconds = 0.0
+        self.encodings_used = {}
+        self.stats = None
+
+    def succeeded(self):
+        return self.error is None
+
+    def set_error(self, e):
+        """Record the exception e as the reason the conversion failed"""
+        self.error = "{0}: {1}".format(e.__class__.__name__, e)
+        if not str(e):
+            self.error += "\n" + traceback.format_exc()
+        self.error_type = e.__class__.__name__
+        self.error_offset = getattr(e, 'offset', None)
+        # (A missing input isn't going to turn up by trying again.)
+        self.transient = isinstance(e, EnvironmentError) and \
+            e.errno != errno.ENOENT
+
+def convert_file(job):
+    """Convert one .ccj file to .puz, returning a ConversionResult
+
+    job is a tuple of (input_path, output_path, metadata), where
+    metadata is a dictionary that may have the keys 'title',
+    'author', 'puzzle_number', 'copyright_message' and
+    'date_string', and also 'checksums' to say whether to include
+    the AcrossLite checksums in the output, 'formats' for a list of
+    the output formats to write (see formats.py; by default just
+    'puz', and the others are written next to output_path with
+    their own extensions), 'stats' to say whether
+    to record a ParseStats (as a dictionary) in the result,
+    'cache_directory' and 'cache_max_bytes' to use a ConversionCache,
+    and 'fingerprint_index' and 'ignore_clues' to skip puzzles already
+    converted from other sources (see fingerprint.py).
+    This never raises an exception for a bad input file - the error
+    is recorded in the result instead - so that one bad file doesn't
+    stop the rest of a batch."""
+    input_path, output_path, metadata = job
+    result = ConversionResult(input_path, output_path)
+    start = time.time()
+    stats = None
+    if metadata.get('stats'):
+        stats = ParseStats()
+    try:
+        with io.open(input_path, 'rb') as f:
+            data = f.read()
+        result.bytes_read = len(data)
+        parsed = parse_with_metadata(data, metadata, stats)
+        result.encodings_used = parsed.encodings_used
+        result.duplicate_of = claim_for_job(parsed, input_path, output_path,
+                                            metadata)
+        if result.duplicate_of is None:
+            write_formats(parsed, output_path, metadata, stats)
+    except Exception as e:
+        result.set_error(e)
+        if result.duplicate_of is None:
+            release_for_job(input_path, metadata)
+    result.seconds = time.time() - start
+    if stats is not None:
+        result.stats = stats.to_dictionary()
+    return result
+
+def write_formats(parsed, output_path, metadata, stats=None):
+    """Write parsed in each of the formats in metadata next to output_path"""
+    prepared = PreparedPuzzle(parsed,
+                              checksums=metadata.get('checksums', False),
+                              stats=stats)
+    base = os.path.splitext(output_path)[0]
+    for name in metadata.get('formats') or ('puz',):
+        # The output is written atomically, so that a worker that's
+        # killed part way through never leaves half a file:
+        atomic_write(base + serializer_for(name).extension,
+                     prepared.serialize(name))
+
+def default_number_of_processes():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+def map_in_batches(function, jobs, processes=None, jobs_per_process=64,
+                   pool=None):
+    """Generate function(job) for each of the iterable jobs, in order
+
+    Like Pool.imap, this spreads the calls over processes worker
+    processes (by default one per core), but it only takes
+    jobs_per_process jobs per worker from jobs at a time, so that
+    jobs can be a generator that reads large amounts of data (which
+    Pool.imap would consume as fast as it could).  If you pass an
+    existing pool (of processes workers) it's used and left open."""
+    if processes is None:
+        processes = default_number_of_processes()
+    jobs = iter(jobs)
+    if processes <= 1:
+        for job in jobs:
+            yield function(job)
+        return
+    own_pool = pool is None
+    if own_pool:
+        pool = multiprocessing.Pool(processes)
+    try:
+        while True:
+            batch = list(itertools.islice(jobs, jobs_per_process * processes))
+            if not batch:
+                break
+            chunksize = max(1, len(batch) // (processes * 4))
+            for result in pool.map(function, batch, chunksize):
+                yield result
+    finally:
+        if own_pool:
+            pool.close()
+            pool.join()
+
+def report(results, elapsed, out=sys.stdout):
+    """Print a summary of a batch of conversions to out"""
+    failures = [r for r in results if not r.succeeded()]
+    duplicates = [r for r in results if r.duplicate_of is not None]
+    converted = len(results) - len(failures) - len(duplicates)
+    total_bytes = sum(r.bytes_read for r in results)
+    for r in failures:
+        print("FAILED {0}: {1}".format(r.input_path, r.error), file=out)
+        if r.quarantined_path:
+            print("  moved to " + r.quarantined_path, file=out)
+    # Count the puzzles that needed each text encoding:
+    puzzles_per_encoding = {}
+    for r in results:
+        for encoding in r.encodings_used:
+            puzzles_per_encoding[encoding] = \
+                puzzles_per_encoding.get(encoding, 0) + 1
+    if puzzles_per_encoding:
+        print("Text encodings needed: " +
+              ", ".join("{0} in {1} puzzle(s)".format(k, v) for k, v in
+                        sorted(puzzles_per_encoding.items())), file=out)
+    message = "Converted {0} of {1} files in {2:.2f}s"
+    print(message.format(converted, len(results), elapsed), file=out)
+    if duplicates:
+        message = "Skipped {0} files that duplicate puzzles already converted"
+        print(message.format(len(duplicates)), file=out)
+    if elapsed > 0:
+        message = "Throughput: {0:.1f} files/s, {1:.1f} KiB/s"
+        print(message.format(len(results) / elapsed,
+                             total_bytes / 1024.0 / elapsed), file=out)
+
+def main():
+    parser = OptionParser(usage="%prog [options] DIRECTORY-OR-GLOB...")
+    parser.add_option('-o', '--output-directory', dest='output_directory',
+                      help="write the .puz files to this directory")
+    parser.add_option('-z', '--output-zip', dest='output_zip',
+                      help="write the .puz files into this zip file")
+    parser.add_option('-j', '--jobs', dest='jobs', type='int',
+                      help="number of worker processes (default: one per core)")
+    parser.add_option('-k', '--checksums', dest='checksums',
+                      action="store_true", default=False,
+                      help="include the AcrossLite checksums in the output")
+    parser.add_option('-f', '--formats', dest='formats', default='puz',
+                      help="comma-separated output formats, from: " +
+                      ", ".join(sorted(SERIALIZERS)) + " (default: %default)")
+    parser.add_option('-s', '--stats', dest='stats', action="store_true",
+                      default=False,
+                      help="print timings and counters as JSON on stderr")
+    parser.add_option('--timeout', dest='timeout', type='float',
+                      default=60.0, metavar='SECONDS',
+                      help="give up on any file that takes longer than this "
+                      "(default: %default; 0 for no limit)")
+    parser.add_option('--memory-limit', dest='memory_limit', type='int',
+                      metavar='MB',
+                      help="limit each worker process to this much memory")
+    parser.add_option('--retries', dest='retries', type='int', default=2,
+                      help="number of times to retry a file after an I/O "
+                      "error (default: %default)")
+    parser.add_option('--quarantine', dest='quarantine_directory',
+                      metavar='DIR',
+                      help="move inputs that fail to convert into DIR")
+    parser.add_option('--cache-dir', dest='cache_directory', metavar='DIR',
+                      help="reuse parsed crosswords cached in DIR")
+    parser.add_option('--cache-size', dest='cache_size', type='int',
+                      default=256, metavar='MB',
+                      help="maximum size of the cache in megabytes")
+    parser.add_option('--fingerprints', dest='fingerprint_index',
+                      metavar='FILE',
+                      help="skip puzzles already converted from other "
+                      "sources, as recorded in this index")
+    parser.add_option('--ignore-clues', dest='ignore_clues',
+                      action="store_true", default=False,
+                      help="with --fingerprints, count puzzles with the same "
+                      "grid as duplicates even if their clues differ")
+    parser.add_option('-t', '--title', dest='title',
+                      help="specify the crossword title")
+    parser.add_option('-a', '--author', dest='author',
+                      help="specify the crossword author or setter")
+    parser.add_option('-c', '--copyright', dest='copyright_message',
+                      help="specify the copyright message")
+
+    ensure_sys_argv_is_decoded()
+    (options, args) = parser.parse_args()
+
+    if not args:
+        parser.error("You must specify at least one directory or glob")
+    if not (options.output_directory or options.output_zip):
+        parser.error("You must specify an output directory with -o "
+                     "or a zip file with -z")
+
+    formats = options.formats.split(',')
+    for name in formats:
+        if name not in SERIALIZERS:
+            parser.error("Unknown output format: " + name)
+
+    if options.output_directory and \
+            not os.path.isdir(options.output_directory):
+        os.makedirs(options.output_directory)
+
+    input_paths = find_ccj_files(args)
+    if not input_paths:
+        raise Exception("No .ccj files found in: " + ", ".join(args))
+
+    metadata = {'title': options.title,
+                'author': options.author,
+                'copyright_message': options.copyright_message,
+                'checksums': options.checksums,
+                'formats': formats,
+                'stats': options.stats,
+                'cache_directory': options.cache_directory,
+                'cache_max_bytes': options.cache_size * 1024 * 1024,
+                'fingerprint_index': options.fingerprint_index,
+                'ignore_clues': options.ignore_clues}
+
+    memory_limit = None
+    if options.memory_limit:
+        memory_limit = options.memory_limit * 1024 * 1024
+    scheduler_options = {'timeout': options.timeout or None,
+                         'memory_limit': memory_limit,
+                         'retries': options.retries,
+                         'quarantine_directory': options.quarantine_directory}
+
+    start = time.time()
+    from ccj_to_puz.archive import DirectoryWriter, ZipWriter, \
+        convert_inputs, is_archive
+    if options.output_zip or any(is_archive(p) for p in input_paths):
+        if formats != ['puz']:
+            parser.error("Only .puz files can be written from archives "
+                         "or into a zip file")
+        if options.output_zip:
+            writer = ZipWriter(options.output_zip)
+        else:
+            writer = DirectoryWriter(options.output_directory)
+        try:
+            results = convert_inputs(input_paths,
+                                     writer,
+                                     metadata,
+                                     options.jobs,
+                                     **scheduler_options)
+        finally:
+            writer.close()
+    else:
+        from ccj_to_puz.scheduler import Scheduler
+        scheduler = Scheduler(options.jobs, **scheduler_options)
+        results = scheduler.run(
+            (p, output_path_for(p, options.output_directory), metadata)
+            for p in input_paths)
+    report(results, time.time() - start)
+
+    if options.stats:
+        stats = ParseStats()
+        for r in results:
+            if r.stats:
+                stats.merge(r.stats)
+        print(stats.to_json(), file=sys.stderr)
+
+    if any(not r.succeeded() for r in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Time each stage of converting CCJ crosswords to .puz
+
+This generates a corpus of synthetic crosswords (see synthetic.py)
+and times these stages separately over the whole corpus:
+
+  parse   - ParsedCCJ.read_from_ccj
+  number  - Grid.set_numbers
+  decode  - decode_bytes on every string in the files
+  write   - ParsedCCJ.write_to_puz_file
+
+Each stage is run several times and the fastest run is reported, as
+the time per puzzle and the throughput in puzzles and bytes per
+second.  Use --json to get the results in a form that's easy to
+compare between releases.
+
+It also times importing the module behind the ccj-to-puz script in a
+new interpreter (over and above the interpreter's own start-up),
+since scripts that convert one puzzle at a time spend much of their
+time on that, and exits with status 1 if that's over --import-budget
+milliseconds.  Any of DEFERRED_MODULES that the import pulled in are
+listed, since they're the usual culprits."""
+
+from __future__ import print_function
+
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+from ccj_to_puz.ccj_parse import ParsedCCJ, decode_bytes, \
+    use_numpy_by_default
+from ccj_to_puz.synthetic import ENCODING_EXTRAS, make_corpus
+
+# The module that the ccj-to-puz script imports:
+ENTRY_POINT_MODULE = 'ccj_to_puz.ccj_parse'
+DEFAULT_IMPORT_BUDGET_MS = 30.0
+# Modules that are slow to import and that ccj-to-puz only needs for
+# some options, if at all:
+DEFERRED_MODULES = ('json', 'logging', 'multiprocessing', 'numpy',
+                    'optparse', 'sqlite3')
+
+class StageResult:
+    """A class for the timing of one stage of the conversion"""
+    def __init__(self, name, seconds, items, number_of_bytes):
+        self.name = name
+        self.seconds = seconds
+        self.items = items
+        self.number_of_bytes = number_of_bytes
+
+    def to_dictionary(self):
+        result = {'stage': self.name,
+                  'seconds': self.seconds,
+                  'items': self.items,
+                  'bytes': self.number_of_bytes}
+        if self.seconds > 0:
+            result['items_per_second'] = self.items / self.seconds
+            result['megabytes_per_second'] = \
+                self.number_of_bytes / 1e6 / self.seconds
+        return result
+
+    def to_line(self):
+        if self.seconds <= 0:
+            return "{0:8s} too fast to measure".format(self.name)
+        message = "{0:8s} {1:9.3f} ms {2:10.1f} us/item " + \
+            "{3:10.1f} items/s {4:8.2f} MB/s"
+        return message.format(self.name,
+                              self.seconds * 1000,
+                              self.seconds * 1e6 / self.items,
+                              self.items / self.seconds,
+                              self.number_of_bytes / 1e6 / self.seconds)
+
+def best_time(function, repeat):
+    """Return the fastest of repeat calls to function, in seconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def parse_corpus(corpus):
+    result = []
+    for puzzle in corpus:
+        parsed = ParsedCCJ()
+        parsed.read_from_ccj(io.BytesIO(puzzle.data),
+                             None, None, None, u"© Benchmark", None)
+        result.append(parsed)
+    return result
+
+def time_import(module, repeat=5):
+    """Time importing module in a new interpreter
+
+    Returns the fastest of repeat imports in seconds, less the fastest
+    start-up of an interpreter that imports nothing, and a list of
+    the DEFERRED_MODULES that the import brought in."""
+    env = dict(os.environ)
+    package_parent = os.path.dirname(os.path.dirname(os.path.abspath(
+        __file__)))
+    env['PYTHONPATH'] = os.pathsep.join(
+        [package_parent] + [p for p in [env.get('PYTHONPATH')] if p])
+    check = "import sys\n{0}\nprint(' '.join(m for m in {1!r} " + \
+        "if m in sys.modules))"
+    def run(statement):
+        start = time.time()
+        output = subprocess.check_output(
+            [sys.executable, '-c', check.format(statement, DEFERRED_MODULES)],
+            env=env)
+        return time.time() - start, output.decode('ascii').split()
+    # (The first run may write the .pyc files.)
+    run("import " + module)
+    bare = min(run("pass")[0] for _ in range(repeat))
+    runs = [run("import " + module) for _ in range(repeat)]
+    return max(0.0, min(t for t, _ in runs) - bare), runs[0][1]
+
+def run_benchmarks(corpus, repeat=3):
+    """Time each stage over corpus, returning a list of StageResult"""
+    results = []
+    input_bytes = sum(len(p.data) for p in corpus)
+
+    seconds = best_time(lambda: parse_corpus(corpus), repeat)
+    results.append(StageResult('parse', seconds, len(corpus), input_bytes))
+
+    parsed_corpus = parse_corpus(corpus)
+
+    def number():
+        for parsed in parsed_corpus:
+            parsed.grid.set_numbers()
+    seconds = best_time(number, repeat)
+    results.append(StageResult('number',
+                               seconds,
+                               len(parsed_corpus),
+                               sum(p.width * p.height for p in parsed_corpus)))
+
+    strings = [s for p in corpus for s in p.strings]
+    def decode():
+        for s in strings:
+            decode_bytes(s)
+    seconds = best_time(decode, repeat)
+    results.append(StageResult('decode',
+                               seconds,
+                               len(strings),
+                               sum(len(s) for s in strings)))
+
+    directory = tempfile.mkdtemp()
+    try:
+        filenames = [os.path.join(directory, "{0}.puz".format(k))
+                     for k in range(len(parsed_corpus))]
+        def write():
+            for parsed, filename in zip(parsed_corpus, filenames):
+                parsed.write_to_puz_file(filename)
+        seconds = best_time(write, repeat)
+        output_bytes = sum(os.path.getsize(f) for f in filenames)
+    finally:
+        shutil.rmtree(directory)
+    results.append(StageResult('write',
+                               seconds,
+                               len(parsed_corpus),
+                               output_bytes))
+
+    return results
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option('-n', '--count', dest='count', type='int', default=200,
+                      help="number of crosswords in the corpus")
+    parser.add_option('-W', '--width', dest='width', type='int', default=15,
+                      help="width of the grids")
+    parser.add_option('-H', '--height', dest='height', type='int',
+                      default=15, help="height of the grids")
+    parser.add_option('-l', '--linked-clues', dest='linked_clues',
+                      type='int', default=2,
+                      help="number of clues that cover several entries")
+    parser.add_option('-e', '--encoding', dest='encoding', default='utf_8',
+                      help="encoding of the clue text: " +
+                      ", ".join(sorted(ENCODING_EXTRAS)))
+    parser.add_option('-r', '--repeat', dest='repeat', type='int', default=3,
+                      help="number of times to run each stage")
+    parser.add_option('-j', '--json', dest='json', action="store_true",
+                      default=False, help="output the results as JSON")
+    parser.add_option('--numpy', dest='numpy', action="store_true",
+                      default=False,
+                      help="number the grids with NumPy")
+    parser.add_option('--import-budget', dest='import_budget', type='float',
+                      default=DEFAULT_IMPORT_BUDGET_MS, metavar='MS',
+                      help="fail if importing " + ENTRY_POINT_MODULE +
+                      " takes longer than this (default: %default; 0 for "
+                      "no limit)")
+    parser.add_option('--import-only', dest='import_only',
+                      action="store_true", default=False,
+                      help="only time the import, not the stages of "
+                      "conversion")
+
+    (options, args) = parser.parse_args()
+
+    if len(args) > 0:
+        raise Exception("Unknown arguments: " + "\n".join(args))
+
+    if options.numpy:
+        use_numpy_by_default(parser)
+
+    import_seconds, deferred_imported = time_import(
+        ENTRY_POINT_MODULE, max(5, options.repeat))
+    over_budget = options.import_budget and \
+        import_seconds * 1000 > options.import_budget
+    if options.import_only:
+        options.count = 0
+
+    results = []
+    if options.count > 0:
+        corpus = make_corpus(options.count,
+                             width=options.width,
+                             height=options.height,
+                             linked_clues=options.linked_clues,
+                             encoding=options.encoding)
+        results = run_benchmarks(corpus, options.repeat)
+
+    if options.json:
+        settings = dict((k, getattr(options, k)) for k in
+                        ('count', 'width', 'height', 'linked_clues',
+                         'encoding', 'repeat'))
+        print(json.dumps({'settings': settings,
+                          'python': sys.version.split()[0],
+                          'stages': [r.to_dictionary() for r in results],
+                          'import': {'module': ENTRY_POINT_MODULE,
+                                     'seconds': import_seconds,
+                                     'budget_ms': options.import_budget,
+                                     'deferred_modules_imported':
+                                     deferred_imported}},
+                         indent=2, sort_keys=True))
+    else:
+        if results:
+            message = "{0} crosswords of {1}x{2}, best of {3} runs:"
+            print(message.format(options.count, options.width,
+                                 options.height, options.repeat))
+            for r in results:
+                print(r.to_line())
+        message = "{0:8s} {1:9.3f} ms to import {2}"
+        print(message.format('import', import_seconds * 1000,
+                             ENTRY_POINT_MODULE))
+        if deferred_imported:
+            print("         (which imported " +
+                  ", ".join(deferred_imported) + ")")
+    if over_budget:
+        message = "Importing {0} took {1:.1f} ms, over the budget of {2} ms"
+        print(message.format(ENTRY_POINT_MODULE, import_seconds * 1000,
+                             options.import_budget), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
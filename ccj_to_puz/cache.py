@@ -0,0 +1,272 @@
+"""An on-disk cache of parsed crosswords, keyed by the CCJ file's contents
+
+When the same .ccj files are converted again (e.g. because a feed was
+fetched again, or only the title or date given on the command line
+has changed) there's no need to parse them again.  A ConversionCache
+stores the result of ParsedCCJ.to_record for each file, compressed,
+under the SHA-256 of the file's bytes; the title, author and so on
+aren't part of it, so a hit only needs set_metadata and the .puz
+output to be redone.
+
+Each entry is ENTRY_HEADER (a magic string, the record version and
+the length of what follows it as JSON), then JSON with the clues and
+the other small values, then the lights, letters and hint digits of
+the grid as raw bytes, all compressed with zlib.  Reading one back
+only decodes JSON and slices bytes, so anyone who can write to the
+cache directory can at worst make conversions come out wrong, not
+run code in the converter.
+
+The cache is a directory that can be shared by several processes:
+entries are written to a temporary file and renamed into place, a
+missing or corrupt entry is just treated as a miss, and the least
+recently used entries are removed when the cache grows beyond its
+size limit.  (Using an entry updates its modification time, which is
+what's used to decide how recently it was used.)"""
+
+import errno
+import hashlib
+import json
+import os
+import struct
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from ccj_to_puz.ccj_parse import ParsedCCJ, RECORD_VERSION
+from ccj_to_puz.fsutil import atomic_write, makedirs_if_missing, \
+    remove_if_present
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+ENTRY_SUFFIX = '.ccjcache'
+# When evicting, remove entries until the cache is this fraction of
+# the limit, so that we don't have to evict again straight away:
+EVICTION_TARGET = 0.9
+# Other processes may be adding entries too, so each process
+# rescans the directory for the real size after this many puts:
+PUTS_BETWEEN_SCANS = 32
+ENTRY_MAGIC = b'CCJC'
+# The magic, the record version and the length of the JSON:
+ENTRY_HEADER = struct.Struct('<4sHI')
+
+def encode_entry(record):
+    """Return the bytes of a cache entry for the result of to_record"""
+    (version, width, height, lights, letters, hint_digits, encodings_used,
+     across_record, down_record) = record
+    def list_json(r):
+        label, across, unknown_bytes, number_of_clues, clue_records = r
+        return {'label': label,
+                'across': across,
+                'unknown_bytes': list(bytearray(unknown_bytes)),
+                'number_of_clues': number_of_clues,
+                'clues': clue_records}
+    hint_digits = bytes(hint_digits) if hint_digits is not None else None
+    text = json.dumps({'width': width,
+                       'height': height,
+                       'hint_digits_length': None if hint_digits is None
+                       else len(hint_digits),
+                       'encodings_used': encodings_used,
+                       'across': list_json(across_record),
+                       'down': list_json(down_record)},
+                      sort_keys=True).encode('ascii')
+    return zlib.compress(ENTRY_HEADER.pack(ENTRY_MAGIC, version, len(text)) +
+                         text + bytes(lights) + bytes(letters) +
+                         (hint_digits or b''))
+
+def decode_entry(serialized):
+    """Return the record (as from to_record) in a cache entry
+
+    Raises ValueError if the entry isn't laid out as it should be."""
+    data = zlib.decompress(serialized)
+    if len(data) < ENTRY_HEADER.size:
+        raise ValueError("The cache entry is too short")
+    magic, version, length = ENTRY_HEADER.unpack_from(data, 0)
+    if magic != ENTRY_MAGIC:
+        raise ValueError("The cache entry has the wrong magic string")
+    i = ENTRY_HEADER.size
+    fields = json.loads(data[i:(i + length)].decode('ascii'))
+    i += length
+    size = fields['width'] * fields['height']
+    hint_length = fields['hint_digits_length']
+    if len(data) != i + 2 * size + (hint_length or 0):
+        raise ValueError("The cache entry has the wrong length")
+    lights = data[i:(i + size)]
+    letters = data[(i + size):(i + 2 * size)]
+    hint_digits = None
+    if hint_length is not None:
+        hint_digits = data[(i + 2 * size):]
+    def list_record(d):
+        return (d['label'],
+                d['across'],
+                bytes(bytearray(d['unknown_bytes'])),
+                d['number_of_clues'],
+                [(number_string,
+                  text,
+                  [tuple(x) for x in start_coordinates],
+                  [tuple(x) for x in numbers])
+                 for number_string, text, start_coordinates, numbers in
+                 d['clues']])
+    return (version,
+            fields['width'],
+            fields['height'],
+            lights,
+            letters,
+            hint_digits,
+            dict(fields['encodings_used']),
+            list_record(fields['across']),
+            list_record(fields['down']))
+
+class ConversionCache(object):
+    """A size-bounded cache of parsed crosswords in directory"""
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.approximate_size = None
+        self.puts_since_scan = 0
+        makedirs_if_missing(directory)
+
+    def key_for(self, data):
+        """Return the cache key for the CCJ file whose contents are data"""
+        h = hashlib.sha256()
+        h.update(bytes(data))
+        # Include the record version, so that old entries are never
+        # mistaken for new ones:
+        h.update(str(RECORD_VERSION).encode('ascii'))
+        return h.hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key[:2], key + ENTRY_SUFFIX)
+
+    def get(self, data):
+        """Return a ParsedCCJ for data from the cache, or None
+
+        You need to call set_metadata on the result before writing it
+        out."""
+        path = self.path_for(self.key_for(data))
+        try:
+            with open(path, 'rb') as f:
+                serialized = f.read()
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        try:
+            parsed = ParsedCCJ.from_record(decode_entry(serialized))
+        except Exception:
+            # Someone else may have been writing it in a way that
+            # isn't atomic, or it's from an incompatible version:
+            remove_if_present(path)
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return parsed
+
+    def put(self, data, parsed):
+        """Store the parsed crossword for the CCJ file data"""
+        path = self.path_for(self.key_for(data))
+        serialized = encode_entry(parsed.to_record())
+        makedirs_if_missing(os.path.dirname(path))
+        atomic_write(path, serialized)
+        self.puts_since_scan += 1
+        if self.approximate_size is None or \
+                self.puts_since_scan >= PUTS_BETWEEN_SCANS:
+            self.approximate_size = self.total_size()
+            self.puts_since_scan = 0
+        else:
+            self.approximate_size += len(serialized)
+        if self.approximate_size > self.max_bytes:
+            self.evict()
+
+    def parse(self,
+              data,
+              title,
+              author,
+              puzzle_number,
+              copyright_message,
+              date_string,
+              verbose=False,
+              stats=None):
+        """Return a ParsedCCJ for data, using the cache if possible
+
+        The arguments are the same as ParsedCCJ.read_from_bytes."""
+        parsed = self.get(data)
+        if parsed is None:
+            if stats is not None:
+                stats.count('cache_misses')
+            parsed = ParsedCCJ()
+            parsed.read_from_bytes(data,
+                                   title,
+                                   author,
+                                   puzzle_number,
+                                   copyright_message,
+                                   date_string,
+                                   verbose,
+                                   stats)
+            self.put(data, parsed)
+        else:
+            if stats is not None:
+                stats.count('cache_hits')
+            parsed.set_metadata(title,
+                                author,
+                                puzzle_number,
+                                copyright_message,
+                                date_string)
+        return parsed
+
+    def entries(self):
+        """Return a list of (modification time, size, path) of entries"""
+        result = []
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if not filename.endswith(ENTRY_SUFFIX):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                result.append((st.st_mtime, st.st_size, path))
+        return result
+
+    def total_size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Remove the least recently used entries until under the limit
+
+        Only one process evicts at a time; if another one is already
+        doing it, this just returns."""
+        lock_file = open(os.path.join(self.directory, '.lock'), 'a')
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except IOError:
+                    return
+            entries = self.entries()
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * EVICTION_TARGET
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                remove_if_present(path)
+                total -= size
+            self.approximate_size = total
+            self.puts_since_scan = 0
+        finally:
+            lock_file.close()
+
+_caches = {}
+
+def get_cache(directory, max_bytes=DEFAULT_MAX_BYTES):
+    """Return a ConversionCache for directory shared within this process"""
+    key = (directory, max_bytes)
+    if key not in _caches:
+        _caches[key] = ConversionCache(directory, max_bytes)
+    return _caches[key]
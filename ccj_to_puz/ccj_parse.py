@@ -21,21 +21,65 @@ example CCJ files."""
 
 from __future__ import print_function
 
-import copy
 import sys
 import re
-from optparse import OptionParser
 import io
 import struct
-import unicodedata
 
-from commonccj import Cell, Grid, clue_number_string_to_duple
+from ccj_to_puz import tracing
+from ccj_to_puz.commonccj import CCJParseError, CompactGrid
+from ccj_to_puz.puzchecksums import PuzChecksums
+from ccj_to_puz.resolver import resolver_for
+from ccj_to_puz.stats import ParseStats
+
+tracer = tracing.get_tracer('ccj_parse')
+
+def tracing_enabled(verbose):
+    """Return True if diagnostics should be output by this module
+
+    The verbose arguments of the parsing functions are kept as a
+    shortcut for switching on tracing of this module."""
+    if verbose:
+        tracing.enable(['ccj_parse', 'commonccj', 'resolver'])
+    return tracer.enabled()
+
+# The bytes that seem to be used to turn formatting on and off, which
+# are just removed before decoding:
+FORMATTING_BYTES = b'\x01\x02\x03'
+NON_ASCII_RE = re.compile(b'[\x80-\xff]')
+WHITESPACE_RE = re.compile(r'\s+')
+# This matches exactly the characters in the Unicode category Cc:
+CONTROL_CHARACTER_RE = re.compile(u'[\x00-\x1f\x7f-\x9f]')
 
 def contains_control_characters(string):
     """Returns True if any control character is in s, otherwise False"""
-    return any(unicodedata.category(c) == 'Cc' for c in string)
+    return CONTROL_CHARACTER_RE.search(string) is not None
+
+def decode_bytes_with_encoding(bytes_to_decode):
+    """Decode bytes as decode_bytes does, returning (string, encoding)
+
+    encoding is the name of the codec that worked, or 'ascii' if
+    there were no bytes above 0x7f, in which case no other codecs
+    are tried, since they would all give the same result."""
+    bytes_to_decode = bytes(bytes_to_decode).translate(None, FORMATTING_BYTES)
+
+    if not NON_ASCII_RE.search(bytes_to_decode):
+        s = WHITESPACE_RE.sub(' ', bytes_to_decode.decode('ascii'))
+        if not contains_control_characters(s):
+            return (s, 'ascii')
+        raise CCJParseError("Couldn't guess the character set.")
+
+    for encoding in ('utf_8', 'latin_1', 'cp1252'):
+        try:
+            s = bytes_to_decode.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+        s = WHITESPACE_RE.sub(' ', s)
+        if not contains_control_characters(s):
+            return (s, encoding)
+    raise CCJParseError("Couldn't guess the character set.")
 
-def decode_bytes(bytes_to_decode):
+def decode_bytes(bytes_to_decode, encodings=None):
     """Try to decode bytes (in an unknown encoding) into a string
 
     I'm not sure about character set issues here, but it seems that
@@ -50,39 +94,80 @@ def decode_bytes(bytes_to_decode):
 
       55 6e 77 69 73 65 02 72 01 3f 01 01 20 28 39 29
       U  n  w  i  s  e     r     ?           (  9  )
-    """
-    bytes_to_decode = bytearray(c for c in bytearray(bytes_to_decode)
-                                if c not in (0x01, 0x02, 0x03))
-    if sys.version_info >= (3, 0):
-        bytes_to_decode = bytes(bytes_to_decode)
 
-    for encoding in ('utf_8', 'latin_1', 'cp1252'):
-        try:
-            s = bytes_to_decode.decode(encoding)
-        except UnicodeDecodeError:
-            continue
-        s = re.sub(r'\s+', ' ', s)
-        if not contains_control_characters(s):
-            return s
-    raise Exception("Couldn't guess the character set.")
+    If encodings is a dictionary, the count for the name of the
+    encoding that was used is incremented in it.
+    """
+    s, encoding = decode_bytes_with_encoding(bytes_to_decode)
+    if encodings is not None:
+        encodings[encoding] = encodings.get(encoding, 0) + 1
+    return s
 
-def byte_at(data, i):
-    """Return integer value of the byte at index i of data
+def byte_view(data):
+    """Return a view of data that can be indexed to get integers
 
-    This is designed to work on a str (in Python 2) or a bytes (in
-    Python 3)"""
-    if isinstance(data, str):
-        return ord(data[i])
+    On Python 3 this is a memoryview, so slicing it doesn't copy
+    anything; Python 2's memoryview returns a str when indexed, so
+    there we have to fall back to a bytearray."""
+    if sys.version_info >= (3, 0):
+        return memoryview(data)
     else:
-        return int(data[i])
-
-def read_string(data, start_index):
-    """Decode a length-prefixed string from start_index in data"""
-    length = byte_at(data, start_index)
-    bytes_for_string = data[(start_index + 1):(start_index + length + 1)]
-    s = decode_bytes(bytes_for_string)
-    return (s, start_index + length + 1)
-
+        return bytearray(data)
+
+# Precompiled unpackers and patterns for the parts of the file that
+# have a fixed layout:
+DIMENSIONS = struct.Struct('BB')
+BLOCK_OF_FOUR = struct.Struct('<I')
+SKIPPABLE_BLOCKS_OF_FOUR = frozenset(
+    BLOCK_OF_FOUR.unpack(bytes(bytearray(l)))[0]
+    for l in ([0x00, 0xff, 0xff, 0xff],
+              [0x00, 0x00, 0xff, 0xff],
+              [0x00, 0x00, 0x00, 0x00]))
+GRID_START_RE = re.compile(b'[?#]')
+LIGHT_RE = re.compile(b'[?M]')
+NOT_GRID_RE = re.compile(b'[^?M#]')
+
+# Translation tables that turn the block grid into the buffers of a
+# CompactGrid, mapping '?' and 'M' to a light and '#' to a block:
+BLOCKS_TO_LIGHTS = bytes(bytearray(1 if c in (0x3f, 0x4d) else 0
+                                   for c in range(256)))
+BLOCKS_TO_LETTERS = bytes(bytearray(0x2b if c in (0x3f, 0x4d) else 0x20
+                                    for c in range(256)))
+
+# A translation table that turns each byte of the grid of unknown
+# purpose into the character we display for it: a space for 0,
+# otherwise the last decimal digit of the value.
+HINT_TRANSLATION = bytes(bytearray([0x20] + [0x30 + (n % 10)
+                                             for n in range(1, 256)]))
+
+def ensure_available(data, start_index, length, what):
+    """Raise a CCJParseError unless data has length bytes from start_index"""
+    if start_index + length > len(data):
+        raise CCJParseError("The file ended in the middle of " + what,
+                            start_index)
+
+def read_string(data, start_index, encodings=None):
+    """Decode a length-prefixed string from start_index in data
+
+    data should be as returned by byte_view().  encodings is passed
+    on to decode_bytes."""
+    end = skip_string(data, start_index)
+    bytes_for_string = data[(start_index + 1):end]
+    try:
+        s = decode_bytes(bytes_for_string, encodings)
+    except CCJParseError as e:
+        raise e.at(start_index)
+    return (s, end)
+
+
+def skip_string(data, start_index):
+    """Return the index just after the length-prefixed string at start_index"""
+    ensure_available(data, start_index, 1, "a string")
+    end = start_index + data[start_index] + 1
+    if end > len(data):
+        raise CCJParseError("The file ended in the middle of a string",
+                            start_index)
+    return end
 
 def skippable_block_of_four(data, start_index):
     """Detect if the 4 bytes at start_index in data are ignorable
@@ -90,11 +175,10 @@ def skippable_block_of_four(data, start_index):
     There sometimes seems to be a succession of bytes here in groups
     of repeated groups of four, next - this function tests for the
     patterns I've seen."""
-    block = bytearray(data[start_index:start_index + 4])
-    skippable_blocks = [[0x00, 0xff, 0xff, 0xff],
-                        [0x00, 0x00, 0xff, 0xff],
-                        [0x00, 0x00, 0x00, 0x00]]
-    return block in (bytearray(l) for l in skippable_blocks)
+    if start_index + 4 > len(data):
+        return False
+    block = BLOCK_OF_FOUR.unpack_from(data, start_index)[0]
+    return block in SKIPPABLE_BLOCKS_OF_FOUR
 
 def reduce_coordinate(x):
     """Coordinates sometimes seem to have 80 added to them"""
@@ -104,32 +188,44 @@ def reduce_coordinate(x):
         return x
 
 def read_clue_start_coordinates(data, start_index):
-    """Extract the start coordinates for an answer"""
+    """Extract the start coordinates for an answer
+
+    data should be as returned by byte_view()."""
     # My assumption is that if the first byte is >= 0x80 then it's a
     # list of coordinates terminated by a NUL, otherwise it's just two
     # bytes with the coordinate:
     start_coordinates = []
-    if byte_at(data, start_index) >= 0x80:
+    ensure_available(data, start_index, 2, "the start of a clue")
+    if data[start_index] >= 0x80:
         i = start_index
-        while byte_at(data, i) != 0:
-            x = reduce_coordinate(byte_at(data, i))
-            y = reduce_coordinate(byte_at(data, i + 1))
-            start_coordinates.append((x, y))
+        while data[i] != 0:
+            ensure_available(data, i, 3, "the start of a clue")
+            x, y = DIMENSIONS.unpack_from(data, i)
+            start_coordinates.append((reduce_coordinate(x),
+                                      reduce_coordinate(y)))
             i += 2
         return (start_coordinates, i + 1)
     else:
-        x = reduce_coordinate(byte_at(data, start_index))
-        y = reduce_coordinate(byte_at(data, start_index + 1))
-        start_coordinates.append((x, y))
+        x, y = DIMENSIONS.unpack_from(data, start_index)
+        start_coordinates.append((reduce_coordinate(x),
+                                  reduce_coordinate(y)))
         return (start_coordinates, start_index + 2)
 
-def parse_list_of_clues(data, start_index, grid, verbose=False):
+def parse_list_of_clues(data, start_index, grid, verbose=False,
+                        encodings=None):
+    """Parse a list of across or down clues from start_index in data
+
+    data should be as returned by byte_view().  Returns a tuple of
+    the ListOfClues and the index just after the list.  encodings is
+    passed on to decode_bytes.  If verbose is True, tracing is
+    switched on for this module (see tracing.py)."""
+    verbose = tracing_enabled(verbose)
     result = ListOfClues()
     i = start_index
     # Read the label for this list of clues:
-    result.label, i = read_string(data, i)
+    result.label, i = read_string(data, i, encodings)
     if verbose:
-        print("clue set label is:", result.label)
+        tracer.debug("clue set label is: {0}", result.label)
     result.across = None
     if re.search(r'(?ims)across', result.label):
         result.across = True
@@ -137,49 +233,186 @@ def parse_list_of_clues(data, start_index, grid, verbose=False):
         result.across = False
     else:
         message = "Couldn't find either 'across' or 'down' in label: '{0}'"
-        raise Exception(message.format(result.label))
+        raise CCJParseError(message.format(result.label), start_index)
 
     # Skip some bytes:
-    result.unknown_bytes = data[i:(i + 3)]
+    ensure_available(data, i, 4, "the header of a list of clues")
+    result.unknown_bytes = bytes(data[i:(i + 3)])
     i += 3
     if verbose:
-        print("  Before list of clues, got these unknown bytes:")
+        tracer.debug("  Before list of clues, got these unknown bytes:")
         for b in result.unknown_bytes:
-            print("    " + str(b))
-    result.number_of_clues = byte_at(data, i)
+            tracer.debug("    {0}", b)
+    result.number_of_clues = data[i]
     if verbose:
-        print("number of clues is: " + str(result.number_of_clues))
+        tracer.debug("number of clues is: {0}", result.number_of_clues)
     i += 1
     clues_found = 0
     while True:
         if verbose:
-            print("--------------------------")
+            tracer.debug("--------------------------")
         clue = ParsedClue()
         clue.across = result.across
         clue.start_coordinates, i = read_clue_start_coordinates(data, i)
         if verbose:
             for c in clue.start_coordinates:
-                print("A start at x: " + str(c[0]) + ", y: " + str(c[1]))
-        s, i = read_string(data, i)
-        clue.set_number(s, grid)
+                tracer.debug("A start at x: {0}, y: {1}", c[0], c[1])
+        number_start = i
+        s, i = read_string(data, i, encodings)
+        try:
+            clue.set_number(s, grid)
+        except CCJParseError as e:
+            raise e.at(number_start)
         if verbose:
-            print("clue number: " + clue.number_string)
-            print("all clue numbers:",
-                  ", ".join(str(x[0]) + (x[1] and "A" or "D")
-                            for x in clue.all_clue_numbers))
+            tracer.debug("clue number: {0}", clue.number_string)
+            tracer.debug("all clue numbers: {0}",
+                         ", ".join(str(x[0]) + (x[1] and "A" or "D")
+                                   for x in clue.all_clue_numbers))
         # Skip a NUL:
-        if byte_at(data, i) != 0:
-            raise Exception("After clue number we expect a NUL to skip over")
+        ensure_available(data, i, 1, "a clue")
+        if data[i] != 0:
+            raise CCJParseError("After clue number we expect a NUL to skip "
+                                "over", i)
         i += 1
-        clue.text_including_enumeration, i = read_string(data, i)
+        clue.text_including_enumeration, i = read_string(data, i,
+                                                         encodings)
         if verbose:
-            print("clue text:", clue.text_including_enumeration)
+            tracer.debug("clue text: {0}", clue.text_including_enumeration)
         result.clue_dictionary[clue.all_clue_numbers[0][0]] = clue
         clues_found += 1
         if clues_found >= result.number_of_clues:
             break
     return result, i
 
+def skip_list_of_clues(data, start_index):
+    """Return the index just after the list of clues at start_index
+
+    This follows the same layout as parse_list_of_clues, but only
+    uses the lengths of things, without decoding any of them."""
+    i = skip_string(data, start_index)
+    ensure_available(data, i, 4, "the header of a list of clues")
+    i += 3
+    number_of_clues = data[i]
+    i += 1
+    # parse_list_of_clues always reads at least one clue:
+    for _ in range(max(number_of_clues, 1)):
+        ensure_available(data, i, 2, "the start of a clue")
+        if data[i] >= 0x80:
+            while data[i] != 0:
+                ensure_available(data, i, 3, "the start of a clue")
+                i += 2
+            i += 1
+        else:
+            i += 2
+        i = skip_string(data, i)
+        ensure_available(data, i, 1, "a clue")
+        if data[i] != 0:
+            raise CCJParseError("After clue number we expect a NUL to skip "
+                                "over", i)
+        i = skip_string(data, i + 1)
+    return i
+
+class CCJSections(object):
+    """A class for the offsets of each section of a CCJ file
+
+    These are found by locate_sections just from the lengths and
+    markers in the file, without decoding anything, so that each
+    section can be decoded separately (see lazy.py)."""
+
+    __slots__ = ('width', 'height', 'buttons', 'congratulations',
+                 'bytes_skipped_before_grid', 'block_grid', 'hint_grid',
+                 'answers', 'number_of_lights', 'skipped_blocks_of_four',
+                 'across_clues', 'down_clues')
+
+    def __init__(self):
+        for k in self.__slots__:
+            setattr(self, k, None)
+
+    def locate_down_clues(self, data):
+        """Find the offset of the down clues, by skipping the across ones"""
+        if self.down_clues is None:
+            self.down_clues = skip_list_of_clues(byte_view(data),
+                                                 self.across_clues)
+        return self.down_clues
+
+def locate_sections(data):
+    """Find the sections of the CCJ file in data, returning CCJSections
+
+    data must be bytes.  This goes as far as the start of the across
+    clues; the start of the down clues is only found if you call
+    locate_down_clues on the result."""
+    d = byte_view(data)
+    sections = CCJSections()
+
+    # The button labels start after two bytes, and are followed by a
+    # NUL:
+    i = 2
+    sections.buttons = i
+    ensure_available(d, i, 1, "the button labels")
+    while d[i] != 0:
+        i = skip_string(d, i)
+        ensure_available(d, i, 1, "the button labels")
+    i += 1
+    sections.congratulations = i
+    i = skip_string(d, i)
+
+    # There's a byte of unknown purpose before the dimensions:
+    i += 1
+    ensure_available(d, i, 2, "the dimensions")
+    sections.width, sections.height = DIMENSIONS.unpack_from(d, i)
+    i += 2
+    size = sections.width * sections.height
+
+    m = GRID_START_RE.search(data, i)
+    if not m:
+        raise CCJParseError("Couldn't find the start of the grid", i)
+    sections.bytes_skipped_before_grid = m.start() - i
+    i = m.start()
+    sections.block_grid = i
+    ensure_available(data, i, size, "the grid")
+    sections.number_of_lights = \
+        data.count(b'?', i, i + size) + data.count(b'M', i, i + size)
+    i += size
+
+    sections.hint_grid = i
+    ensure_available(data, i, size, "the hint grid")
+    i += size
+
+    ensure_available(d, i, 1, "the answers")
+    if d[i] != 1:
+        raise CCJParseError("So far we expect a 0x01 before the answers...",
+                            i)
+    i += 1
+    sections.answers = i
+    ensure_available(data, i, sections.number_of_lights, "the answers")
+    i += sections.number_of_lights
+
+    sections.skipped_blocks_of_four = 0
+    while skippable_block_of_four(d, i):
+        i += 4
+        sections.skipped_blocks_of_four += 1
+
+    ensure_available(d, i, 16, "the block of 16 before the clues")
+    if d[i] != 0x02:
+        message = "Expect the first of the block of 16 always to be 0x02, "
+        message += "in fact was: {0}"
+        raise CCJParseError(message.format(d[i]), i)
+    sections.across_clues = i + 16
+    return sections
+
+# The layout of the parts of the .puz header that we fill in:
+PUZ_HEADER_SIZE = 0x34
+PUZ_DIMENSIONS_OFFSET = 0x2C
+PUZ_DIMENSIONS = struct.Struct('<BBh')
+PUZ_BITMASK_OFFSET = 0x30
+PUZ_BITMASK = struct.Struct('<H')
+BLOCK_IN_MASK_RE = re.compile(b'\x00')
+MASK_TO_EMPTY_PUZ_GRID = bytes(bytearray([0x2e] + [0x2d] * 255))
+
+# The version of the tuples returned by ParsedCCJ.to_record, which
+# should be changed whenever their layout changes:
+RECORD_VERSION = 1
+
 def keyfunc_clues(x):
     """A key function for sorting clues before output"""
     # We want clues to be in the order the number appear in the grid,
@@ -220,6 +453,8 @@ class ParsedClue:
         self.start_coordinates = None
         self.across = None
         self.all_clue_numbers = None
+        # For a "See N" clue, the clue it refers to:
+        self.placeholder_for = None
     def tidied_text_including_enumeration(self):
         t = re.sub(r'[\x00-\x1f]', '', self.text_including_enumeration)
         t = re.sub(r' *\(', ' (', t)
@@ -234,21 +469,22 @@ class ParsedClue:
     # only a 24A, and no 24D in the grid. (2013-11-14 also has a
     # difficult case: "33/16/12/2A/28D".
     def set_number(self, clue_number_string, grid):
-        print("clue_number_string is:", clue_number_string)
+        tracer.debug("clue_number_string is: {0}", clue_number_string)
         self.number_string = clue_number_string
         if self.across == None:
             msg = "Trying to call self.set_number() before self.across is set"
-            raise Exception(msg)
-        self.all_clue_numbers = [clue_number_string_to_duple(self.across, x, grid)
-                                 for x in
-                                 re.split(r'[,/]', clue_number_string)]
+            raise CCJParseError(msg)
+        self.all_clue_numbers = resolver_for(grid).resolve(self.across,
+                                                           clue_number_string)
 
 
-class ParsedCCJ:
+class ParsedCCJ(object):
 
     def __init__(self):
         self.width = None
         self.height = None
+        self.button_labels = None
+        self.congratulations_message = None
         self.across_clues = None
         self.down_clues = None
         self.grid = None
@@ -258,6 +494,20 @@ class ParsedCCJ:
         self.setter = None
         self.puzzle_number = None
         self.date_string = None
+        self.hint_digits = None
+        self.encodings_used = {}
+
+    def hint_grid(self):
+        """Return the grid of digits whose purpose is unknown as a Grid
+
+        This is the grid that comes after the block pattern in the
+        CCJ file; it's only kept as a string of digits (and spaces
+        for zeros), since nothing but the verbose output uses it."""
+        size = self.width * self.height
+        return CompactGrid.from_buffers(self.width,
+                                        self.height,
+                                        bytearray(b'\x01' * size),
+                                        self.hint_digits)
 
     def read_from_ccj(self,
                       f,
@@ -266,140 +516,227 @@ class ParsedCCJ:
                       puzzle_number,
                       copyright_message,
                       date_string,
-                      verbose=False):
+                      verbose=False,
+                      stats=None):
+        """Parse the CCJ crossword that can be read from the file f"""
+        self.read_from_bytes(f.read(),
+                             title,
+                             author,
+                             puzzle_number,
+                             copyright_message,
+                             date_string,
+                             verbose,
+                             stats)
+
+    def read_from_bytes(self,
+                        data,
+                        title,
+                        author,
+                        puzzle_number,
+                        copyright_message,
+                        date_string,
+                        verbose=False,
+                        stats=None):
+        """Parse a CCJ crossword from data, which is the whole file
+
+        The parsing is done on a single view of data, so apart from
+        the decoded strings and the grids nothing is copied.  If stats
+        is a ParseStats, the time taken by each stage of parsing is
+        recorded in it.  If verbose is True, tracing is switched on for
+        this module (see tracing.py)."""
+
+        if stats is not None:
+            stats.start()
+
+        verbose = tracing_enabled(verbose)
+
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        d = byte_view(data)
+
+        self.encodings_used = {}
+
+        sections = locate_sections(data)
+        self.width, self.height = sections.width, sections.height
+
+        self.read_messages(d, sections, verbose)
+
+        if stats is not None:
+            stats.count('bytes_skipped_before_grid',
+                        sections.bytes_skipped_before_grid)
+            stats.stage('header')
+
+        lights = self.read_block_grid(data, sections, verbose)
+        self.read_hint_grid(data, sections, verbose)
+        self.read_answers(data, sections, lights)
+
+        if stats is not None:
+            stats.stage('grid')
 
-        # Cope with puzzle number being passed in as a number rather
-        # than a string:
-        if puzzle_number is not None:
-            puzzle_number = str(puzzle_number)
-
-        d = f.read()
-
-        # i is the index into the file for the rest of this script:
-        i = 2
-
-        # I think these must be the list of buttons on the left:
-        while byte_at(d, i) != 0:
-            s, i = read_string(d, i)
-            if verbose:
-                print("got button string:", s)
+        # Now tell the grid to work out where each clue number should
+        # be, and what the answer to each entry is:
+        self.grid.set_numbers()
 
-        # Then the congratulations message, I think:
-        i += 1
-        s, i = read_string(d, i)
+        if stats is not None:
+            stats.stage('numbering')
 
         if verbose:
-            print("got congratulations message:", s)
+            tracer.debug("grid with answers is:\n{0}",
+                         self.grid.to_grid_string(False))
 
-        # Skip another byte; 0x02 in the Independent it seems, but 0x00 in the
-        # Herald puzzle I tried.
-        i += 1
+        if stats is not None:
+            stats.count('skipped_blocks_of_four',
+                        sections.skipped_blocks_of_four)
 
-        # I think we get the grid dimensions in the next two:
-        self.width = byte_at(d, i)
-        i += 1
-
-        self.height = byte_at(d, i)
-        i += 1
-
-        self.grid = Grid(self.width, self.height)
-
-        # Now skip over everything until we think we see the grid, since I've
-        # no idea what it's meant to mean:
-        while byte_at(d, i) != 0x3f and byte_at(d, i) != 0x23:
-            i += 1
+        if sections.skipped_blocks_of_four > 0:
+            if verbose:
+                tracer.debug("Skipped over {0} ignorable blocks",
+                             sections.skipped_blocks_of_four)
 
-        for y in range(0, self.height):
-            for x in range(0, self.width):
-                # Lights seem to be indicated by: '?' (or 'M' very occasionally)
-                if byte_at(d, i) in (0x3f, 0x4d):
-                    self.grid.cells[y][x] = Cell(y, x)
-                # Blocked-out squares seem to be always '#'
-                elif byte_at(d, i) == 0x23:
-                    pass
-                else:
-                    message = "Unknown value {0} at {1}"
-                    raise Exception(message.format(str(byte_at(d, i)),
-                                                   coord_str(x, y)))
-                i += 1
+        self.across_clues, i = parse_list_of_clues(d,
+                                                   sections.across_clues,
+                                                   self.grid,
+                                                   verbose,
+                                                   self.encodings_used)
+        sections.down_clues = i
 
         if verbose:
-            print("grid is:\n" + self.grid.to_grid_string(True))
+            tracer.debug("Now do down clues:")
 
-        # Now tell the grid to work out where each clue number should
-        # be:
-        self.grid.set_numbers()
+        self.down_clues, i = parse_list_of_clues(d, i, self.grid, verbose,
+                                                 self.encodings_used)
 
-        # Next there's a grid structure the purpose of which I don't
-        # understand:
-        grid_unknown_purpose = Grid(self.width, self.height)
-
-        for y in range(0, self.height):
-            for x in range(0, self.width):
-                grid_unknown_purpose.cells[y][x] = Cell(y, x)
-                if byte_at(d, i) == 0:
-                    grid_unknown_purpose.cells[y][x].set_letter(' ')
-                elif byte_at(d, i) < 10:
-                    letter = str(byte_at(d, i))
-                    grid_unknown_purpose.cells[y][x].set_letter(letter)
-                else:
-                    truncated = str(byte_at(d, i) % 10)
-                    if verbose:
-                        message = "Warning, truncating {0} to {1} at {2}"
-                        print(message.format(byte_at(d, i),
-                                             truncated,
-                                             coord_str(x, y)))
-                    grid_unknown_purpose.cells[y][x].set_letter(truncated)
-                i += 1
-
-        # Seem to need to skip over an extra byte (0x01) here before the
-        # answers.  Maybe it indicates whether there are answers next or not:
-        if byte_at(d, i) != 1:
-            raise Exception("So far we expect a 0x01 before the answers...")
-        i += 1
+        if stats is not None:
+            stats.count('bytes_consumed', i)
+            stats.count('bytes_read', len(data))
+            stats.add_encodings(self.encodings_used)
+            stats.stage('clues')
 
         if verbose:
-            print("grid_unknown_purpose is:\n" +
-                  grid_unknown_purpose.to_grid_string(False))
+            tracer.debug("text encodings used: {0}",
+                         ", ".join("{0}: {1}".format(k, v) for k, v in
+                                   sorted(self.encodings_used.items())))
 
-        # Now there's the grid with the answers:
-        for y in range(0, self.height):
-            for x in range(0, self.width):
-                if self.grid.cells[y][x]:
-                    self.grid.cells[y][x].set_letter(chr(byte_at(d, i)))
-                    i += 1
+        self.set_metadata(title,
+                          author,
+                          puzzle_number,
+                          copyright_message,
+                          date_string)
 
-        if verbose:
-            print("grid with answers is:\n" + self.grid.to_grid_string(False))
+        if stats is not None:
+            stats.count('puzzles_parsed')
+            stats.stage('metadata')
 
-        skipped_blocks_of_four = 0
-        while skippable_block_of_four(d, i):
-            i += 4
-            skipped_blocks_of_four += 1
+    def read_messages(self, d, sections, verbose=False):
+        """Decode the button labels and congratulations message
 
-        if skipped_blocks_of_four > 0:
+        d should be as returned by byte_view() and sections by
+        locate_sections."""
+        # I think these must be the list of buttons on the left:
+        self.button_labels = []
+        i = sections.buttons
+        while d[i] != 0:
+            s, i = read_string(d, i, self.encodings_used)
+            self.button_labels.append(s)
             if verbose:
-                print("Skipped over",
-                      str(skipped_blocks_of_four),
-                      "ignorable blocks")
+                tracer.debug("got button string: {0}", s)
+
+        # Then the congratulations message, I think:
+        self.congratulations_message, i = \
+            read_string(d, sections.congratulations, self.encodings_used)
 
-        # I expect the next one to be 0x02:
-        if byte_at(d, i) != 0x02:
-            message = "Expect the first of the block of 16 always to be 0x02, "
-            message += "in fact was: {0}"
-            raise Exception(message.format(byte_at(d, i)))
+        if verbose:
+            tracer.debug("got congratulations message: {0}",
+                         self.congratulations_message)
+
+    def read_block_grid(self, data, sections, verbose=False):
+        """Make self.grid from the pattern of blocks, without answers
 
-        # Always just 16?
-        i += 16
+        Returns the list of the indices of the lights in the grid."""
+        size = self.width * self.height
+        i = sections.block_grid
 
-        self.across_clues, i = parse_list_of_clues(d, i, self.grid, verbose)
+        # Lights seem to be indicated by: '?' (or 'M' very occasionally),
+        # and blocked-out squares seem to be always '#':
+        block_mask = data[i:(i + size)]
+        m = NOT_GRID_RE.search(block_mask)
+        if m:
+            message = "Unknown value {0} at {1}"
+            bad = m.start()
+            raise CCJParseError(message.format(str(byte_view(data)[i + bad]),
+                                               coord_str(bad % self.width,
+                                                         bad // self.width)),
+                                i + bad)
+        lights = [l.start() for l in LIGHT_RE.finditer(block_mask)]
+        self.grid = CompactGrid.from_buffers(
+            self.width,
+            self.height,
+            block_mask.translate(BLOCKS_TO_LIGHTS),
+            block_mask.translate(BLOCKS_TO_LETTERS))
 
         if verbose:
-            print("Now do down clues:")
+            tracer.debug("grid is:\n{0}", self.grid.to_grid_string(True))
+
+        return lights
+
+    def read_hint_grid(self, data, sections, verbose=False):
+        """Keep the digits of the grid whose purpose is unknown"""
+        # There's a grid structure after the blocks the purpose of
+        # which I don't understand - we just keep the digit shown in
+        # each square, and only make a grid of it if someone asks for
+        # it:
+        size = self.width * self.height
+        i = sections.hint_grid
+        hint_bytes = data[i:(i + size)]
+        self.hint_digits = hint_bytes.translate(HINT_TRANSLATION)
+        if verbose:
+            for j, b in enumerate(bytearray(hint_bytes)):
+                if b >= 10:
+                    tracer.debug("Warning, truncating {0} to {1} at {2}",
+                                 b,
+                                 b % 10,
+                                 coord_str(j % self.width, j // self.width))
+            tracer.debug("grid_unknown_purpose is:\n{0}",
+                         self.hint_grid().to_grid_string(False))
+
+    def read_answers(self, data, sections, lights):
+        """Fill in the letters of self.grid from the answers
+
+        There's one byte for each light, in the order given by the
+        list lights."""
+        i = sections.answers
+        answers = data[i:(i + len(lights))]
+        letters = self.grid.letters
+        for light, letter in zip(lights, bytearray(answers)):
+            letters[light] = letter
+
+    def across_label(self):
+        """Return the label of the across clues, e.g. Bloggs-1234 Across"""
+        return self.across_clues.label
+
+    def set_metadata(self,
+                     title,
+                     author,
+                     puzzle_number,
+                     copyright_message,
+                     date_string):
+        """Work out the title, author and so on of a parsed crossword
+
+        The setter and puzzle number are taken from the label of the
+        across clues if possible, otherwise from author and
+        puzzle_number.  This can be called again with different
+        arguments without parsing the crossword again."""
 
-        self.down_clues, i = parse_list_of_clues(d, i, self.grid, verbose)
+        # Cope with puzzle number being passed in as a number rather
+        # than a string:
+        if puzzle_number is not None:
+            puzzle_number = str(puzzle_number)
 
-        m = re.search(r'^(.*)-([0-9]+)', self.across_clues.label)
+        self.setter = None
+        self.puzzle_number = None
+        self.date_string = date_string
+
+        m = re.search(r'^(.*)-([0-9]+)', self.across_label())
         if m:
             self.setter = m.group(1)
             self.puzzle_number = m.group(2)
@@ -431,103 +768,226 @@ class ParsedCCJ:
         if copyright_message:
             self.copyright_message = copyright_message
 
-    def write_to_puz_file(self, output_filename, verbose=False):
+    def to_record(self):
+        """Return the parsed crossword as a tuple of plain values
+
+        This has everything that comes from the CCJ file, but not the
+        title, author and so on that set_metadata works out, so that
+        it can be stored (see cache.py) and turned back into a
+        ParsedCCJ with from_record, without parsing again."""
+        def list_record(clues):
+            return (clues.label,
+                    clues.across,
+                    clues.unknown_bytes,
+                    clues.number_of_clues,
+                    [(c.number_string,
+                      c.text_including_enumeration,
+                      [tuple(x) for x in c.start_coordinates],
+                      [tuple(x) for x in c.all_clue_numbers])
+                     for c in clues.clue_dictionary.values()])
+        return (RECORD_VERSION,
+                self.width,
+                self.height,
+                bytes(self.grid.light_mask()),
+                bytes(self.grid.letter_bytes()),
+                self.hint_digits,
+                dict(self.encodings_used),
+                list_record(self.across_clues),
+                list_record(self.down_clues))
+
+    @classmethod
+    def from_record(cls, record):
+        """Make a ParsedCCJ from the result of to_record
+
+        You need to call set_metadata on the result before writing
+        it out."""
+        if record[0] != RECORD_VERSION:
+            message = "Unknown record version: {0}"
+            raise CCJParseError(message.format(record[0]))
+        (_, width, height, lights, letters, hint_digits, encodings_used,
+         across_record, down_record) = record
+        def list_from_record(r):
+            result = ListOfClues()
+            (result.label, result.across, result.unknown_bytes,
+             result.number_of_clues, clue_records) = r
+            for number_string, text, start_coordinates, numbers in \
+                    clue_records:
+                clue = ParsedClue()
+                clue.across = result.across
+                clue.number_string = number_string
+                clue.text_including_enumeration = text
+                clue.start_coordinates = list(start_coordinates)
+                clue.all_clue_numbers = [tuple(x) for x in numbers]
+                result.clue_dictionary[clue.all_clue_numbers[0][0]] = clue
+            return result
+        parsed = cls()
+        parsed.width = width
+        parsed.height = height
+        parsed.grid = CompactGrid.from_buffers(width,
+                                               height,
+                                               bytearray(lights),
+                                               bytearray(letters))
+        parsed.grid.set_numbers()
+        parsed.hint_digits = hint_digits
+        parsed.encodings_used = dict(encodings_used)
+        parsed.across_clues = list_from_record(across_record)
+        parsed.down_clues = list_from_record(down_record)
+        return parsed
+
+    def clue_dictionaries_with_placeholders(self, verbose=False, stats=None):
+        """Return the across and down clues, adding any "See N" clues
+
+        In the AcrossLite .PUZ format we need to make sure that
+        there's one "clue" for each clue number, even if it's just
+        "See 6" for clues whose answers are split over different clue
+        numbers in the grid.  This returns a dictionary mapping True
+        (for across) and False (for down) to a dictionary from clue
+        number to clue, which includes such placeholder clues.  The
+        clue dictionaries of this instance aren't changed, and the
+        clues themselves are shared rather than copied; see
+        resolver.py for how they're worked out.  If verbose is True,
+        tracing is switched on for this module (see tracing.py)."""
+
+        tracing_enabled(verbose)
+        return resolver_for(self.grid).with_placeholders(
+            self.across_clues.clue_dictionary,
+            self.down_clues.clue_dictionary,
+            stats)
+
+    def ordered_clues(self, verbose=False, stats=None):
+        """Return every clue to output, with placeholders, in order
+
+        This is a list of (clue, label, text) tuples sorted with
+        keyfunc_clues, where label is the tidied number string
+        (e.g. "4,12d" for "4/12D") and text the tidied text of the
+        clue.  It's the same for every output format, so formats.py
+        works it out once and passes it to each of them."""
+        clue_groups = self.clue_dictionaries_with_placeholders(verbose, stats)
+        all_clues = list(clue_groups[True].values())
+        all_clues += clue_groups[False].values()
+        all_clues.sort(key=keyfunc_clues)
+        return [(c,
+                 c.number_string.replace('/', ',').lower(),
+                 c.tidied_text_including_enumeration())
+                for c in all_clues]
+
+    def to_puz_bytes(self, verbose=False, checksums=False, stats=None,
+                     ordered_clues=None):
+        """Return the crossword in AcrossLite .puz format as bytes
+
+        Note that unless checksums is True, the version for the file
+        format that this outputs doesn't include checksums, so a strict
+        loader will reject such a file - it's fine in xword, though.
+        With checksums, the file magic, version and all the checksums
+        are filled in, as they're computed while the output is
+        assembled.  If stats is a ParseStats, the time taken is
+        recorded in it.  ordered_clues is the result of
+        self.ordered_clues(), if you already have it."""
+
+        if stats is not None:
+            stats.start()
+
+        if ordered_clues is None:
+            ordered_clues = self.ordered_clues(verbose, stats)
+
+        if stats is not None:
+            stats.stage('placeholders')
+
+        # Encode all the strings first, so that we know how big the
+        # output is going to be:
+        strings = [self.title.encode('UTF-8'),
+                   self.author.encode('UTF-8'),
+                   self.copyright_message.encode('UTF-8')]
+        for _, label, clue_text in ordered_clues:
+            # We have to stick the number string at the beginning
+            # otherwise it won't be clear when the answers to clues cover
+            # several entries in the grid.  Encode the clue text as
+            # UTF-8, because it's not defined what the character set
+            # should be anywhere that I've seen.  (xword currently
+            # assumes ISO-8859-1, but that doesn't strike me as a good
+            # enough reason in itself, since it's easily patched.)
+            strings.append(("[" + label + "] " + clue_text).encode('UTF-8'))
+
+        size = self.width * self.height
+        total = PUZ_HEADER_SIZE + 2 * size
+        total += sum(len(x) + 1 for x in strings) + 1
+        output = bytearray(total)
+
+        PUZ_DIMENSIONS.pack_into(output, PUZ_DIMENSIONS_OFFSET,
+                                 self.width,
+                                 self.height,
+                                 len(ordered_clues))
+        if checksums:
+            PUZ_BITMASK.pack_into(output, PUZ_BITMASK_OFFSET, 1)
+            sums = PuzChecksums()
+            sums.add_cib(output[PUZ_DIMENSIONS_OFFSET:PUZ_HEADER_SIZE])
+
+        # The solution is the letters in the grid with '.' for each
+        # block, and the empty grid is '-' for each light:
+        lights = bytes(self.grid.light_mask())
+        i = PUZ_HEADER_SIZE
+        output[i:(i + size)] = self.grid.letter_bytes()
+        for m in BLOCK_IN_MASK_RE.finditer(lights):
+            output[i + m.start()] = 0x2e
+        if checksums:
+            sums.add_solution(output[i:(i + size)])
+        i += size
+        output[i:(i + size)] = lights.translate(MASK_TO_EMPTY_PUZ_GRID)
+        if checksums:
+            sums.add_grid(output[i:(i + size)])
+        i += size
+
+        # Then all the strings, each terminated with a NUL (which is
+        # already there in the buffer), and a final NUL at the end.
+        # The first three are the title, author and copyright, and
+        # the rest are clues:
+        for k, string in enumerate(strings):
+            output[i:(i + len(string))] = string
+            if checksums:
+                sums.add_string(string, include_nul=(k < 3))
+            i += len(string) + 1
+
+        if checksums:
+            sums.write_header(output)
+
+        if stats is not None:
+            stats.count('puzzles_written')
+            stats.count('bytes_written', len(output))
+            stats.stage('puz')
+
+        return bytes(output)
+
+    def write_to_stream(self, fp, verbose=False, checksums=False,
+                        stats=None):
+        """Write the crossword in AcrossLite .puz format to the file fp"""
+        fp.write(self.to_puz_bytes(verbose, checksums, stats))
+
+    def write_to_puz_file(self, output_filename, verbose=False,
+                          checksums=False, stats=None):
         """Write the crossword in AcrossLite .puz format to output_filename
 
-        Note that the version for the file format that this outputs
-        doesn't include checksums, so a strict loader will reject such
-        a file - it's fine in xword, though."""
-
-        # In the AcrossLite .PUZ format we need to make sure that there's one
-        # "clue" for each clue number, even if it's just "See 6" for clues
-        # whose answers are split over different clue numbers in the grid.
-
-        # So, go through the clue dictionaries and make sure that there is
-        # something for every clue.  (So we don't miss the "See 6" type of
-        # clue.)
-
-        # We take a deep copy of the across clues and down clues first
-        # so that we don't add unnecessary fake clues to the
-        # attributes of this instance.
-        clue_groups = {
-            True: copy.deepcopy(self.across_clues),
-            False: copy.deepcopy(self.down_clues)}
-
-        for group_across in (True, False):
-            clue_dictionary = clue_groups[group_across].clue_dictionary
-            for clue in clue_dictionary.values():
-                first_clue_entry = str(clue.all_clue_numbers[0][0])
-                for entry_n, entry_across in clue.all_clue_numbers:
-                    clue_string = "See " + first_clue_entry
-                    if entry_across != group_across:
-                        clue_string += entry_across and " across" or " down"
-                    expected_dictionary = {
-                        True: clue_groups[True].clue_dictionary,
-                        False: clue_groups[False].clue_dictionary
-                    }[entry_across]
-                    if entry_n not in expected_dictionary.keys():
-                        fake_clue = ParsedClue()
-                        fake_clue.across = entry_across
-                        fake_clue.text_including_enumeration = clue_string
-                        fake_clue.set_number(str(entry_n), self.grid)
-                        expected_dictionary[entry_n] = fake_clue
-                        if verbose:
-                            print("**** Added missing clue with index ", str(entry_n),
-                                  fake_clue.tidied_text_including_enumeration())
-
-        # Now the file can be written out:
-
+        Note that unless checksums is True, the version for the file
+        format that this outputs doesn't include checksums, so a strict
+        loader will reject such a file - it's fine in xword, though."""
         with io.FileIO(output_filename, 'wb') as f:
-            f.write(bytearray(0x2C))
-            dimensions_etc = bytearray(2)
-            dimensions_etc[0] = self.width
-            dimensions_etc[1] = self.height
-            f.write(dimensions_etc)
-            f.write(struct.pack("<h",
-                                clue_groups[True].real_number_of_clues() +
-                                clue_groups[False].real_number_of_clues()))
-            f.write(bytearray(4))
-            solutions = bytearray(self.width*self.height)
-            empty_grid = bytearray(self.width*self.height)
-            i = 0
-            for y in range(0, self.height):
-                for x in range(0, self.width):
-                    c = self.grid.cells[y][x]
-                    if c:
-                        solutions[i] = ord(c.letter)
-                        empty_grid[i] = ord('-')
-                    else:
-                        solutions[i] = ord('.')
-                        empty_grid[i] = ord('.')
-                    i += 1
-            f.write(solutions)
-            f.write(empty_grid)
-            nul = bytearray(1)
-            f.write(self.title.encode('UTF-8'))
-            f.write(nul)
-            f.write(self.author.encode('UTF-8'))
-            f.write(nul)
-            f.write(self.copyright_message.encode('UTF-8'))
-            f.write(nul)
-            all_clues = clue_groups[True].ordered_list_of_clues()
-            all_clues += clue_groups[False].ordered_list_of_clues()
-
-            all_clues.sort(key=keyfunc_clues)
-            for c in all_clues:
-                number_string_tidied = re.sub(r'/', ',', c.number_string)
-                number_string_tidied = number_string_tidied.lower()
-                clue_text = c.tidied_text_including_enumeration()
-                # We have to stick the number string at the beginning
-                # otherwise it won't be clear when the answers to clues cover
-                # several entries in the grid.
-                f.write(("[" + number_string_tidied + "] ").encode('UTF-8'))
-                # Encode the clue text as UTF-8, because it's not defined what
-                # the character set should be anywhere that I've seen.  (xword
-                # currently assumes ISO-8859-1, but that doesn't strike me as
-                # a good enough reason in itself, since it's easily patched.)
-                f.write(clue_text.encode('UTF-8'))
-                f.write(nul)
-            f.write(nul)
+            self.write_to_stream(f, verbose, checksums, stats)
+
+def ccj_bytes_to_puz_bytes(data,
+                           title=None,
+                           author=None,
+                           puzzle_number=None,
+                           copyright_message=None,
+                           date_string=None,
+                           checksums=False):
+    """Convert a whole CCJ file in data to the bytes of a .puz file"""
+    parsed = ParsedCCJ()
+    parsed.read_from_bytes(data,
+                           title,
+                           author,
+                           puzzle_number,
+                           copyright_message,
+                           date_string)
+    return parsed.to_puz_bytes(checksums=checksums)
 
 def ensure_sys_argv_is_decoded():
     """Ensure that elements of sys.argv are decoded to Unicodeon Python 2"""
@@ -535,14 +995,49 @@ def ensure_sys_argv_is_decoded():
         for i, a in enumerate(sys.argv):
             sys.argv[i] = a.decode('UTF-8')
 
+def use_numpy_by_default(parser):
+    """Make grids be numbered with NumPy, for the --numpy option"""
+    try:
+        import numpy
+    except ImportError:
+        parser.error("--numpy needs NumPy to be installed")
+    from ccj_to_puz import numbering
+    numbering.use_numpy_by_default = True
+
 def main():
+    # (This is only imported here so that importing this module as a
+    # library doesn't pay for it.)
+    from optparse import OptionParser
     parser = OptionParser()
     parser.add_option('-o', "--output", dest="output_filename",
                       default=False, help="output in a broken .PUZ format")
+    parser.add_option('--ipuz', dest='ipuz_filename', metavar='FILE',
+                      help="also output in ipuz (JSON) format to FILE")
+    parser.add_option('--text', dest='text_filename', metavar='FILE',
+                      help="also output as plain text to FILE")
     parser.add_option('-d', "--date", dest="date",
                       help="specify the date of this crossword")
+    parser.add_option('-k', '--checksums', dest='checksums',
+                      action="store_true", default=False,
+                      help="include the AcrossLite checksums in the output")
+    parser.add_option('-s', '--stats', dest='stats', action="store_true",
+                      default=False,
+                      help="print timings and counters as JSON on stderr")
+    parser.add_option('--stream', dest='stream', type='choice',
+                      choices=['binary', 'base64'], metavar='FRAMING',
+                      help="convert many crosswords framed as 'binary' "
+                      "(length-prefixed) or 'base64' (one per line) "
+                      "records on standard input")
+    parser.add_option('--cache-dir', dest='cache_directory', metavar='DIR',
+                      help="reuse parsed crosswords cached in DIR")
+    parser.add_option('--cache-size', dest='cache_size', type='int',
+                      default=256, metavar='MB',
+                      help="maximum size of the cache in megabytes")
     parser.add_option('-v', '--verbose', dest='verbose', action="store_true",
                       default=False, help='verbose output')
+    parser.add_option('--trace', dest='trace', metavar='MODULES',
+                      help="verbose output from a comma-separated list of "
+                      "modules, e.g. ccj_parse,commonccj")
     parser.add_option('-t', '--title', dest='title',
                       help="specify the crossword title")
     parser.add_option('-a', '--author', dest='author',
@@ -551,10 +1046,22 @@ def main():
                       help="specify the puzzle number")
     parser.add_option('-c', '--copyright', dest='copyright_message',
                       help="specify the copyright message")
+    parser.add_option('--numpy', dest='numpy', action="store_true",
+                      default=False,
+                      help="number the grid with NumPy rather than regular "
+                      "expressions")
 
     ensure_sys_argv_is_decoded()
     (options, args) = parser.parse_args()
 
+    if options.verbose:
+        tracing.enable()
+    elif options.trace:
+        tracing.enable(options.trace.split(','))
+
+    if options.numpy:
+        use_numpy_by_default(parser)
+
     if len(args) > 0:
         raise Exception("Unknown arguments: " + "\n".join(args))
 
@@ -564,24 +1071,75 @@ def main():
             raise Exception("Unknown date format, must be YYYY-MM-DD")
         date_string = options.date
 
-    parsed = ParsedCCJ()
-
-    # Make sys.stdin binary:
-    parsed.read_from_ccj(io.open(sys.stdin.fileno(), 'rb'),
-                         options.title,
-                         options.author,
-                         options.puzzle_number,
-                         options.copyright_message,
-                         date_string,
-                         options.verbose)
+    stats = None
+    if options.stats:
+        stats = ParseStats()
+
+    if options.stream:
+        from ccj_to_puz.stream import convert_standard_streams
+        metadata = {'title': options.title,
+                    'author': options.author,
+                    'puzzle_number': options.puzzle_number,
+                    'copyright_message': options.copyright_message,
+                    'date_string': date_string,
+                    'checksums': options.checksums,
+                    'cache_directory': options.cache_directory,
+                    'cache_max_bytes': options.cache_size * 1024 * 1024}
+        convert_standard_streams(metadata, options.stream, stats)
+        if stats is not None:
+            print(stats.to_json(), file=sys.stderr)
+        return
+
+    if options.cache_directory:
+        from ccj_to_puz.cache import ConversionCache
+        cache = ConversionCache(options.cache_directory,
+                                options.cache_size * 1024 * 1024)
+        # Make sys.stdin binary:
+        data = io.open(sys.stdin.fileno(), 'rb').read()
+        parsed = cache.parse(data,
+                             options.title,
+                             options.author,
+                             options.puzzle_number,
+                             options.copyright_message,
+                             date_string,
+                             options.verbose,
+                             stats)
+    else:
+        parsed = ParsedCCJ()
+
+        # Make sys.stdin binary:
+        parsed.read_from_ccj(io.open(sys.stdin.fileno(), 'rb'),
+                             options.title,
+                             options.author,
+                             options.puzzle_number,
+                             options.copyright_message,
+                             date_string,
+                             options.verbose,
+                             stats)
 
     # Output to something like the .PUZ format used by AcrossLite.  I only
-    # care about loading this into xword, so I'm not bothering to
-    # calculate all the checksums, etc.  If you wanted to do this, details
-    # can be found here: http://joshisanerd.com/puz/
-
-    if options.output_filename:
-        parsed.write_to_puz_file(options.output_filename, options.verbose)
+    # care about loading this into xword, so by default I'm not bothering
+    # to calculate all the checksums, etc.  If you want them, use
+    # --checksums; details can be found here: http://joshisanerd.com/puz/
+
+    outputs = [(name, filename) for name, filename in
+               (('puz', options.output_filename),
+                ('ipuz', options.ipuz_filename),
+                ('text', options.text_filename))
+               if filename]
+    if outputs:
+        from ccj_to_puz.formats import PreparedPuzzle
+        # The clues are only prepared once for all the formats:
+        prepared = PreparedPuzzle(parsed,
+                                  options.checksums,
+                                  options.verbose,
+                                  stats)
+        for name, filename in outputs:
+            with io.FileIO(filename, 'wb') as f:
+                f.write(prepared.serialize(name))
+
+    if stats is not None:
+        print(stats.to_json(), file=sys.stderr)
 
 if __name__ == "__main__":
     main()
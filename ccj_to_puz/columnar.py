@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""A compact columnar store of parsed crosswords, for analytics
+
+Keeping a whole archive of ParsedCCJ objects in memory to work out
+things like the density of blocks, the distribution of entry lengths
+or setters' habits takes far too much memory.  This exports parsed
+crosswords to a file (in the format of packedfile.py) where each
+property is stored as a column over all the puzzles:
+
+  per puzzle  name, title, setter, puzzle_number, date_string (string
+              tables); width, height; and grid_offsets, the offset
+              of the puzzle's squares in the grid planes
+  grids       three byte planes with one byte per square of every
+              grid, one after another: lights (1 or 0), letters (the
+              answer, or a space for a block) and hints (the digits
+              of the grid of unknown purpose)
+  entries     entry_offsets (per puzzle), then entry_number,
+              entry_across, entry_x, entry_y and entry_length
+  clues       clue_offsets (per puzzle), then clue_across,
+              clue_numbers and clue_texts (string tables),
+              and the all_clue_numbers of each clue as
+              reference_offsets (per clue) into reference_number and
+              reference_across
+
+A ColumnarStore memory-maps the file, and its columns can be used
+directly (as memoryviews on Python 3) without creating an object per
+puzzle; puzzles() iterates over a single PuzzleCursor that's moved
+from puzzle to puzzle.
+
+From the command line:
+
+  ccj-to-puz-columns -o archive.columns ~/crosswords/*.ccj
+  ccj-to-puz-columns -i archive.columns"""
+
+from __future__ import print_function
+
+import array
+import sys
+from optparse import OptionParser
+
+from ccj_to_puz.archive import iterate_inputs
+from ccj_to_puz.batch import find_ccj_files, map_in_batches, \
+    parse_with_metadata
+from ccj_to_puz.ccj_parse import ensure_sys_argv_is_decoded
+from ccj_to_puz.index import date_from_name
+from ccj_to_puz.packedfile import PackedFile, PackedFileError, \
+    PackedFileWriter, StringTable, StringsWriter, UINT32
+
+COLUMNAR_VERSION = 1
+PUZZLE_STRINGS = ('name', 'title', 'setter', 'puzzle_number', 'date_string')
+GRID_PLANES = ('lights', 'letters', 'hints')
+
+def columns_record(parsed):
+    """Return what the store keeps about a ParsedCCJ as a tuple
+
+    This is (title, setter, puzzle_number, date_string, width,
+    height, lights, letters, hints, entries, clues) where the grids
+    are bytes, entries is a list of (number, across, x, y, length)
+    and clues a list of (across, number string, text,
+    all_clue_numbers)."""
+    entries = [(e.number, e.across, e.x, e.y, e.length)
+               for e in parsed.grid.numbering.entries]
+    clues = []
+    for clue_list in (parsed.across_clues, parsed.down_clues):
+        for c in clue_list.ordered_list_of_clues():
+            clues.append((c.across,
+                          c.number_string,
+                          c.text_including_enumeration,
+                          [tuple(x) for x in c.all_clue_numbers]))
+    return (parsed.title or "",
+            parsed.setter or "",
+            parsed.puzzle_number or "",
+            parsed.date_string or "",
+            parsed.width,
+            parsed.height,
+            bytes(parsed.grid.light_mask()),
+            bytes(parsed.grid.letter_bytes()),
+            bytes(parsed.hint_digits),
+            entries,
+            clues)
+
+class ColumnarWriter(object):
+    """A class for adding puzzles to columns and writing them out
+
+    The columns are built up in arrays as puzzles are added, so the
+    memory used is about the size of the file that's written."""
+
+    def __init__(self):
+        self.strings = dict((k, StringsWriter()) for k in PUZZLE_STRINGS)
+        self.width = array.array('B')
+        self.height = array.array('B')
+        self.grid_offsets = array.array(UINT32, [0])
+        self.planes = dict((k, bytearray()) for k in GRID_PLANES)
+        self.entry_offsets = array.array(UINT32, [0])
+        self.entry_number = array.array('H')
+        self.entry_across = array.array('B')
+        self.entry_x = array.array('B')
+        self.entry_y = array.array('B')
+        self.entry_length = array.array('B')
+        self.clue_offsets = array.array(UINT32, [0])
+        self.clue_across = array.array('B')
+        self.clue_numbers = StringsWriter()
+        self.clue_texts = StringsWriter()
+        self.reference_offsets = array.array(UINT32, [0])
+        self.reference_number = array.array('H')
+        self.reference_across = array.array('B')
+
+    def __len__(self):
+        return len(self.width)
+
+    def add(self, name, parsed):
+        """Add the ParsedCCJ parsed, known as name"""
+        self.add_record(name, columns_record(parsed))
+
+    def add_record(self, name, record):
+        """Add a tuple as returned by columns_record"""
+        (title, setter, puzzle_number, date_string, width, height,
+         lights, letters, hints, entries, clues) = record
+        for k, v in zip(PUZZLE_STRINGS,
+                        (name, title, setter, puzzle_number, date_string)):
+            self.strings[k].append(v)
+        self.width.append(width)
+        self.height.append(height)
+        for k, v in zip(GRID_PLANES, (lights, letters, hints)):
+            self.planes[k].extend(v)
+        self.grid_offsets.append(len(self.planes['lights']))
+        for number, across, x, y, length in entries:
+            self.entry_number.append(number)
+            self.entry_across.append(1 if across else 0)
+            self.entry_x.append(x)
+            self.entry_y.append(y)
+            self.entry_length.append(length)
+        self.entry_offsets.append(len(self.entry_number))
+        for across, number_string, text, all_clue_numbers in clues:
+            self.clue_across.append(1 if across else 0)
+            self.clue_numbers.append(number_string)
+            self.clue_texts.append(text)
+            for number, reference_across in all_clue_numbers:
+                self.reference_number.append(number)
+                self.reference_across.append(1 if reference_across else 0)
+            self.reference_offsets.append(len(self.reference_number))
+        self.clue_offsets.append(len(self.clue_across))
+
+    def write(self, path):
+        writer = PackedFileWriter()
+        writer.add_array('version', [COLUMNAR_VERSION])
+        for k in PUZZLE_STRINGS:
+            self.strings[k].add_to(writer, k)
+        for k in GRID_PLANES:
+            writer.add_bytes(k, self.planes[k])
+        for k in ('width', 'height', 'grid_offsets',
+                  'entry_offsets', 'entry_number', 'entry_across',
+                  'entry_x', 'entry_y', 'entry_length',
+                  'clue_offsets', 'clue_across',
+                  'reference_offsets', 'reference_number',
+                  'reference_across'):
+            writer.add_array(k, getattr(self, k))
+        self.clue_numbers.add_to(writer, 'clue_numbers')
+        self.clue_texts.add_to(writer, 'clue_texts')
+        writer.write(path)
+
+class PuzzleCursor(object):
+    """A class for looking at one puzzle of a ColumnarStore at a time
+
+    Nothing is copied when the cursor is moved: each attribute reads
+    from the columns when it's used."""
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index=0):
+        self.store = store
+        self.index = index
+
+    @property
+    def name(self):
+        return self.store.name[self.index]
+
+    @property
+    def title(self):
+        return self.store.title[self.index]
+
+    @property
+    def setter(self):
+        return self.store.setter[self.index]
+
+    @property
+    def puzzle_number(self):
+        return self.store.puzzle_number[self.index]
+
+    @property
+    def date_string(self):
+        return self.store.date_string[self.index]
+
+    @property
+    def width(self):
+        return self.store.width[self.index]
+
+    @property
+    def height(self):
+        return self.store.height[self.index]
+
+    def plane(self, name):
+        """Return the slice of a grid plane for this puzzle
+
+        The square at (x, y) is at index y * width + x."""
+        offsets = self.store.grid_offsets
+        return self.store.planes[name][offsets[self.index]:
+                                       offsets[self.index + 1]]
+
+    def entry_range(self):
+        """Return the range of this puzzle's entries in the entry columns"""
+        offsets = self.store.entry_offsets
+        return range(offsets[self.index], offsets[self.index + 1])
+
+    def clue_range(self):
+        """Return the range of this puzzle's clues in the clue columns"""
+        offsets = self.store.clue_offsets
+        return range(offsets[self.index], offsets[self.index + 1])
+
+class ColumnarStore(object):
+    """A memory-mapped columnar store written by ColumnarWriter
+
+    Each column is an attribute with the same name as in the module
+    docstring; the string columns are StringTable objects and the
+    grid planes are in the dictionary planes.  Close the store with
+    close() when you've finished with it."""
+
+    def __init__(self, path):
+        self.packed = PackedFile(path)
+        try:
+            version = self.packed.array('version')[0]
+            if version != COLUMNAR_VERSION:
+                message = "Unknown columnar store version {0} in {1}"
+                raise PackedFileError(message.format(version, path))
+            for k in PUZZLE_STRINGS + ('clue_numbers', 'clue_texts'):
+                setattr(self, k, StringTable(self.packed, k))
+            self.planes = dict((k, self.packed.raw(k)) for k in GRID_PLANES)
+            if sys.version_info < (3, 0):
+                # Slices of an mmap are strs on Python 2, so copy the
+                # planes to get integers when they're indexed:
+                for k in GRID_PLANES:
+                    self.planes[k] = bytearray(self.planes[k])
+            for k in ('width', 'height', 'grid_offsets',
+                      'entry_offsets', 'entry_number', 'entry_across',
+                      'entry_x', 'entry_y', 'entry_length',
+                      'clue_offsets', 'clue_across',
+                      'reference_offsets', 'reference_number',
+                      'reference_across'):
+                setattr(self, k, self.packed.array(k))
+        except:
+            self.packed.close()
+            raise
+
+    def close(self):
+        self.packed.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.width)
+
+    def puzzle(self, index):
+        return PuzzleCursor(self, index)
+
+    def puzzles(self):
+        """Generate a PuzzleCursor at each puzzle in turn
+
+        The same cursor is generated each time, moved on to the next
+        puzzle, so keep its index rather than the cursor itself."""
+        cursor = PuzzleCursor(self)
+        for i in range(len(self)):
+            cursor.index = i
+            yield cursor
+
+    def all_clue_numbers(self, clue):
+        """Return the all_clue_numbers list of a clue, by its index"""
+        start = self.reference_offsets[clue]
+        end = self.reference_offsets[clue + 1]
+        return [(self.reference_number[i], bool(self.reference_across[i]))
+                for i in range(start, end)]
+
+def columns_job(job):
+    """Parse one input for the store, returning (name, record, error)
+
+    job is as generated by archive.iterate_inputs, with a metadata
+    dictionary (as for batch.convert_file) added."""
+    name, _, data, metadata = job
+    try:
+        if isinstance(data, Exception):
+            raise data
+        if not metadata.get('date_string'):
+            metadata = dict(metadata)
+            metadata['date_string'] = date_from_name(name)
+        parsed = parse_with_metadata(data, metadata)
+        return name, columns_record(parsed), None
+    except Exception as e:
+        return name, None, "{0}: {1}".format(e.__class__.__name__, e)
+
+def summarize(store, out=sys.stdout):
+    """Print some statistics about the puzzles in a store to out
+
+    This works straight from the columns, as an example of scanning
+    a whole store without making an object for each puzzle."""
+    squares = len(store.planes['lights'])
+    lights = sum(store.planes['lights'])
+    print("Puzzles: {0}".format(len(store)), file=out)
+    print("Clues: {0}".format(len(store.clue_across)), file=out)
+    if squares:
+        print("Block density: {0:.3f}".format(1 - lights / float(squares)),
+              file=out)
+    lengths = {}
+    for length in store.entry_length:
+        lengths[length] = lengths.get(length, 0) + 1
+    print("Entry lengths: " + ", ".join("{0}: {1}".format(k, v)
+                                        for k, v in sorted(lengths.items())),
+          file=out)
+    linked = 0
+    for i in range(len(store.clue_across)):
+        if store.reference_offsets[i + 1] - store.reference_offsets[i] > 1:
+            linked += 1
+    print("Clues covering several entries: {0}".format(linked), file=out)
+
+def main():
+    parser = OptionParser(usage="%prog -o STORE [options] INPUT...\n"
+                          "       %prog -i STORE")
+    parser.add_option('-o', '--output', dest='output',
+                      help="export the inputs to this columnar store")
+    parser.add_option('-i', '--input', dest='input',
+                      help="print a summary of this columnar store")
+    parser.add_option('-d', '--date', dest='date',
+                      help="the date of the inputs (by default, the first "
+                      "YYYY-MM-DD in each input's name)")
+    parser.add_option('-j', '--jobs', dest='jobs', type='int',
+                      help="number of worker processes for parsing")
+
+    ensure_sys_argv_is_decoded()
+    (options, args) = parser.parse_args()
+
+    if options.output:
+        if not args:
+            parser.error("You must specify at least one input to export")
+        writer = ColumnarWriter()
+        metadata = {'date_string': options.date}
+        jobs = (source + (metadata,)
+                for source in iterate_inputs(find_ccj_files(args)))
+        failures = 0
+        for name, record, error in map_in_batches(columns_job,
+                                                  jobs,
+                                                  options.jobs):
+            if error:
+                failures += 1
+                print("FAILED {0}: {1}".format(name, error), file=sys.stderr)
+            else:
+                writer.add_record(name, record)
+        writer.write(options.output)
+        print("Exported {0} puzzles ({1} failed)".format(len(writer),
+                                                         failures),
+              file=sys.stderr)
+    elif options.input:
+        with ColumnarStore(options.input) as store:
+            summarize(store)
+    else:
+        parser.error("You must specify a store with -o or -i")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,39 @@
 """A variety of helper classes useful to the CCJ parsing code"""
 
-from collections import defaultdict
 import re
+import sys
+
+from ccj_to_puz.numbering import number_grid
+from ccj_to_puz.tracing import get_tracer
+
+CLUE_NUMBER_RE = re.compile(r'(?ims)(\d+) *(A|D)?')
+
+tracer = get_tracer('commonccj')
+
+class CCJParseError(Exception):
+    """An exception raised when a CCJ file can't be parsed
+
+    offset is the index of the byte in the file where the problem was
+    found, or None if that isn't known (yet)."""
+
+    def __init__(self, reason, offset=None):
+        message = reason
+        if offset is not None:
+            message = "{0} (at byte {1})".format(reason, offset)
+        Exception.__init__(self, message)
+        self.reason = reason
+        self.offset = offset
+
+    def __reduce__(self):
+        # So that the offset survives being passed back from a worker
+        # process:
+        return (CCJParseError, (self.reason, self.offset))
+
+    def at(self, offset):
+        """Return this error with offset filled in, if it wasn't known"""
+        if self.offset is not None:
+            return self
+        return CCJParseError(self.reason, offset)
 
 def clue_number_string_to_duple(in_across, clue_number_string, grid):
     """A function that parses a clue number
@@ -11,7 +43,7 @@ def clue_number_string_to_duple(in_across, clue_number_string, grid):
     element of that comma separated list and it will return (12,True),
     (3,False) and (5,True) respectively."""
 
-    m = re.search(r'(?ims)(\d+) *(A|D)?', clue_number_string)
+    m = CLUE_NUMBER_RE.search(clue_number_string)
     if m:
         n = int(m.group(1), 10)
         if m.group(2):
@@ -21,20 +53,24 @@ def clue_number_string_to_duple(in_across, clue_number_string, grid):
         else:
             directions = grid.clue_directions(n)
             if len(directions) == 0:
-                raise Exception, "No clue directions found for clue number {0}!".format(n)
+                message = "No clue directions found for clue number {0}!"
+                raise CCJParseError(message.format(n))
             elif len(directions) == 1:
                 # It's unambiguously determined, so use that:
                 across = (directions[0] == 'A')
             else:
-                print "Warning: couldn't determine the direction of clue number {0}, so falling back on the clue group it was in"
+                tracer.warning("Warning: couldn't determine the direction of "
+                               "clue number {0}, so falling back on the clue "
+                               "group it was in", n)
                 across = in_across
         return ( n, across )
     else:
         message = "Couldn't parse clue number string: '{0}'"
-        raise Exception(message.format(clue_number_string))
+        raise CCJParseError(message.format(clue_number_string))
 
-class Cell:
+class Cell(object):
     """A class to represent a particular cell in a crossword grid"""
+    __slots__ = ('letter', 'row', 'column')
     def __init__(self, row, column):
         self.letter = '+'
         self.row = row
@@ -43,7 +79,7 @@ class Cell:
         """A setter method to update what's in the cell"""
         self.letter = l
 
-class Grid:
+class Grid(object):
     """A class to represent all the cells in a crossword grid"""
     def __init__(self, width, height):
         self.width = width
@@ -54,6 +90,7 @@ class Grid:
             for _ in range(self.width):
                 row.append(None)
             self.cells.append(row)
+        self.clue_resolver = None
 
     def to_grid_string(self, empty):
         """Output an ASCII-art representation of the grid"""
@@ -71,46 +108,151 @@ class Grid:
             result = result + row_string + "\n"
         return result
 
+    def light_mask(self):
+        """Return a bytearray with 1 for each light and 0 for each block"""
+        return bytearray(1 if c else 0 for r in self.cells for c in r)
+
+    def letter_bytes(self):
+        """Return a bytearray of the letter in each square"""
+        return bytearray(ord(c.letter) if c else 0x20
+                         for r in self.cells for c in r)
+
     def set_numbers(self):
-        self.clue_numbers = defaultdict(dict)
-        next_number_to_assign = 1
-        for y in range(self.height):
-            for x in range(self.width):
-                cell = self.cells[y][x]
-                if cell is None:
-                    continue
-                cell_left = None
-                cell_right = None
-                cell_above = None
-                cell_below = None
-                if x >= 1:
-                    cell_left = self.cells[y][x - 1]
-                if x < (self.width - 1):
-                    cell_right = self.cells[y][x + 1]
-                if y >= 1:
-                    cell_above = self.cells[y - 1][x]
-                if y < (self.height - 1):
-                    cell_below = self.cells[y + 1][x]
-                # This cell gets a number if:
-                #   - there's no cell to the left, but there is one to the right
-                #       (this is the start of an across entry)
-                #   - or there's no cell above, but there is one below
-                #       (this is the start of a down entry
-                if cell_right and not cell_left:
-                    self.clue_numbers[next_number_to_assign]['across'] = True
-                if cell_below and not cell_above:
-                    self.clue_numbers[next_number_to_assign]['down'] = True
-                if next_number_to_assign in self.clue_numbers:
-                    self.clue_numbers[next_number_to_assign]['x'] = x
-                    self.clue_numbers[next_number_to_assign]['y'] = y
-                    next_number_to_assign += 1
+        """Work out where each clue number and entry in the grid is
+
+        This sets self.numbering to a Numbering, which has every
+        entry in the grid (with its length, cells and answer), and
+        self.clue_numbers, which maps each clue number to a
+        dictionary like {'across': True, 'down': True, 'x': 0, 'y': 0}."""
+        self.numbering = number_grid(self.width,
+                                     self.height,
+                                     self.light_mask(),
+                                     self.letter_bytes())
+        self.clue_numbers = self.numbering.clue_numbers
 
     def clue_directions(self, clue_number):
-        if clue_number not in self.clue_numbers:
-            return []
-        result = []
-        if 'across' in self.clue_numbers[clue_number]:
-            result.append('A')
-        if 'down' in self.clue_numbers[clue_number]:
-            result.append('D')
-        return result
+        """Return a sequence of 'A' and / or 'D' for clue_number"""
+        return self.numbering.directions.get(clue_number, ())
+
+# Translation tables for rendering a CompactGrid's buffers:
+LIGHTS_TO_EMPTY_GRID = bytes(bytearray([0x20, 0x2b] + [0x2b] * 254))
+
+def buffer_to_string(b):
+    """Return a bytes-like object as a str, mapping bytes to code points"""
+    if sys.version_info >= (3, 0):
+        return bytes(b).decode('latin_1')
+    else:
+        return str(b)
+
+class CellView(object):
+    """A lightweight stand-in for a Cell in a CompactGrid
+
+    This has the same interface as Cell, but reads and writes the
+    letter in the grid's buffer, so it only needs to exist for as
+    long as someone is looking at it."""
+    __slots__ = ('grid', 'row', 'column')
+    def __init__(self, grid, row, column):
+        self.grid = grid
+        self.row = row
+        self.column = column
+    def get_letter(self):
+        return chr(self.grid.letters[self.row * self.grid.width + self.column])
+    def set_letter(self, l):
+        """A setter method to update what's in the cell"""
+        self.grid.letters[self.row * self.grid.width + self.column] = ord(l)
+    letter = property(get_letter, set_letter)
+
+class CompactRow(object):
+    """One row of a CompactGrid, indexable like a list of cells"""
+    __slots__ = ('grid', 'y')
+    def __init__(self, grid, y):
+        self.grid = grid
+        self.y = y
+    def __len__(self):
+        return self.grid.width
+    def __getitem__(self, x):
+        if x < 0:
+            x += self.grid.width
+        if not 0 <= x < self.grid.width:
+            raise IndexError("column index out of range")
+        if self.grid.lights[self.y * self.grid.width + x]:
+            return CellView(self.grid, self.y, x)
+        return None
+    def __setitem__(self, x, cell):
+        if x < 0:
+            x += self.grid.width
+        if not 0 <= x < self.grid.width:
+            raise IndexError("column index out of range")
+        i = self.y * self.grid.width + x
+        if cell is None:
+            self.grid.lights[i] = 0
+            self.grid.letters[i] = 0x20
+        else:
+            self.grid.lights[i] = 1
+            self.grid.letters[i] = ord(cell.letter)
+    def __iter__(self):
+        for x in range(self.grid.width):
+            yield self[x]
+
+class CompactRows(object):
+    """The rows of a CompactGrid, indexable like a list of lists"""
+    __slots__ = ('grid',)
+    def __init__(self, grid):
+        self.grid = grid
+    def __len__(self):
+        return self.grid.height
+    def __getitem__(self, y):
+        if y < 0:
+            y += self.grid.height
+        if not 0 <= y < self.grid.height:
+            raise IndexError("row index out of range")
+        return CompactRow(self.grid, y)
+    def __iter__(self):
+        for y in range(self.grid.height):
+            yield CompactRow(self.grid, y)
+
+class CompactGrid(Grid):
+    """A Grid that keeps its cells in flat buffers rather than objects
+
+    lights has one byte per square of the grid, which is 1 for a
+    light and 0 for a blocked-out square; letters has the letter in
+    each light, and a space for each blocked-out square.  The usual
+    cells[y][x] interface still works, but each cell is a CellView
+    that's created on demand, so a parsed puzzle costs a few bytes
+    per square rather than an object per light."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.lights = bytearray(width * height)
+        self.letters = bytearray(b' ' * (width * height))
+        self.cells = CompactRows(self)
+        self.clue_resolver = None
+
+    @classmethod
+    def from_buffers(cls, width, height, lights, letters):
+        """Make a CompactGrid from buffers laid out as described above"""
+        if len(lights) != width * height or len(letters) != width * height:
+            raise Exception("The buffers don't match the grid dimensions")
+        grid = cls(width, height)
+        grid.lights[:] = lights
+        grid.letters[:] = letters
+        return grid
+
+    def light_mask(self):
+        """Return a bytearray with 1 for each light and 0 for each block"""
+        return self.lights
+
+    def letter_bytes(self):
+        """Return a bytearray of the letter in each square"""
+        return self.letters
+
+    def to_grid_string(self, empty):
+        """Output an ASCII-art representation of the grid"""
+        if empty:
+            shown = self.lights.translate(LIGHTS_TO_EMPTY_GRID)
+        else:
+            shown = self.letters
+        shown = buffer_to_string(shown)
+        return "".join(shown[y * self.width:(y + 1) * self.width] + "\n"
+                       for y in range(self.height))
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Recognise the same puzzle arriving from different feeds
+
+Syndicated crosswords turn up in several feeds, under different titles
+and dates, and there's no point converting and storing every copy.  A
+Fingerprint of a parsed crossword has three SHA-256 digests:
+
+  pattern - of the dimensions and the pattern of blocks
+  grid    - of that and the letter in every light
+  clues   - of the clue numbers and text, normalised so that case,
+            punctuation, spacing and control characters don't matter
+
+none of which depend on the title, author, date or copyright.  A
+FingerprintIndex keeps the fingerprint of every puzzle converted in
+an SQLite database, with the digests indexed, so that whether a puzzle
+has been seen before (or one with the same grid but different clues,
+or the same pattern of blocks but different answers) is found with a
+B-tree lookup rather than by going through the corpus.  The database
+can be shared by the worker processes of a batch or by several
+batches; claim() checks for a duplicate and records the new puzzle in
+one transaction.
+
+ccj-to-puz-batch and ccj-to-puz-watch use an index given with
+--fingerprints to skip converting duplicates, and from the command
+line this reports what's already known about some .ccj files:
+
+  ccj-to-puz-duplicates -i fingerprints.db ~/feeds/*/2020-01-02*.ccj
+  ccj-to-puz-duplicates -i fingerprints.db --add ~/feeds/herald"""
+
+from __future__ import print_function
+
+import hashlib
+import os
+import re
+import sqlite3
+import struct
+import sys
+import time
+import unicodedata
+from collections import namedtuple
+from optparse import OptionParser
+
+FINGERPRINT_VERSION = 1
+# SQLite waits this long for another process to finish writing:
+LOCK_TIMEOUT = 60.0
+NOT_WORD_RE = re.compile(r'[\W_]+', re.UNICODE)
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS puzzles (
+           source TEXT PRIMARY KEY,
+           output TEXT,
+           pattern TEXT NOT NULL,
+           grid TEXT NOT NULL,
+           clues TEXT NOT NULL,
+           title TEXT,
+           date_string TEXT,
+           duplicate_of TEXT,
+           added REAL NOT NULL)""",
+    "CREATE INDEX IF NOT EXISTS puzzles_grid ON puzzles (grid, clues)",
+    "CREATE INDEX IF NOT EXISTS puzzles_pattern ON puzzles (pattern)",
+    """CREATE TABLE IF NOT EXISTS settings (
+           name TEXT PRIMARY KEY,
+           value TEXT)"""]
+
+Fingerprint = namedtuple('Fingerprint', ['pattern', 'grid', 'clues'])
+
+IndexedPuzzle = namedtuple('IndexedPuzzle',
+                           ['source', 'output', 'title', 'date_string',
+                            'duplicate_of'])
+
+def normalise_clue_text(text):
+    """Return text lower-cased with everything but words removed"""
+    text = unicodedata.normalize('NFKC', text).lower()
+    return NOT_WORD_RE.sub(' ', text).strip()
+
+def fingerprint(parsed):
+    """Return the Fingerprint of a ParsedCCJ"""
+    dimensions = struct.pack('<HH', parsed.width, parsed.height)
+    lights = bytes(parsed.grid.light_mask())
+    pattern = hashlib.sha256(dimensions)
+    pattern.update(lights)
+    grid = pattern.copy()
+    grid.update(bytes(parsed.grid.letter_bytes()).upper())
+    clues = hashlib.sha256()
+    for list_of_clues in (parsed.across_clues, parsed.down_clues):
+        for clue in list_of_clues.ordered_list_of_clues():
+            line = u"{0}{1} {2}\n".format(
+                clue.number_string,
+                "A" if clue.across else "D",
+                normalise_clue_text(clue.text_including_enumeration))
+            clues.update(line.encode('utf-8'))
+    return Fingerprint(pattern.hexdigest(),
+                       grid.hexdigest(),
+                       clues.hexdigest())
+
+class FingerprintIndex(object):
+    """The fingerprints of the puzzles converted so far, in an SQLite file
+
+    Each puzzle is recorded under its source (the path of the .ccj
+    file, or archive:member), with where it was written and, if it
+    wasn't converted because it's a copy of another, the source of
+    that one."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Transactions are begun explicitly, so that a claim can take
+        # the write lock before looking for a duplicate:
+        self.connection = sqlite3.connect(path,
+                                          timeout=LOCK_TIMEOUT,
+                                          isolation_level=None)
+        # Several worker processes may be creating the index at once:
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+            version = self.setting('version')
+            if version is None:
+                self.set_setting('version', str(FINGERPRINT_VERSION))
+        finally:
+            self.connection.execute("COMMIT")
+        if version not in (None, str(FINGERPRINT_VERSION)):
+            message = "The fingerprint index {0} is version {1}, not {2}"
+            raise Exception(message.format(path, version,
+                                           FINGERPRINT_VERSION))
+
+    def setting(self, name):
+        row = self.connection.execute(
+            "SELECT value FROM settings WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_setting(self, name, value):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO settings (name, value) VALUES (?, ?)",
+            (name, value))
+
+    def query(self, condition, parameters):
+        sql = "SELECT source, output, title, date_string, duplicate_of " + \
+            "FROM puzzles WHERE " + condition + " ORDER BY added, source"
+        return [IndexedPuzzle(*row) for row in
+                self.connection.execute(sql, parameters)]
+
+    def duplicates(self, f, ignore_clues=False):
+        """Return the IndexedPuzzles that were converted with the fingerprint f
+
+        With ignore_clues, any puzzle with the same grid counts."""
+        if ignore_clues:
+            return self.query("grid = ? AND duplicate_of IS NULL",
+                              (f.grid,))
+        return self.query("grid = ? AND clues = ? AND duplicate_of IS NULL",
+                          (f.grid, f.clues))
+
+    def same_grid(self, f):
+        """Return the IndexedPuzzles with the same grid as f but other clues"""
+        return self.query("grid = ? AND clues != ?", (f.grid, f.clues))
+
+    def same_pattern(self, f):
+        """Return the IndexedPuzzles with the same blocks as f but other answers"""
+        return self.query("pattern = ? AND grid != ?", (f.pattern, f.grid))
+
+    def claim(self, f, source, output=None, title=None, date_string=None,
+              ignore_clues=False):
+        """Record the puzzle from source, unless it's a duplicate
+
+        If a puzzle from another source with the fingerprint f (or,
+        with ignore_clues, the same grid) has already been claimed,
+        source is recorded as a duplicate of it and the IndexedPuzzle
+        for that one is returned; otherwise source is recorded as
+        converted to output and None is returned.  (Claiming the same
+        source again, e.g. after it's changed, just replaces it.)"""
+        c = self.connection
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            if ignore_clues:
+                condition = "grid = ?"
+                parameters = (f.grid, source)
+            else:
+                condition = "grid = ? AND clues = ?"
+                parameters = (f.grid, f.clues, source)
+            originals = self.query(condition + " AND duplicate_of IS NULL "
+                                   "AND source != ?", parameters)
+            original = originals[0] if originals else None
+            c.execute("INSERT OR REPLACE INTO puzzles (source, output, "
+                      "pattern, grid, clues, title, date_string, "
+                      "duplicate_of, added) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                      (source,
+                       None if original else output,
+                       f.pattern,
+                       f.grid,
+                       f.clues,
+                       title,
+                       date_string,
+                       original.source if original else None,
+                       time.time()))
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+        c.execute("COMMIT")
+        return original
+
+    def release(self, source):
+        """Forget source, e.g. because its output couldn't be written"""
+        self.connection.execute("DELETE FROM puzzles WHERE source = ?",
+                                (source,))
+
+    def close(self):
+        self.connection.close()
+
+_indexes = {}
+
+def get_index(path):
+    """Return a FingerprintIndex for path shared within this process"""
+    # (A connection mustn't be used in a process forked after it was
+    # opened, so worker processes each get their own.)
+    key = (path, os.getpid())
+    if key not in _indexes:
+        _indexes[key] = FingerprintIndex(path)
+    return _indexes[key]
+
+def claim_for_job(parsed, source, output, metadata):
+    """Claim parsed in the index given in metadata, if there is one
+
+    metadata is as for batch.convert_file, where 'fingerprint_index'
+    is the path of the index and 'ignore_clues' says whether puzzles
+    with the same grid but different clues count as duplicates.
+    Returns the source of the puzzle that parsed duplicates, or
+    None if it should be converted."""
+    if not metadata.get('fingerprint_index'):
+        return None
+    index = get_index(metadata['fingerprint_index'])
+    original = index.claim(fingerprint(parsed),
+                           source,
+                           output,
+                           parsed.title,
+                           parsed.date_string,
+                           metadata.get('ignore_clues', False))
+    return original.source if original else None
+
+def release_for_job(source, metadata):
+    """Undo claim_for_job for source, if its output couldn't be written"""
+    if metadata.get('fingerprint_index'):
+        get_index(metadata['fingerprint_index']).release(source)
+
+def fingerprint_job(job):
+    """Return (source, Fingerprint or error, title, date_string) for a job
+
+    job is as generated by archive.iterate_inputs, with a metadata
+    dictionary added."""
+    from ccj_to_puz.batch import parse_with_metadata
+    source, _, data, metadata = job
+    try:
+        if isinstance(data, Exception):
+            raise data
+        parsed = parse_with_metadata(data, metadata)
+    except Exception as e:
+        return source, "{0}: {1}".format(e.__class__.__name__, e), None, None
+    return source, fingerprint(parsed), parsed.title, parsed.date_string
+
+def main():
+    from ccj_to_puz.archive import iterate_inputs
+    from ccj_to_puz.batch import find_ccj_files, map_in_batches
+    from ccj_to_puz.ccj_parse import ensure_sys_argv_is_decoded
+
+    parser = OptionParser(usage="%prog -i INDEX [options] DIRECTORY-OR-GLOB...")
+    parser.add_option('-i', '--index', dest='index',
+                      help="the fingerprint index to look in")
+    parser.add_option('--add', dest='add', action="store_true",
+                      default=False,
+                      help="add the puzzles to the index as well")
+    parser.add_option('--ignore-clues', dest='ignore_clues',
+                      action="store_true", default=False,
+                      help="count puzzles with the same grid as duplicates "
+                      "even if their clues differ")
+    parser.add_option('-j', '--jobs', dest='jobs', type='int',
+                      help="number of worker processes (default: one per core)")
+
+    ensure_sys_argv_is_decoded()
+    (options, args) = parser.parse_args()
+
+    if not options.index:
+        parser.error("You must specify the index with -i")
+    if not args:
+        parser.error("You must specify at least one directory or glob")
+    input_paths = find_ccj_files(args)
+    if not input_paths:
+        raise Exception("No .ccj files found in: " + ", ".join(args))
+
+    index = FingerprintIndex(options.index)
+    jobs = (source + ({},) for source in iterate_inputs(input_paths))
+    failed = False
+    for source, f, title, date_string in \
+            map_in_batches(fingerprint_job, jobs, options.jobs):
+        if not isinstance(f, Fingerprint):
+            print(u"FAILED {0}: {1}".format(source, f))
+            failed = True
+            continue
+        if options.add:
+            original = index.claim(f, source, None, title, date_string,
+                                   options.ignore_clues)
+            duplicates = [original] if original else []
+        else:
+            duplicates = [p for p in index.duplicates(f, options.ignore_clues)
+                          if p.source != source]
+        found = [("DUPLICATE OF", duplicates)]
+        if not options.ignore_clues:
+            found.append(("SAME GRID AS", index.same_grid(f)))
+        found.append(("SAME BLOCKS AS", index.same_pattern(f)))
+        print(u"{0}: {1}".format(source,
+                                 "already known" if duplicates else "new"))
+        for label, puzzles in found:
+            for p in puzzles:
+                if p.source != source:
+                    print(u"  {0} {1}".format(label, p.source))
+    index.close()
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
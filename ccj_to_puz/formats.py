@@ -0,0 +1,190 @@
+"""Write one parsed crossword out in several formats
+
+Besides AcrossLite .puz, the same crossword can be written as ipuz
+(the JSON format used by most web solvers) and as plain text for
+printing.  Each format is a function registered with @serializer that
+takes a PreparedPuzzle, which has the work that every format needs
+done once: the clues, with the "See N" placeholders added, sorted and
+with their labels and text tidied, and the clue number (if any) of
+each square of the grid.  So to write several formats:
+
+  prepared = PreparedPuzzle(parsed)
+  for name in ('puz', 'ipuz', 'text'):
+      data = prepared.serialize(name)
+
+SERIALIZERS maps the name of each format to a Serializer."""
+
+import json
+import re
+
+SERIALIZERS = {}
+
+IPUZ_VERSION = 'http://ipuz.org/v2'
+IPUZ_KIND = 'http://ipuz.org/crossword#1'
+IPUZ_BLOCK = '#'
+ISO_DATE_RE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})')
+
+class Serializer(object):
+    """A registered output format"""
+    __slots__ = ('name', 'extension', 'content_type', 'function')
+
+    def __init__(self, name, extension, content_type, function):
+        self.name = name
+        self.extension = extension
+        self.content_type = content_type
+        self.function = function
+
+def serializer(name, extension, content_type):
+    """A decorator to register a function as the output format name
+
+    The function is called with a PreparedPuzzle and must return the
+    bytes of the output."""
+    def register(function):
+        SERIALIZERS[name] = Serializer(name, extension, content_type,
+                                       function)
+        return function
+    return register
+
+def serializer_for(name):
+    try:
+        return SERIALIZERS[name]
+    except KeyError:
+        message = "Unknown output format '{0}' (known formats are: {1})"
+        raise Exception(message.format(name,
+                                       ", ".join(sorted(SERIALIZERS))))
+
+class PreparedPuzzle(object):
+    """A ParsedCCJ with what all the output formats need worked out once
+
+    clues is the result of ParsedCCJ.ordered_clues(), and
+    square_numbers has the clue number starting at each square of
+    the grid (y * width + x), or 0."""
+
+    def __init__(self, parsed, checksums=False, verbose=False, stats=None):
+        self.parsed = parsed
+        self.checksums = checksums
+        self.verbose = verbose
+        self.stats = stats
+        if stats is not None:
+            stats.start()
+        self.clues = parsed.ordered_clues(verbose, stats)
+        self.square_numbers = [0] * (parsed.width * parsed.height)
+        for entry in parsed.grid.numbering.entries:
+            self.square_numbers[entry.cells[0]] = entry.number
+        if stats is not None:
+            stats.stage('placeholders')
+
+    def serialize(self, name):
+        """Return the crossword as bytes in the format name"""
+        function = serializer_for(name).function
+        if self.stats is None:
+            return function(self)
+        self.stats.start()
+        result = function(self)
+        # (The .puz writer records its own time.)
+        if name != 'puz':
+            self.stats.stage(name)
+        return result
+
+    def serialize_all(self, names):
+        """Return a dictionary mapping each of names to serialize(name)"""
+        return dict((name, self.serialize(name)) for name in names)
+
+    def rows(self):
+        """Generate the y, the lights and the letters of each row"""
+        parsed = self.parsed
+        width = parsed.width
+        lights = parsed.grid.light_mask()
+        letters = parsed.grid.letter_bytes()
+        for y in range(parsed.height):
+            yield (y,
+                   lights[(y * width):((y + 1) * width)],
+                   letters[(y * width):((y + 1) * width)])
+
+@serializer('puz', '.puz', 'application/x-crossword')
+def puz_bytes(prepared):
+    return prepared.parsed.to_puz_bytes(prepared.verbose,
+                                        prepared.checksums,
+                                        prepared.stats,
+                                        prepared.clues)
+
+def ipuz_clue(clue, label, text):
+    """Return a clue for an ipuz clue list
+
+    A clue whose answer covers several entries lists the others as
+    "continued", and is labelled as it was in the CCJ file."""
+    number = clue.all_clue_numbers[0][0]
+    if len(clue.all_clue_numbers) == 1:
+        return [number, text]
+    return {'number': number,
+            'label': label,
+            'clue': text,
+            'continued': [{'direction': 'Across' if across else 'Down',
+                           'number': n}
+                          for n, across in clue.all_clue_numbers[1:]]}
+
+@serializer('ipuz', '.ipuz', 'application/json')
+def ipuz_bytes(prepared):
+    parsed = prepared.parsed
+    puzzle = []
+    solution = []
+    for y, lights, letters in prepared.rows():
+        start = y * parsed.width
+        puzzle.append([prepared.square_numbers[start + x] if light
+                       else IPUZ_BLOCK
+                       for x, light in enumerate(lights)])
+        solution.append([chr(letter) if light else IPUZ_BLOCK
+                         for light, letter in zip(lights, letters)])
+    clues = {'Across': [], 'Down': []}
+    for clue, label, text in prepared.clues:
+        clues['Across' if clue.across else 'Down'].append(
+            ipuz_clue(clue, label, text))
+    result = {'version': IPUZ_VERSION,
+              'kind': [IPUZ_KIND],
+              'title': parsed.title,
+              'author': parsed.author,
+              'copyright': parsed.copyright_message,
+              'dimensions': {'width': parsed.width,
+                             'height': parsed.height},
+              'block': IPUZ_BLOCK,
+              'empty': 0,
+              'puzzle': puzzle,
+              'solution': solution,
+              'clues': clues}
+    m = ISO_DATE_RE.search(parsed.date_string or '')
+    if m:
+        # ipuz dates are written mm/dd/yyyy:
+        result['date'] = "{1}/{2}/{0}".format(*m.groups())
+    return json.dumps(result, sort_keys=True).encode('utf-8')
+
+@serializer('text', '.txt', 'text/plain; charset=utf-8')
+def text_bytes(prepared):
+    """Return the crossword as plain text, to be printed
+
+    The grid is shown with '#' for blocks and the last digit of the
+    clue number (or '.') in each light, then the clues, and then the
+    solution."""
+    parsed = prepared.parsed
+    lines = [parsed.title, parsed.author, parsed.copyright_message, ""]
+    for y, lights, _ in prepared.rows():
+        start = y * parsed.width
+        row = []
+        for x, light in enumerate(lights):
+            number = prepared.square_numbers[start + x]
+            if not light:
+                row.append('#')
+            elif number:
+                row.append(str(number % 10))
+            else:
+                row.append('.')
+        lines.append(" ".join(row))
+    for across, heading in ((True, "ACROSS"), (False, "DOWN")):
+        lines.extend(["", heading])
+        for clue, label, text in prepared.clues:
+            if clue.across == across:
+                lines.append(label.rjust(6) + "  " + text)
+    lines.extend(["", "SOLUTION"])
+    for _, lights, letters in prepared.rows():
+        lines.append(" ".join(chr(letter) if light else '#'
+                              for light, letter in zip(lights, letters)))
+    return ("\n".join(lines) + "\n").encode('utf-8')
@@ -0,0 +1,47 @@
+"""Helpers for writing files safely when several processes are at work"""
+
+import errno
+import os
+import tempfile
+
+def atomic_write(path, data):
+    """Write data to path so that readers see either all of it or none
+
+    The data is written to a temporary file in the same directory,
+    which is then renamed over path."""
+    directory = os.path.dirname(path) or '.'
+    fd, temporary_path = tempfile.mkstemp(dir=directory,
+                                          prefix='.tmp-',
+                                          suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        replace(temporary_path, path)
+    except:
+        remove_if_present(temporary_path)
+        raise
+
+def replace(source, destination):
+    """Rename source to destination, replacing destination if it exists"""
+    if hasattr(os, 'replace'):
+        os.replace(source, destination)
+    else:
+        os.rename(source, destination)
+
+def remove_if_present(path):
+    """Remove the file at path, returning False if it wasn't there"""
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return False
+        raise
+    return True
+
+def makedirs_if_missing(path):
+    """Create the directory path (and its parents) unless it exists"""
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
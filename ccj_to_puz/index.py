@@ -0,0 +1,663 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""A persistent index for searching a corpus of crosswords
+
+This builds an inverted index over many parsed crosswords and writes
+it to a single file (in the format of packedfile.py) which is then
+memory-mapped for queries, so that searches over years of puzzles
+don't need them to be parsed again, or even the whole index to be
+read.  It covers:
+
+  answers   - every entry in each grid, looked up exactly or by a
+              pattern like "?A?E?" (where '?' or '.' matches any
+              letter), or by length
+  clues     - the words in the tidied text of each clue
+  setters   - the setter of each puzzle (case-insensitively)
+  dates     - the date given for each puzzle, looked up exactly or
+              by range
+
+Each distinct answer is stored once, with the answers ordered by
+length and then alphabetically, and the entries ordered in the same
+way, so that an answer's entries are a contiguous range.  Patterns
+are matched with postings lists of the answers that have each letter
+at each position for each length, intersecting the lists for the
+letters given in the pattern.  Anything other than A to Z shares a
+single code in those postings lists, so the answers found for a
+pattern with such a character in it are checked against the pattern
+itself.
+
+The index is updated by loading it back into an IndexBuilder, adding
+or replacing puzzles, and writing it out again (atomically, so that
+readers never see a partly written index).
+
+From the command line, e.g.:
+
+  ccj-to-puz-index -i crosswords.idx ~/crosswords/*.ccj
+  ccj-to-puz-index -i crosswords.idx -p '?A?E?'
+  ccj-to-puz-index -i crosswords.idx -w 'sailor flower' -s Bloggs"""
+
+from __future__ import print_function
+
+import array
+import os
+import re
+import sys
+from bisect import bisect_left, bisect_right
+from optparse import OptionParser
+
+from ccj_to_puz.archive import iterate_inputs
+from ccj_to_puz.batch import find_ccj_files, map_in_batches, \
+    parse_with_metadata
+from ccj_to_puz.ccj_parse import ensure_sys_argv_is_decoded
+from ccj_to_puz.packedfile import PackedFile, PackedFileError, \
+    PackedFileWriter, StringTable, UINT32, add_strings
+
+INDEX_VERSION = 1
+WORD_RE = re.compile(r'[^\W\d_]+', re.UNICODE)
+DATE_IN_NAME_RE = re.compile(r'\d{4}-\d{2}-\d{2}')
+WILDCARDS = '?.'
+# Answers and positions in them are assumed to be shorter than this,
+# which is as wide as a CCJ grid can be:
+MAXIMUM_LENGTH = 256
+# The letter codes used in the pattern postings: 0 to 25 for A to Z,
+# and this for anything else:
+OTHER_LETTER = 26
+
+def letter_code(c):
+    code = ord(c) - 0x41
+    if 0 <= code < 26:
+        return code
+    return OTHER_LETTER
+
+def pattern_key(length, position, c):
+    return (length * MAXIMUM_LENGTH + position) * (OTHER_LETTER + 1) + \
+        letter_code(c)
+
+def matches_pattern(answer, pattern):
+    """Return True if answer matches pattern, as for answers_matching"""
+    return len(answer) == len(pattern) and \
+        all(p in WILDCARDS or p == a for a, p in zip(answer, pattern))
+
+def words_in(text):
+    """Return the distinct words in text, in lower case"""
+    result = []
+    seen = set()
+    for w in WORD_RE.findall(text.lower()):
+        if w not in seen:
+            seen.add(w)
+            result.append(w)
+    return result
+
+def date_from_name(name):
+    """Return the first YYYY-MM-DD in name, or None"""
+    m = DATE_IN_NAME_RE.search(name)
+    return m and m.group(0)
+
+def intersect(sorted_sequences):
+    """Return a list of the values in all of sorted_sequences
+
+    Each sequence must be sorted; the shortest is checked against the
+    others with a binary search for each of its values."""
+    sorted_sequences = sorted(sorted_sequences, key=len)
+    result = list(sorted_sequences[0])
+    for other in sorted_sequences[1:]:
+        if not result:
+            break
+        n = len(other)
+        kept = []
+        for x in result:
+            i = bisect_left(other, x)
+            if i < n and other[i] == x:
+                kept.append(x)
+        result = kept
+    return result
+
+def puzzle_record(parsed):
+    """Return what the index keeps about a ParsedCCJ as a tuple
+
+    The tuple is (title, setter, puzzle number, date, entries, clues)
+    where entries is a list of (number, across, answer) and clues a
+    list of (number string, across, tidied text)."""
+    entries = [(e.number, e.across, (e.answer or "").upper())
+               for e in parsed.grid.numbering.entries]
+    clues = []
+    for clue_list in (parsed.across_clues, parsed.down_clues):
+        for c in clue_list.ordered_list_of_clues():
+            clues.append((c.number_string,
+                          c.across,
+                          c.tidied_text_including_enumeration()))
+    return (parsed.title or "",
+            parsed.setter or "",
+            parsed.puzzle_number or "",
+            parsed.date_string or "",
+            entries,
+            clues)
+
+def add_postings(writer, name, postings):
+    """Add a dictionary of key to sorted list of ids to a writer"""
+    keys = sorted(postings)
+    offsets = array.array(UINT32, [0])
+    values = array.array(UINT32)
+    for k in keys:
+        values.extend(postings[k])
+        offsets.append(len(values))
+    writer.add_array(name + '_keys', keys)
+    writer.add_array(name + '_offsets', offsets)
+    writer.add_array(name + '_values', values)
+
+def vocabulary_postings(postings):
+    """Turn a dictionary of string to ids into a vocabulary and postings
+
+    Returns a sorted list of the strings, and a dictionary from the
+    index of each string in that list to its ids."""
+    vocabulary = sorted(postings)
+    return vocabulary, dict((i, postings[w]) for i, w in
+                            enumerate(vocabulary))
+
+class Postings(object):
+    """A class for reading a section written by add_postings"""
+    def __init__(self, packed, name):
+        self.keys = packed.array(name + '_keys')
+        self.offsets = packed.array(name + '_offsets')
+        self.values = packed.array(name + '_values')
+
+    def get(self, key):
+        """Return the sorted ids for key, which may be empty"""
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.values[self.offsets[i]:self.offsets[i + 1]]
+        return ()
+
+    def range(self, i):
+        """Return the ids for the i-th key"""
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+class IndexedPuzzle(object):
+    __slots__ = ('id', 'name', 'title', 'setter', 'puzzle_number',
+                 'date_string')
+    def __init__(self, id, name, title, setter, puzzle_number, date_string):
+        self.id = id
+        self.name = name
+        self.title = title
+        self.setter = setter
+        self.puzzle_number = puzzle_number
+        self.date_string = date_string
+
+class IndexedEntry(object):
+    __slots__ = ('id', 'puzzle', 'number', 'across', 'answer')
+    def __init__(self, id, puzzle, number, across, answer):
+        self.id = id
+        self.puzzle = puzzle
+        self.number = number
+        self.across = across
+        self.answer = answer
+
+    def label(self):
+        return "{0}{1}".format(self.number, "A" if self.across else "D")
+
+class IndexedClue(object):
+    __slots__ = ('id', 'puzzle', 'number_string', 'across', 'text')
+    def __init__(self, id, puzzle, number_string, across, text):
+        self.id = id
+        self.puzzle = puzzle
+        self.number_string = number_string
+        self.across = across
+        self.text = text
+
+    def label(self):
+        return self.number_string + ("A" if self.across else "D")
+
+class IndexBuilder(object):
+    """A class for collecting puzzles and writing an index of them"""
+
+    def __init__(self):
+        self.puzzles = {}
+
+    def add(self, name, parsed):
+        """Add (or replace) the ParsedCCJ parsed, known as name"""
+        self.puzzles[name] = puzzle_record(parsed)
+
+    def add_record(self, name, record):
+        """Add (or replace) a tuple as returned by puzzle_record"""
+        self.puzzles[name] = record
+
+    def remove(self, name):
+        self.puzzles.pop(name, None)
+
+    def __len__(self):
+        return len(self.puzzles)
+
+    @classmethod
+    def from_index(cls, index):
+        """Make an IndexBuilder with everything in a CorpusIndex"""
+        builder = cls()
+        for name, record in index.records():
+            builder.add_record(name, record)
+        return builder
+
+    def write(self, path):
+        """Write the index to path, replacing any index there"""
+        writer = PackedFileWriter()
+        writer.add_array('version', [INDEX_VERSION])
+
+        names = sorted(self.puzzles)
+        records = [self.puzzles[n] for n in names]
+        add_strings(writer, 'puzzle_names', names)
+        for i, field in enumerate(('titles', 'setters', 'numbers', 'dates')):
+            add_strings(writer, 'puzzle_' + field, [r[i] for r in records])
+
+        # Order the entries by length and answer, so that each
+        # distinct answer's entries are contiguous:
+        entries = [(len(answer), answer, puzzle_id, number, across)
+                   for puzzle_id, r in enumerate(records)
+                   for number, across, answer in r[4]]
+        entries.sort()
+        answers = []
+        answer_first_entry = array.array(UINT32)
+        for i, e in enumerate(entries):
+            if not answers or answers[-1] != e[1]:
+                answers.append(e[1])
+                answer_first_entry.append(i)
+        answer_first_entry.append(len(entries))
+        add_strings(writer, 'answers', answers)
+        writer.add_array('answer_first_entry', answer_first_entry)
+        writer.add_array('entry_puzzle', [e[2] for e in entries])
+        writer.add_array('entry_number', [e[3] for e in entries])
+        writer.add_array('entry_across', [1 if e[4] else 0 for e in entries],
+                         'B')
+
+        # length_starts[n] is the index of the first answer of length n
+        # or more:
+        longest = max([len(a) for a in answers] or [0])
+        length_starts = array.array(UINT32)
+        i = 0
+        for length in range(longest + 2):
+            while i < len(answers) and len(answers[i]) < length:
+                i += 1
+            length_starts.append(i)
+        writer.add_array('length_starts', length_starts)
+
+        letters = {}
+        for answer_id, answer in enumerate(answers):
+            length = len(answer)
+            if length >= MAXIMUM_LENGTH:
+                continue
+            for position, c in enumerate(answer):
+                key = pattern_key(length, position, c)
+                if key not in letters:
+                    letters[key] = array.array(UINT32)
+                letters[key].append(answer_id)
+        add_postings(writer, 'letters', letters)
+
+        clue_puzzle = array.array(UINT32)
+        clue_across = array.array('B')
+        clue_numbers = []
+        clue_texts = []
+        words = {}
+        for puzzle_id, r in enumerate(records):
+            for number_string, across, text in r[5]:
+                clue_id = len(clue_texts)
+                clue_puzzle.append(puzzle_id)
+                clue_across.append(1 if across else 0)
+                clue_numbers.append(number_string)
+                clue_texts.append(text)
+                for w in words_in(text):
+                    if w not in words:
+                        words[w] = array.array(UINT32)
+                    words[w].append(clue_id)
+        writer.add_array('clue_puzzle', clue_puzzle)
+        writer.add_array('clue_across', clue_across)
+        add_strings(writer, 'clue_numbers', clue_numbers)
+        add_strings(writer, 'clue_texts', clue_texts)
+        vocabulary, postings = vocabulary_postings(words)
+        add_strings(writer, 'words', vocabulary)
+        add_postings(writer, 'word_clues', postings)
+
+        for field, column in (('setters', 1), ('dates', 3)):
+            puzzles_by_value = {}
+            for puzzle_id, r in enumerate(records):
+                value = r[column].lower()
+                if value:
+                    puzzles_by_value.setdefault(value, []).append(puzzle_id)
+            vocabulary, postings = vocabulary_postings(puzzles_by_value)
+            add_strings(writer, field, vocabulary)
+            add_postings(writer, field + '_puzzles', postings)
+
+        writer.write(path)
+
+class CorpusIndex(object):
+    """A memory-mapped index written by IndexBuilder
+
+    The query methods return lists of ids, which can be turned into
+    IndexedPuzzle, IndexedEntry and IndexedClue objects with puzzle,
+    entry and clue.  Close the index with close() when you've
+    finished with it."""
+
+    def __init__(self, path):
+        self.packed = PackedFile(path)
+        try:
+            version = self.packed.array('version')[0]
+            if version != INDEX_VERSION:
+                message = "Unknown index version {0} in {1}"
+                raise PackedFileError(message.format(version, path))
+            self.puzzle_names = StringTable(self.packed, 'puzzle_names')
+            self.puzzle_titles = StringTable(self.packed, 'puzzle_titles')
+            self.puzzle_setters = StringTable(self.packed, 'puzzle_setters')
+            self.puzzle_numbers = StringTable(self.packed, 'puzzle_numbers')
+            self.puzzle_dates = StringTable(self.packed, 'puzzle_dates')
+            self.answers = StringTable(self.packed, 'answers')
+            self.answer_first_entry = self.packed.array('answer_first_entry')
+            self.entry_puzzle = self.packed.array('entry_puzzle')
+            self.entry_number = self.packed.array('entry_number')
+            self.entry_across = self.packed.array('entry_across')
+            self.length_starts = self.packed.array('length_starts')
+            self.letters = Postings(self.packed, 'letters')
+            self.clue_puzzle = self.packed.array('clue_puzzle')
+            self.clue_across = self.packed.array('clue_across')
+            self.clue_numbers = StringTable(self.packed, 'clue_numbers')
+            self.clue_texts = StringTable(self.packed, 'clue_texts')
+            self.words = StringTable(self.packed, 'words')
+            self.word_clues = Postings(self.packed, 'word_clues')
+            self.setters = StringTable(self.packed, 'setters')
+            self.setter_puzzles = Postings(self.packed, 'setters_puzzles')
+            self.dates = StringTable(self.packed, 'dates')
+            self.date_puzzles = Postings(self.packed, 'dates_puzzles')
+        except:
+            self.close()
+            raise
+
+    def close(self):
+        self.packed.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def number_of_puzzles(self):
+        return len(self.puzzle_names)
+
+    def number_of_entries(self):
+        return len(self.entry_puzzle)
+
+    def number_of_clues(self):
+        return len(self.clue_puzzle)
+
+    def puzzle(self, puzzle_id):
+        return IndexedPuzzle(puzzle_id,
+                             self.puzzle_names[puzzle_id],
+                             self.puzzle_titles[puzzle_id],
+                             self.puzzle_setters[puzzle_id],
+                             self.puzzle_numbers[puzzle_id],
+                             self.puzzle_dates[puzzle_id])
+
+    def answer_of_entry(self, entry_id):
+        return self.answers[bisect_right(self.answer_first_entry,
+                                         entry_id) - 1]
+
+    def entry(self, entry_id):
+        return IndexedEntry(entry_id,
+                            self.puzzle(self.entry_puzzle[entry_id]),
+                            self.entry_number[entry_id],
+                            bool(self.entry_across[entry_id]),
+                            self.answer_of_entry(entry_id))
+
+    def clue(self, clue_id):
+        return IndexedClue(clue_id,
+                           self.puzzle(self.clue_puzzle[clue_id]),
+                           self.clue_numbers[clue_id],
+                           bool(self.clue_across[clue_id]),
+                           self.clue_texts[clue_id])
+
+    def entries_of_answers(self, answer_ids):
+        """Return the entry ids for a sequence of answer ids"""
+        result = []
+        first = self.answer_first_entry
+        for a in answer_ids:
+            result.extend(range(first[a], first[a + 1]))
+        return result
+
+    def answer_ids_of_length(self, length):
+        if length + 1 >= len(self.length_starts):
+            return range(0)
+        return range(self.length_starts[length],
+                     self.length_starts[length + 1])
+
+    def answers_matching(self, pattern):
+        """Return the ids of the distinct answers that match pattern
+
+        In pattern, '?' or '.' match any letter, and anything else
+        must match exactly (ignoring case)."""
+        pattern = pattern.upper()
+        length = len(pattern)
+        postings = [self.letters.get(pattern_key(length, position, c))
+                    for position, c in enumerate(pattern)
+                    if c not in WILDCARDS and position < MAXIMUM_LENGTH]
+        if postings:
+            answer_ids = intersect(postings)
+        else:
+            answer_ids = list(self.answer_ids_of_length(length))
+        if length < MAXIMUM_LENGTH and \
+                all(c in WILDCARDS or letter_code(c) != OTHER_LETTER
+                    for c in pattern):
+            return answer_ids
+        # The postings can't tell apart the characters that share
+        # OTHER_LETTER, so check the answers themselves:
+        return [a for a in answer_ids
+                if matches_pattern(self.answers[a], pattern)]
+
+    def match_pattern(self, pattern):
+        """Return the ids of the entries whose answers match pattern"""
+        return self.entries_of_answers(self.answers_matching(pattern))
+
+    def find_answer(self, answer):
+        """Return the ids of the entries with exactly this answer"""
+        answer = answer.upper()
+        ids = self.answer_ids_of_length(len(answer))
+        if not ids:
+            return []
+        i = self.answers.find(answer, ids[0], ids[-1] + 1)
+        if i is None:
+            return []
+        return self.entries_of_answers([i])
+
+    def search_clues(self, words):
+        """Return the ids of the clues that contain all of words
+
+        words may be a list of words or a string to split into words."""
+        if not isinstance(words, (list, tuple)):
+            words = words_in(words)
+        postings = []
+        for w in words:
+            i = self.words.find(w.lower())
+            if i is None:
+                return []
+            postings.append(self.word_clues.range(i))
+        if not postings:
+            return []
+        return intersect(postings)
+
+    def puzzles_by_setter(self, setter):
+        """Return the ids of the puzzles by setter (ignoring case)"""
+        i = self.setters.find(setter.lower())
+        if i is None:
+            return []
+        return list(self.setter_puzzles.range(i))
+
+    def puzzles_by_date(self, start, end=None):
+        """Return the ids of the puzzles dated from start to end
+
+        The dates are strings in the form YYYY-MM-DD; if end is None,
+        only puzzles dated start are returned."""
+        if end is None:
+            end = start
+        lo = self.dates.bisect_left(start)
+        hi = self.dates.bisect_left(end + u'\uffff', lo)
+        result = []
+        for i in range(lo, hi):
+            result.extend(self.date_puzzles.range(i))
+        return sorted(result)
+
+    def records(self):
+        """Generate (name, record) for every puzzle, as for add_record"""
+        entries = [[] for _ in range(self.number_of_puzzles())]
+        for answer_id in range(len(self.answers)):
+            answer = self.answers[answer_id]
+            first = self.answer_first_entry
+            for entry_id in range(first[answer_id], first[answer_id + 1]):
+                entries[self.entry_puzzle[entry_id]].append(
+                    (self.entry_number[entry_id],
+                     bool(self.entry_across[entry_id]),
+                     answer))
+        clues = [[] for _ in range(self.number_of_puzzles())]
+        for clue_id in range(self.number_of_clues()):
+            clues[self.clue_puzzle[clue_id]].append(
+                (self.clue_numbers[clue_id],
+                 bool(self.clue_across[clue_id]),
+                 self.clue_texts[clue_id]))
+        for puzzle_id in range(self.number_of_puzzles()):
+            # Put the entries back into the order of the grid:
+            puzzle_entries = sorted(entries[puzzle_id],
+                                    key=lambda e: (e[0], not e[1]))
+            yield (self.puzzle_names[puzzle_id],
+                   (self.puzzle_titles[puzzle_id],
+                    self.puzzle_setters[puzzle_id],
+                    self.puzzle_numbers[puzzle_id],
+                    self.puzzle_dates[puzzle_id],
+                    puzzle_entries,
+                    clues[puzzle_id]))
+
+def index_job(job):
+    """Parse one input for the index, returning (name, record, error)
+
+    job is as generated by archive.iterate_inputs, with a metadata
+    dictionary (as for batch.convert_file) added."""
+    name, _, data, metadata = job
+    try:
+        if isinstance(data, Exception):
+            raise data
+        if not metadata.get('date_string'):
+            metadata = dict(metadata)
+            metadata['date_string'] = date_from_name(name)
+        parsed = parse_with_metadata(data, metadata)
+        return name, puzzle_record(parsed), None
+    except Exception as e:
+        return name, None, "{0}: {1}".format(e.__class__.__name__, e)
+
+def print_entries(index, entry_ids, limit, out):
+    for entry_id in entry_ids[:limit]:
+        e = index.entry(entry_id)
+        print(u"{0}  {1:5s} {2}  [{3}]".format(e.answer,
+                                              e.label(),
+                                              e.puzzle.title,
+                                              e.puzzle.name), file=out)
+
+def print_clues(index, clue_ids, limit, out):
+    for clue_id in clue_ids[:limit]:
+        c = index.clue(clue_id)
+        print(u"{0:6s} {1}  [{2}]".format(c.label(), c.text, c.puzzle.name),
+              file=out)
+
+def print_puzzles(index, puzzle_ids, limit, out):
+    for puzzle_id in puzzle_ids[:limit]:
+        p = index.puzzle(puzzle_id)
+        print(u"{0:10s}  {1}  [{2}]".format(p.date_string, p.title, p.name),
+              file=out)
+
+def main():
+    parser = OptionParser(usage="%prog -i INDEX [options] [INPUT...]")
+    parser.add_option('-i', '--index', dest='index',
+                      help="the index file to create, update or search")
+    parser.add_option('--rebuild', dest='rebuild', action="store_true",
+                      default=False,
+                      help="start a new index rather than updating it")
+    parser.add_option('-d', '--date', dest='date',
+                      help="the date of the inputs (by default, the first "
+                      "YYYY-MM-DD in each input's name)")
+    parser.add_option('-j', '--jobs', dest='jobs', type='int',
+                      help="number of worker processes for parsing")
+    parser.add_option('-p', '--pattern', dest='pattern',
+                      help="find answers matching a pattern, e.g. ?A?E?")
+    parser.add_option('-A', '--answer', dest='answer',
+                      help="find entries with this answer")
+    parser.add_option('-w', '--words', dest='words',
+                      help="find clues containing all of these words")
+    parser.add_option('-s', '--setter', dest='setter',
+                      help="only puzzles by this setter")
+    parser.add_option('--from', dest='date_from', metavar='DATE',
+                      help="only puzzles dated on or after DATE")
+    parser.add_option('--to', dest='date_to', metavar='DATE',
+                      help="only puzzles dated on or before DATE")
+    parser.add_option('-n', '--limit', dest='limit', type='int', default=50,
+                      help="maximum number of results to show")
+
+    ensure_sys_argv_is_decoded()
+    (options, args) = parser.parse_args()
+
+    if not options.index:
+        parser.error("You must specify the index file with -i")
+
+    out = sys.stdout
+    if args:
+        builder = IndexBuilder()
+        if os.path.exists(options.index) and not options.rebuild:
+            with CorpusIndex(options.index) as index:
+                builder = IndexBuilder.from_index(index)
+        input_paths = find_ccj_files(args)
+        metadata = {'date_string': options.date}
+        jobs = (source + (metadata,) for source in iterate_inputs(input_paths))
+        failures = 0
+        for name, record, error in map_in_batches(index_job,
+                                                  jobs,
+                                                  options.jobs):
+            if error:
+                failures += 1
+                print("FAILED {0}: {1}".format(name, error), file=sys.stderr)
+            else:
+                builder.add_record(name, record)
+        builder.write(options.index)
+        print("Indexed {0} puzzles ({1} failed)".format(len(builder),
+                                                        failures),
+              file=sys.stderr)
+
+    with CorpusIndex(options.index) as index:
+        puzzle_ids = None
+        if options.setter:
+            puzzle_ids = set(index.puzzles_by_setter(options.setter))
+        if options.date_from or options.date_to:
+            dated = set(index.puzzles_by_date(options.date_from or u"",
+                                              options.date_to or u"\uffff"))
+            puzzle_ids = dated if puzzle_ids is None else puzzle_ids & dated
+
+        def in_puzzles(ids, puzzle_of):
+            if puzzle_ids is None:
+                return ids
+            return [i for i in ids if puzzle_of[i] in puzzle_ids]
+
+        if options.pattern:
+            print_entries(index,
+                          in_puzzles(index.match_pattern(options.pattern),
+                                     index.entry_puzzle),
+                          options.limit,
+                          out)
+        if options.answer:
+            print_entries(index,
+                          in_puzzles(index.find_answer(options.answer),
+                                     index.entry_puzzle),
+                          options.limit,
+                          out)
+        if options.words:
+            print_clues(index,
+                        in_puzzles(index.search_clues(options.words),
+                                   index.clue_puzzle),
+                        options.limit,
+                        out)
+        if puzzle_ids is not None and not (options.pattern or
+                                           options.answer or
+                                           options.words):
+            print_puzzles(index, sorted(puzzle_ids), options.limit, out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Parse CCJ crosswords lazily, decoding each section only when it's used
+
+For cataloguing or deduplicating a feed you often only need the
+dimensions, the setter and puzzle number (which come from the label
+of the across clues) or the shape of the grid, and decoding all the
+clues and grids to get those is wasted work.  LazyParsedCCJ has the
+same interface as ParsedCCJ, but read_from_bytes just finds where
+each section of the file starts (see locate_sections) and decodes the
+label of the across clues; each of these is then only decoded when
+it's first used:
+
+  button_labels, congratulations_message
+  grid (the blocks and answers, with the clue numbering)
+  hint_digits
+  across_clues, down_clues
+
+metadata_only is a shortcut for making one of these."""
+
+from ccj_to_puz.ccj_parse import ParsedCCJ, BLOCKS_TO_LIGHTS, \
+    byte_view, locate_sections, parse_list_of_clues, read_string
+
+def lazy_attribute(name):
+    """Make a property for name that decodes its section when first used"""
+    def get(self):
+        if name not in self.lazy_values and self.data is not None:
+            self.decode(name)
+        return self.lazy_values.get(name)
+    def set(self, value):
+        self.lazy_values[name] = value
+    return property(get, set)
+
+class LazyParsedCCJ(ParsedCCJ):
+    """A ParsedCCJ that only decodes each section when it's first used"""
+
+    button_labels = lazy_attribute('button_labels')
+    congratulations_message = lazy_attribute('congratulations_message')
+    grid = lazy_attribute('grid')
+    hint_digits = lazy_attribute('hint_digits')
+    across_clues = lazy_attribute('across_clues')
+    down_clues = lazy_attribute('down_clues')
+
+    def __init__(self):
+        self.data = None
+        self.sections = None
+        self.lazy_values = {}
+        self.verbose = False
+        ParsedCCJ.__init__(self)
+
+    def read_from_bytes(self,
+                        data,
+                        title,
+                        author,
+                        puzzle_number,
+                        copyright_message,
+                        date_string,
+                        verbose=False,
+                        stats=None):
+        """Find the sections of the CCJ crossword in data
+
+        Only the dimensions and the label of the across clues are
+        decoded here, to work out the metadata."""
+        if stats is not None:
+            stats.start()
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        self.data = data
+        self.verbose = verbose
+        self.encodings_used = {}
+        # (This also forgets the values set by ParsedCCJ.__init__.)
+        self.lazy_values = {}
+        self.sections = locate_sections(data)
+        self.width = self.sections.width
+        self.height = self.sections.height
+        if stats is not None:
+            stats.count('bytes_skipped_before_grid',
+                        self.sections.bytes_skipped_before_grid)
+            stats.stage('header')
+        self.set_metadata(title,
+                          author,
+                          puzzle_number,
+                          copyright_message,
+                          date_string)
+        if stats is not None:
+            stats.count('puzzles_located')
+            stats.stage('metadata')
+
+    def across_label(self):
+        if 'across_clues' in self.lazy_values or self.data is None:
+            return self.across_clues.label
+        # The label will be decoded again with the rest of the clues,
+        # so don't count its encoding here:
+        return read_string(byte_view(self.data),
+                           self.sections.across_clues)[0]
+
+    def light_mask(self):
+        """Return the shape of the grid as one byte (1 or 0) per square
+
+        This only needs the pattern of blocks, so unlike self.grid
+        it doesn't decode the answers or work out the numbering."""
+        if 'grid' in self.lazy_values or self.data is None:
+            return self.grid.light_mask()
+        i = self.sections.block_grid
+        return bytearray(self.data[i:(i + self.width * self.height)]
+                         .translate(BLOCKS_TO_LIGHTS))
+
+    def decode(self, name):
+        """Decode the section of the file that name is part of"""
+        sections = self.sections
+        if name in ('button_labels', 'congratulations_message'):
+            self.read_messages(byte_view(self.data), sections, self.verbose)
+        elif name == 'grid':
+            lights = self.read_block_grid(self.data, sections, self.verbose)
+            self.read_answers(self.data, sections, lights)
+            self.grid.set_numbers()
+        elif name == 'hint_digits':
+            self.read_hint_grid(self.data, sections, self.verbose)
+        else:
+            # Either list of clues:
+            if name == 'across_clues':
+                start = sections.across_clues
+            else:
+                start = sections.locate_down_clues(self.data)
+            # The numbering of the grid is needed to work out the
+            # directions of the clues:
+            self.lazy_values[name] = \
+                parse_list_of_clues(byte_view(self.data),
+                                    start,
+                                    self.grid,
+                                    self.verbose,
+                                    self.encodings_used)[0]
+
+def metadata_only(data,
+                  title=None,
+                  author=None,
+                  puzzle_number=None,
+                  copyright_message=None,
+                  date_string=None):
+    """Return a LazyParsedCCJ for data with just its metadata decoded
+
+    The title, setter, puzzle number, width and height are available
+    straight away; anything else is decoded if it's used."""
+    parsed = LazyParsedCCJ()
+    parsed.read_from_bytes(data,
+                           title,
+                           author,
+                           puzzle_number,
+                           copyright_message,
+                           date_string)
+    return parsed
@@ -0,0 +1,277 @@
+"""A simple file format of named binary sections that can be memory-mapped
+
+The index (index.py) and columnar store (columnar.py) are kept in
+files of this format, so that opening one is just an mmap and reading
+a table of contents, and the arrays in it are used in place rather
+than being loaded into memory.
+
+The file starts with a header:
+
+  8 bytes   the magic string MAGIC
+  1 byte    'l' or 'b' for the byte order the arrays were written in
+  3 bytes   padding
+  4 bytes   the number of sections (little-endian, as are all the
+            numbers in the header and table of contents)
+
+... followed by a table of contents with an entry for each section:
+
+  24 bytes  the section name, ASCII padded with NULs
+  1 byte    the array typecode ('B', 'I', etc.) or 'x' for raw bytes
+  7 bytes   padding
+  8 bytes   the offset of the section from the start of the file
+  8 bytes   the length of the section in bytes
+
+Each section starts on an 8 byte boundary.  Arrays are written in
+the byte order of the machine that wrote them, and are only used in
+place if that's also the byte order of the machine reading them (and
+the Python supports memoryview.cast); otherwise they're copied into
+an array.array."""
+
+import array
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from ccj_to_puz.fsutil import remove_if_present, replace
+
+MAGIC = b'CCJPACK1'
+HEADER = struct.Struct('<8sc3xI')
+SECTION = struct.Struct('<24sc7xQQ')
+ALIGNMENT = 8
+MAXIMUM_NAME_LENGTH = 24
+RAW = 'x'
+
+# The typecode of an array of unsigned 32 bit integers:
+UINT32 = 'I' if array.array('I').itemsize == 4 else 'L'
+
+BYTE_ORDER = b'l' if sys.byteorder == 'little' else b'b'
+
+class PackedFileError(Exception):
+    pass
+
+def padding_for(offset):
+    return (ALIGNMENT - offset % ALIGNMENT) % ALIGNMENT
+
+class PackedFileWriter(object):
+    """A class for collecting sections and writing them to a file"""
+
+    def __init__(self):
+        self.sections = []
+        self.names = set()
+
+    def add(self, name, typecode, data):
+        if name in self.names:
+            raise PackedFileError("Duplicate section name: " + name)
+        if len(name.encode('ascii')) > MAXIMUM_NAME_LENGTH:
+            raise PackedFileError("Section name too long: " + name)
+        self.names.add(name)
+        self.sections.append((name, typecode, data))
+
+    def add_array(self, name, values, typecode=UINT32):
+        """Add a section with the array values (or a list to make one)"""
+        if not isinstance(values, array.array):
+            values = array.array(typecode, values)
+        self.add(name, values.typecode, values)
+
+    def add_bytes(self, name, data):
+        if not isinstance(data, (bytes, bytearray)):
+            data = bytes(data)
+        self.add(name, RAW, data)
+
+    def write(self, path):
+        """Write all the sections to path, replacing it atomically"""
+        directory = os.path.dirname(path) or '.'
+        fd, temporary_path = tempfile.mkstemp(dir=directory,
+                                              prefix='.tmp-',
+                                              suffix=os.path.basename(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                self.write_to(f)
+            replace(temporary_path, path)
+        except:
+            remove_if_present(temporary_path)
+            raise
+
+    def write_to(self, f):
+        offset = HEADER.size + SECTION.size * len(self.sections)
+        table = []
+        for name, typecode, data in self.sections:
+            offset += padding_for(offset)
+            length = len(data) * (data.itemsize
+                                  if isinstance(data, array.array) else 1)
+            table.append(SECTION.pack(name.encode('ascii'),
+                                      typecode.encode('ascii'),
+                                      offset,
+                                      length))
+            offset += length
+        f.write(HEADER.pack(MAGIC, BYTE_ORDER, len(self.sections)))
+        f.write(b''.join(table))
+        position = HEADER.size + SECTION.size * len(self.sections)
+        for name, typecode, data in self.sections:
+            padding = padding_for(position)
+            f.write(b'\0' * padding)
+            position += padding
+            if isinstance(data, array.array):
+                data.tofile(f)
+                position += len(data) * data.itemsize
+            else:
+                f.write(data)
+                position += len(data)
+
+class StringsWriter(object):
+    """A class for building a table of strings to add to a writer
+
+    The strings are kept encoded as UTF-8, one after another, with
+    an array of the offset of each; StringTable reads them back."""
+    def __init__(self):
+        self.offsets = array.array(UINT32, [0])
+        self.text = bytearray()
+
+    def append(self, s):
+        self.text.extend(s.encode('utf-8'))
+        self.offsets.append(len(self.text))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def add_to(self, writer, name):
+        writer.add_array(name + '_offsets', self.offsets)
+        writer.add_bytes(name + '_text', self.text)
+
+def add_strings(writer, name, strings):
+    """Add a section of strings to a PackedFileWriter, as UTF-8"""
+    strings_writer = StringsWriter()
+    for s in strings:
+        strings_writer.append(s)
+    strings_writer.add_to(writer, name)
+
+class PackedFile(object):
+    """A read-only, memory-mapped view of a file written by PackedFileWriter
+
+    Use array(name) for a section written as an array, and
+    raw(name) for one written as bytes; both return sequences that
+    index and slice like the original without copying where
+    possible.  Close the file with close() when finished with it."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            self.mapped = mmap.mmap(self.file.fileno(), 0,
+                                    access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            self.file.close()
+            raise PackedFileError("Couldn't map " + path)
+        self.table = {}
+        self.views = []
+        self.read_table_of_contents()
+
+    def read_table_of_contents(self):
+        if len(self.mapped) < HEADER.size:
+            raise PackedFileError("Too short to be a packed file: " +
+                                  self.path)
+        magic, byte_order, count = HEADER.unpack_from(self.mapped, 0)
+        if magic != MAGIC:
+            raise PackedFileError("Not a packed file: " + self.path)
+        self.byte_order = byte_order
+        for k in range(count):
+            name, typecode, offset, length = \
+                SECTION.unpack_from(self.mapped,
+                                    HEADER.size + k * SECTION.size)
+            if offset + length > len(self.mapped):
+                raise PackedFileError("Truncated packed file: " + self.path)
+            name = name.rstrip(b'\0').decode('ascii')
+            self.table[name] = (typecode.decode('ascii'), offset, length)
+
+    def __contains__(self, name):
+        return name in self.table
+
+    def section(self, name):
+        try:
+            return self.table[name]
+        except KeyError:
+            raise PackedFileError("No section {0} in {1}".format(name,
+                                                                 self.path))
+
+    def raw(self, name):
+        """Return the bytes of a section"""
+        _, offset, length = self.section(name)
+        if sys.version_info < (3, 0):
+            return self.mapped[offset:(offset + length)]
+        view = memoryview(self.mapped)[offset:(offset + length)]
+        self.views.append(view)
+        return view
+
+    def array(self, name):
+        """Return the array in a section, in place if possible"""
+        typecode, offset, length = self.section(name)
+        if typecode == RAW:
+            raise PackedFileError("Section {0} isn't an array".format(name))
+        if sys.version_info >= (3, 0) and self.byte_order == BYTE_ORDER:
+            view = memoryview(self.mapped)[offset:(offset + length)]
+            view = view.cast(typecode)
+            self.views.append(view)
+            return view
+        result = array.array(typecode)
+        data = self.mapped[offset:(offset + length)]
+        if hasattr(result, 'frombytes'):
+            result.frombytes(data)
+        else:
+            result.fromstring(data)
+        if self.byte_order != BYTE_ORDER:
+            result.byteswap()
+        return result
+
+    def close(self):
+        """Unmap the file
+
+        Any slices you've taken of the sections must have been
+        released (or garbage collected) first."""
+        # The mmap can't be closed while there are views of it:
+        for view in self.views:
+            view.release()
+        self.views = []
+        self.mapped.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class StringTable(object):
+    """A class for reading a section written by add_strings"""
+    def __init__(self, packed, name):
+        self.offsets = packed.array(name + '_offsets')
+        self.text = packed.raw(name + '_text')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return bytes(self.text[start:end]).decode('utf-8')
+
+    def bisect_left(self, s, lo=0, hi=None):
+        """Find where s would go, if the strings are in sorted order"""
+        if hi is None:
+            hi = len(self)
+        while lo < hi:
+            middle = (lo + hi) // 2
+            if self[middle] < s:
+                lo = middle + 1
+            else:
+                hi = middle
+        return lo
+
+    def find(self, s, lo=0, hi=None):
+        """Return the index of s in a sorted table, or None"""
+        if hi is None:
+            hi = len(self)
+        i = self.bisect_left(s, lo, hi)
+        if i < hi and self[i] == s:
+            return i
+        return None
@@ -0,0 +1,230 @@
+"""Read AcrossLite .puz files back into the same model as ParsedCCJ
+
+This is mainly so that the output of the converter can be checked
+(see verify.py), but it reads any .puz file with the usual layout:
+
+  0x00  the global checksum, the file magic, the CIB checksum, the
+        masked checksums and the version (all zero in files written
+        without checksums)
+  0x2C  the width, height, number of clues, bitmask and scrambled tag
+  0x34  the solution, with '.' for blocks, then the player's grid
+        (with '-' for empty lights), each width * height bytes
+        then NUL-terminated strings: the title, author, copyright,
+        each of the clues and the notes
+
+Anything after the notes (e.g. the extra sections for rebuses or
+circled squares) is ignored.  The header is unpacked with a single
+struct, the grids are sliced from a memoryview of the file, and the
+strings are found with one pass of find() for their NULs.
+
+Clues written by ParsedCCJ start with their label in square brackets,
+e.g. "[4,12d] ...", which is read back as the clue's number_string and
+used to match the clue to its entry in the grid.  Clues without labels
+are matched in the usual order of a .puz file: by clue number, with
+across before down."""
+
+import re
+import struct
+
+from ccj_to_puz.ccj_parse import ListOfClues, ParsedCCJ, ParsedClue
+from ccj_to_puz.commonccj import CCJParseError, CompactGrid
+from ccj_to_puz.puzchecksums import FILE_MAGIC, MASK, checksum_region
+
+# The global checksum, magic, CIB checksum, masked checksums, version,
+# scrambled checksum, width, height, number of clues, bitmask and
+# scrambled tag:
+PUZ_HEADER = struct.Struct('<H12sH8s4s2xH12xBBhHH')
+CIB_OFFSET = 0x2C
+CIB_SIZE = 8
+SOLUTION_TO_LIGHTS = bytes(bytearray(0 if c == 0x2e else 1
+                                     for c in range(256)))
+SOLUTION_TO_LETTERS = bytes(bytearray(0x20 if c == 0x2e else c
+                                      for c in range(256)))
+LABELLED_CLUE_RE = re.compile(r'(?s)^\[([^\]]*)\] (.*)$')
+# The first number of a label, and its direction if it has one:
+LABEL_RE = re.compile(r'^\s*(\d+)\s*([ad])?', re.IGNORECASE)
+
+class PuzReadError(Exception):
+    pass
+
+def decode_puz_string(b):
+    """Decode a string from a .puz file
+
+    ParsedCCJ writes UTF-8, but the format was defined with
+    ISO-8859-1, so fall back to that."""
+    try:
+        return b.decode('utf_8')
+    except UnicodeDecodeError:
+        return b.decode('latin_1')
+
+class ParsedPuz(ParsedCCJ):
+    """A crossword read from a .puz file
+
+    As well as the attributes of ParsedCCJ, this has
+    number_of_clues (from the header), notes, player_grid (the bytes
+    of the grid the solver fills in), has_checksums (True if the file
+    has the magic string in its header), bad_checksums, a list of
+    the names of any checksums that don't match, and unmatched_clues,
+    the strings of any clues beyond one for each entry."""
+
+    def __init__(self):
+        ParsedCCJ.__init__(self)
+        self.number_of_clues = None
+        self.notes = None
+        self.player_grid = None
+        self.has_checksums = False
+        self.bad_checksums = []
+        self.unmatched_clues = []
+
+    def read_from_bytes(self, data, verify_checksums=True):
+        """Read the .puz file whose whole contents are data"""
+        if not isinstance(data, bytes):
+            data = bytes(bytearray(data))
+        view = memoryview(data)
+        if len(data) < PUZ_HEADER.size:
+            raise PuzReadError("Too short for a .puz header")
+        (global_checksum, magic, cib_checksum, masked, _, _,
+         self.width, self.height, self.number_of_clues, _, _) = \
+            PUZ_HEADER.unpack_from(data, 0)
+        self.has_checksums = magic == FILE_MAGIC
+
+        size = self.width * self.height
+        i = PUZ_HEADER.size
+        if len(data) < i + 2 * size:
+            raise PuzReadError("The file ended in the middle of the grids")
+        solution = view[i:(i + size)]
+        grid = view[(i + size):(i + 2 * size)]
+        i += 2 * size
+
+        strings = []
+        for _ in range(self.number_of_clues + 4):
+            end = data.find(b'\x00', i)
+            if end < 0:
+                message = "The file ended in the middle of a string at {0}"
+                raise PuzReadError(message.format(i))
+            strings.append(view[i:end])
+            i = end + 1
+
+        if self.has_checksums and verify_checksums:
+            self.check_checksums(data, solution, grid, strings,
+                                 global_checksum, cib_checksum, masked)
+
+        solution = solution.tobytes()
+        self.player_grid = grid.tobytes()
+        self.grid = CompactGrid.from_buffers(
+            self.width,
+            self.height,
+            bytearray(solution.translate(SOLUTION_TO_LIGHTS)),
+            bytearray(solution.translate(SOLUTION_TO_LETTERS)))
+        self.grid.set_numbers()
+
+        strings = [decode_puz_string(s.tobytes()) for s in strings]
+        self.title, self.author, self.copyright_message = strings[:3]
+        self.notes = strings[-1]
+        self.read_clues(strings[3:-1])
+
+    def read_clues(self, clue_strings):
+        """Match the clues to the entries of the grid by their labels
+
+        Each clue goes to the entry named by the first number (and
+        direction, if there is one) of its label, or if that entry
+        already has a clue, to the first entry with that number that
+        doesn't.  A clue without a label, or whose label doesn't
+        name a free entry, goes to the next free entry in the order
+        of the grid.  Any clues left over when every entry has one
+        are kept in unmatched_clues."""
+        entries = self.grid.numbering.entries
+        free = dict(((entry.number, entry.across), entry)
+                    for entry in entries)
+        self.across_clues = ListOfClues()
+        self.across_clues.across = True
+        self.down_clues = ListOfClues()
+        self.down_clues.across = False
+        self.unmatched_clues = []
+        k = 0
+        for s in clue_strings:
+            m = LABELLED_CLUE_RE.search(s)
+            if m:
+                label, text = m.groups()
+            else:
+                label, text = None, s
+            entry = self.entry_for_label(label, free)
+            if entry is None:
+                while k < len(entries) and \
+                        (entries[k].number, entries[k].across) not in free:
+                    k += 1
+                if k == len(entries):
+                    self.unmatched_clues.append(s)
+                    continue
+                entry = entries[k]
+            del free[(entry.number, entry.across)]
+            clue = ParsedClue()
+            clue.across = entry.across
+            clue.text_including_enumeration = text
+            if label is None:
+                label = str(entry.number)
+            try:
+                clue.set_number(label, self.grid)
+            except CCJParseError:
+                clue.number_string = label
+                clue.all_clue_numbers = [(entry.number, entry.across)]
+            clue.start_coordinates = [(entry.x, entry.y)]
+            clues = self.across_clues if entry.across else self.down_clues
+            clues.clue_dictionary[entry.number] = clue
+        for clues in (self.across_clues, self.down_clues):
+            clues.number_of_clues = len(clues.clue_dictionary)
+
+    @staticmethod
+    def entry_for_label(label, free):
+        """Return the free entry that label names, or None"""
+        m = label and LABEL_RE.search(label)
+        if not m:
+            return None
+        number = int(m.group(1))
+        if m.group(2):
+            directions = [m.group(2).lower() == 'a']
+        else:
+            directions = [True, False]
+        for across in directions:
+            entry = free.get((number, across))
+            if entry is not None:
+                return entry
+        return None
+
+    def check_checksums(self, data, solution, grid, strings,
+                        global_checksum, cib_checksum, masked):
+        """Recompute the checksums, adding any that differ to bad_checksums"""
+        cib = checksum_region(data[CIB_OFFSET:(CIB_OFFSET + CIB_SIZE)])
+        total = checksum_region(grid, checksum_region(solution, cib))
+        text = 0
+        for k, s in enumerate(strings):
+            s = s.tobytes()
+            # The title, author, copyright and notes include their
+            # NULs (and are left out if they're empty), but the clues
+            # don't:
+            if k < 3 or k == len(strings) - 1:
+                if not s:
+                    continue
+                s += b'\x00'
+            text = checksum_region(s, text)
+            total = checksum_region(s, total)
+        parts = [cib, checksum_region(solution), checksum_region(grid), text]
+        expected_masked = bytearray(
+            [MASK[k] ^ (c & 0xff) for k, c in enumerate(parts)] +
+            [MASK[k + 4] ^ (c >> 8) for k, c in enumerate(parts)])
+        if cib != cib_checksum:
+            self.bad_checksums.append('cib')
+        if total != global_checksum:
+            self.bad_checksums.append('global')
+        if bytearray(masked) != expected_masked:
+            self.bad_checksums.append('masked')
+
+def read_puz_bytes(data, verify_checksums=True):
+    """Return a ParsedPuz for the .puz file whose contents are data"""
+    parsed = ParsedPuz()
+    parsed.read_from_bytes(data, verify_checksums)
+    return parsed
+
+def read_puz_file(filename, verify_checksums=True):
+    with open(filename, 'rb') as f:
+        return read_puz_bytes(f.read(), verify_checksums)
@@ -0,0 +1,90 @@
+"""Checksums for the AcrossLite .puz format
+
+A .puz file has a checksum of the CIB (the eight bytes of the header
+with the dimensions and the number of clues), a global checksum over
+the CIB, both grids and the strings, and a "masked" checksum made of
+the checksums of each of those parts XORed with "ICHEATED".  Details
+can be found here: http://joshisanerd.com/puz/
+
+The checksums are all built from the same 16 bit routine, which rotates
+the checksum right by one bit and then adds the next byte.  Since the
+rotation only depends on the current checksum, it's looked up in a
+table rather than computed, which roughly halves the time per byte."""
+
+import struct
+
+ROTATE_RIGHT = None
+
+def rotate_right_table():
+    """Return a list mapping each 16 bit value to it rotated right by 1"""
+    global ROTATE_RIGHT
+    if ROTATE_RIGHT is None:
+        ROTATE_RIGHT = [(c >> 1) | ((c & 1) << 15) for c in range(0x10000)]
+    return ROTATE_RIGHT
+
+def checksum_region(data, cksum=0):
+    """Return the .puz checksum of data, starting from cksum"""
+    rotate_right = rotate_right_table()
+    for b in bytearray(data):
+        cksum = (rotate_right[cksum] + b) & 0xffff
+    return cksum
+
+FILE_MAGIC = b'ACROSS&DOWN\x00'
+FILE_MAGIC_OFFSET = 0x02
+VERSION = b'1.3\x00'
+VERSION_OFFSET = 0x18
+CIB_OFFSET = 0x2C
+CIB_SIZE = 8
+CHECKSUMS = struct.Struct('<H12xH8B')
+MASK = bytearray(b'ICHEATED')
+
+class PuzChecksums(object):
+    """Accumulates the checksums of a .puz file as it's assembled
+
+    Each part of the file should be passed to the corresponding
+    add_* method as it's written, in the order it appears in the
+    file; write_header() then fills in the checksums, the file magic
+    and the version in the header."""
+
+    def __init__(self):
+        self.cib = 0
+        self.solution = 0
+        self.grid = 0
+        self.strings = 0
+        self.global_checksum = 0
+
+    def add_cib(self, data):
+        self.cib = checksum_region(data)
+        self.global_checksum = self.cib
+
+    def add_solution(self, data):
+        self.solution = checksum_region(data)
+        self.global_checksum = checksum_region(data, self.global_checksum)
+
+    def add_grid(self, data):
+        self.grid = checksum_region(data)
+        self.global_checksum = checksum_region(data, self.global_checksum)
+
+    def add_string(self, data, include_nul=True):
+        """Add one of the strings after the grids
+
+        The title, author, copyright and notes are checksummed with
+        their terminating NUL (and not at all if they're empty),
+        while clues are checksummed without it."""
+        if include_nul:
+            if not data:
+                return
+            data = data + b'\x00'
+        self.strings = checksum_region(data, self.strings)
+        self.global_checksum = checksum_region(data, self.global_checksum)
+
+    def write_header(self, output):
+        """Fill in the checksums and magic strings in the header"""
+        parts = (self.cib, self.solution, self.grid, self.strings)
+        masked = [MASK[k] ^ (c & 0xff) for k, c in enumerate(parts)]
+        masked += [MASK[k + 4] ^ (c >> 8) for k, c in enumerate(parts)]
+        CHECKSUMS.pack_into(output, 0,
+                            self.global_checksum, self.cib, *masked)
+        output[FILE_MAGIC_OFFSET:(FILE_MAGIC_OFFSET + len(FILE_MAGIC))] = \
+            FILE_MAGIC
+        output[VERSION_OFFSET:(VERSION_OFFSET + len(VERSION))] = VERSION
@@ -0,0 +1,159 @@
+"""Resolve clue numbers against a grid, and link clues to their entries
+
+A clue whose answer covers several entries in the grid is labelled
+with all their numbers, e.g. "4/12" or, in the Independent from
+2013-11-14, "33/16/12/2A/28D".  A ClueResolver is made once for each
+numbered grid (see resolver_for) and:
+
+  - resolves each part of such a label to a (number, across) pair,
+    remembering the answer for each part, since themed puzzles with
+    many linked entries repeat the same parts across lots of clues
+  - indexes every entry of the grid to the clue whose answer covers
+    it (clue_for_entry), in one pass over the clues
+  - checks the start coordinates read with each clue against where
+    the grid says its entries start (they've only been seen counting
+    from 0, but counting from 1 is recognised too, with a warning)
+  - adds the "See N" placeholder clues that the .puz format needs for
+    entries that are only part of another clue's answer"""
+
+import re
+
+from ccj_to_puz.commonccj import clue_number_string_to_duple
+from ccj_to_puz.tracing import get_tracer
+
+tracer = get_tracer('resolver')
+
+NUMBER_SEPARATOR_RE = re.compile(r'[,/]')
+
+class ClueResolver(object):
+    """The clue numbers of one numbered grid, and the clues for its entries
+
+    After with_placeholders has been called, clue_for_entry maps each
+    (number, across) in the grid that some clue covers to that clue,
+    coordinate_base is 0 or 1 depending on how the clues' start
+    coordinates seem to count, and mismatched_starts is a list of
+    (clue, (number, across), coordinates read, coordinates expected)
+    for any that didn't match."""
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.numbering = grid.numbering
+        self.resolved_parts = {}
+        self.clue_for_entry = {}
+        self.coordinate_base = 0
+        self.mismatched_starts = []
+
+    def resolve(self, in_across, clue_number_string):
+        """Return the (number, across) of each part of clue_number_string
+
+        in_across says which list the clue is in, for when a number
+        that starts both an across and a down entry isn't marked with
+        A or D."""
+        result = []
+        for part in NUMBER_SEPARATOR_RE.split(clue_number_string):
+            key = (in_across, part)
+            duple = self.resolved_parts.get(key)
+            if duple is None:
+                duple = clue_number_string_to_duple(in_across, part,
+                                                    self.grid)
+                self.resolved_parts[key] = duple
+            result.append(duple)
+        return result
+
+    def check_start_coordinates(self, starts, stats=None):
+        """Compare the start coordinates read with those of the grid
+
+        starts is a list of (clue, (number, across), (x, y)) for the
+        coordinates read with each clue.  If stats is a ParseStats, it
+        counts the puzzles whose coordinates count from 1."""
+        self.coordinate_base = 0
+        self.mismatched_starts = []
+        if not starts:
+            return
+        expected = [(s[0], s[1], s[2], (entry.x, entry.y)) for s in starts
+                    for entry in [self.numbering.entry(*s[1])]
+                    if entry is not None]
+        def mismatches(base):
+            return [(clue, duple, read, (x + base, y + base))
+                    for clue, duple, read, (x, y) in expected
+                    if read != (x + base, y + base)]
+        self.mismatched_starts = mismatches(0)
+        if self.mismatched_starts:
+            counting_from_one = mismatches(1)
+            if len(counting_from_one) < len(self.mismatched_starts):
+                tracer.warning("Warning: the start coordinates of the clues "
+                               "seem to count from 1 rather than 0")
+                self.coordinate_base = 1
+                self.mismatched_starts = counting_from_one
+                if stats is not None:
+                    stats.count('start_coordinates_from_one')
+        for clue, (number, across), read, wanted in self.mismatched_starts:
+            tracer.warning("Warning: clue {0} says {1}{2} starts at {3}, but "
+                           "in the grid it's at {4}", clue.number_string,
+                           number, "A" if across else "D", read, wanted)
+
+    def with_placeholders(self, across_clues, down_clues, stats=None):
+        """Return the clues with "See N" placeholders added
+
+        across_clues and down_clues are dictionaries from clue number
+        to ParsedClue, which aren't changed.  This returns a
+        dictionary mapping True (for across) and False (for down) to
+        copies of them with a placeholder clue for each entry that's
+        only covered by a clue numbered after another entry."""
+        from ccj_to_puz.ccj_parse import ParsedClue
+        clue_groups = {True: dict(across_clues), False: dict(down_clues)}
+        self.clue_for_entry = {}
+        starts = []
+        for group_across in (True, False):
+            clue_dictionary = clue_groups[group_across]
+            # (Placeholders may be added to the dictionary as we go,
+            # but they don't need looking at.)
+            for clue in list(clue_dictionary.values()):
+                if clue.placeholder_for is not None:
+                    continue
+                first_clue_entry = str(clue.all_clue_numbers[0][0])
+                for k, duple in enumerate(clue.all_clue_numbers):
+                    self.clue_for_entry.setdefault(duple, clue)
+                    if clue.start_coordinates and \
+                            k < len(clue.start_coordinates):
+                        starts.append((clue, duple,
+                                       tuple(clue.start_coordinates[k])))
+                    entry_n, entry_across = duple
+                    expected_dictionary = clue_groups[entry_across]
+                    if entry_n in expected_dictionary:
+                        continue
+                    clue_string = "See " + first_clue_entry
+                    if entry_across != group_across:
+                        clue_string += entry_across and " across" or " down"
+                    fake_clue = ParsedClue()
+                    fake_clue.across = entry_across
+                    fake_clue.number_string = str(entry_n)
+                    # (This is what raises an error for a number that
+                    # isn't in the grid at all.)
+                    fake_clue.all_clue_numbers = self.resolve(
+                        entry_across, fake_clue.number_string)
+                    fake_clue.text_including_enumeration = clue_string
+                    entry = self.numbering.entry(entry_n, entry_across)
+                    if entry is not None:
+                        fake_clue.start_coordinates = [(entry.x, entry.y)]
+                    fake_clue.placeholder_for = clue
+                    expected_dictionary[entry_n] = fake_clue
+                    if stats is not None:
+                        stats.count('placeholder_clues')
+                    tracer.debug("**** Added missing clue with index  {0} {1}",
+                                 entry_n, clue_string)
+        self.check_start_coordinates(starts, stats)
+        if stats is not None and self.mismatched_starts:
+            stats.count('mismatched_start_coordinates',
+                        len(self.mismatched_starts))
+        return clue_groups
+
+def resolver_for(grid):
+    """Return the ClueResolver for grid, which must have been numbered
+
+    The same one is returned until the grid is numbered again."""
+    resolver = grid.clue_resolver
+    if resolver is None or resolver.numbering is not grid.numbering:
+        resolver = ClueResolver(grid)
+        grid.clue_resolver = resolver
+    return resolver
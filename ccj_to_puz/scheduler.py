@@ -0,0 +1,303 @@
+"""Run batches of conversions so that one bad file can't hold up the rest
+
+multiprocessing.Pool is fine while every file converts quickly, but a
+file that makes a worker loop, use a huge amount of memory or crash
+stalls that worker (and pool.map with it) or loses the whole batch.
+A Scheduler instead gives each of its worker processes one job at a
+time, and:
+
+  - kills and replaces a worker whose job takes longer than timeout
+    seconds, recording the job as having timed out
+  - limits the address space of each worker to memory_limit bytes
+    (where the resource module is available), so that a runaway
+    conversion fails with a MemoryError rather than taking the
+    machine down
+  - replaces a worker that dies, recording its job as having crashed
+  - tries a job again, up to retries more times with an increasing
+    delay, if it failed with an I/O error (other than the input not
+    existing), since that may have been a passing problem with a
+    network filesystem, say
+  - moves the input of any other failure into a quarantine directory
+    (if one's given), with a .error.json file next to it saying what
+    went wrong and where in the file, so that it isn't tried again
+    by the next run over the same directory
+
+The jobs are as for batch.convert_file, or for another function
+that returns a ConversionResult, like archive.convert_member."""
+
+import json
+import multiprocessing
+import os
+import select
+import shutil
+import signal
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    from multiprocessing.connection import wait as wait_for_connections
+except ImportError:
+    wait_for_connections = None
+
+from ccj_to_puz.batch import ConversionResult, convert_file, \
+    default_number_of_processes
+from ccj_to_puz.fsutil import atomic_write, makedirs_if_missing
+
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_RETRIES = 2
+# The delay before the first retry, which doubles for each one after:
+DEFAULT_RETRY_DELAY = 0.5
+ERROR_SUFFIX = '.error.json'
+
+def limit_memory(memory_limit):
+    """Limit the address space of this process to memory_limit bytes"""
+    if memory_limit is None or resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        memory_limit = min(memory_limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, hard))
+
+def worker_main(connection, function, memory_limit):
+    """Call function on each job received on connection, sending back the result
+
+    A job of None means that the worker should exit."""
+    # Interrupting the batch is left to the parent, which will stop
+    # the workers itself:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    limit_memory(memory_limit)
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        try:
+            result = function(job)
+        except Exception as e:
+            # convert_file records its own errors, but if anything
+            # else goes wrong there's no need to lose the worker:
+            result = failed_result(job, e.__class__.__name__, e)
+        connection.send(result)
+
+def wait_for_any(connections, timeout):
+    """Return those of connections that are ready to read, within timeout"""
+    if not connections:
+        if timeout:
+            time.sleep(timeout)
+        return []
+    if wait_for_connections is not None:
+        return wait_for_connections(connections, timeout)
+    return select.select(connections, [], [], timeout)[0]
+
+def failed_result(job, error_type, message):
+    """Make a ConversionResult for a job that didn't return one"""
+    result = ConversionResult(job[0], job[1])
+    result.error = "{0}: {1}".format(error_type, message)
+    result.error_type = error_type
+    return result
+
+def quarantine(result, directory):
+    """Move the input of a failed conversion into directory
+
+    A JSON file describing the failure is written next to it, and
+    result.quarantined_path is set to where the input now is."""
+    makedirs_if_missing(directory)
+    base, extension = os.path.splitext(os.path.basename(result.input_path))
+    path = os.path.join(directory, base + extension)
+    n = 1
+    while os.path.exists(path) or os.path.exists(path + ERROR_SUFFIX):
+        n += 1
+        path = os.path.join(directory,
+                            "{0}-{1}{2}".format(base, n, extension))
+    shutil.move(result.input_path, path)
+    details = {'input_path': result.input_path,
+               'error': result.error,
+               'error_type': result.error_type,
+               'error_offset': result.error_offset,
+               'attempts': result.attempts,
+               'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+    atomic_write(path + ERROR_SUFFIX,
+                 json.dumps(details, indent=1, separators=(',', ': '),
+                            sort_keys=True).encode('utf-8'))
+    result.quarantined_path = path
+
+class Task(object):
+    """A job, its position in the batch, and how often it's been tried"""
+    __slots__ = ('index', 'job', 'attempts', 'not_before')
+
+    def __init__(self, index, job):
+        self.index = index
+        self.job = job
+        self.attempts = 1
+        self.not_before = 0
+
+class Worker(object):
+    """A worker process, and the task it's working on (if any)"""
+
+    def __init__(self, function, memory_limit):
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=worker_main,
+                                               args=(child_connection,
+                                                     function,
+                                                     memory_limit))
+        self.process.daemon = True
+        self.process.start()
+        child_connection.close()
+        self.task = None
+        self.deadline = None
+
+    def start(self, task, timeout):
+        self.task = task
+        self.deadline = time.time() + timeout if timeout else None
+        self.connection.send(task.job)
+
+    def finish(self):
+        """Forget the current task, returning it"""
+        task = self.task
+        self.task = None
+        self.deadline = None
+        return task
+
+    def stop(self, kill=False):
+        if kill:
+            self.process.terminate()
+        else:
+            try:
+                self.connection.send(None)
+            except EnvironmentError:
+                pass
+        self.process.join()
+        self.connection.close()
+
+class Scheduler(object):
+    """A class for converting many files with bounded time and memory each
+
+    See the module docstring for what each of the options does; a
+    timeout or memory_limit of None means no limit, and if
+    quarantine_directory is None failed inputs are left where they
+    are."""
+
+    def __init__(self,
+                 processes=None,
+                 timeout=DEFAULT_TIMEOUT,
+                 memory_limit=None,
+                 retries=DEFAULT_RETRIES,
+                 retry_delay=DEFAULT_RETRY_DELAY,
+                 quarantine_directory=None,
+                 function=convert_file):
+        if processes is None:
+            processes = default_number_of_processes()
+        self.processes = max(1, processes)
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.quarantine_directory = quarantine_directory
+        self.function = function
+
+    def new_worker(self):
+        return Worker(self.function, self.memory_limit)
+
+    def run(self, jobs):
+        """Return a list of ConversionResult objects for jobs, in order"""
+        results = {}
+        for index, result in self.results(jobs):
+            results[index] = result
+        return [results[i] for i in range(len(results))]
+
+    def results(self, jobs):
+        """Generate (index, ConversionResult) for each of jobs as it finishes
+
+        jobs is only iterated over as workers become free, so it can
+        be a generator."""
+        jobs = enumerate(jobs)
+        jobs_left = True
+        waiting = []
+        workers = [self.new_worker() for _ in range(self.processes)]
+        try:
+            while True:
+                now = time.time()
+                for worker in workers:
+                    if worker.task is not None:
+                        continue
+                    task = None
+                    ready = [t for t in waiting if t.not_before <= now]
+                    if ready:
+                        task = min(ready, key=lambda t: t.not_before)
+                        waiting.remove(task)
+                    elif jobs_left:
+                        try:
+                            task = Task(*next(jobs))
+                        except StopIteration:
+                            jobs_left = False
+                    if task is None:
+                        break
+                    worker.start(task, self.timeout)
+                busy = [w for w in workers if w.task is not None]
+                if not (busy or waiting or jobs_left):
+                    return
+                times = [w.deadline for w in busy if w.deadline is not None]
+                times.extend(t.not_before for t in waiting)
+                timeout = max(0, min(times) - now) if times else None
+                ready = wait_for_any([w.connection for w in busy], timeout)
+                for i, worker in enumerate(workers):
+                    if worker.task is None:
+                        continue
+                    if worker.connection in ready:
+                        try:
+                            result = worker.connection.recv()
+                        except (EOFError, EnvironmentError):
+                            result = None
+                        if result is None:
+                            # The worker died part way through:
+                            worker.process.join()
+                            message = "The worker exited with code {0}"
+                            result = failed_result(
+                                worker.task.job,
+                                'WorkerCrashed',
+                                message.format(worker.process.exitcode))
+                            task = worker.finish()
+                            worker.stop(kill=True)
+                            workers[i] = self.new_worker()
+                        else:
+                            task = worker.finish()
+                    elif worker.deadline is not None and \
+                            time.time() >= worker.deadline:
+                        message = "The conversion took longer than {0}s"
+                        result = failed_result(worker.task.job,
+                                               'Timeout',
+                                               message.format(self.timeout))
+                        task = worker.finish()
+                        worker.stop(kill=True)
+                        workers[i] = self.new_worker()
+                    else:
+                        continue
+                    result.attempts = task.attempts
+                    if result.transient and task.attempts <= self.retries:
+                        task.not_before = time.time() + \
+                            self.retry_delay * 2 ** (task.attempts - 1)
+                        task.attempts += 1
+                        waiting.append(task)
+                        continue
+                    self.finished(result)
+                    yield task.index, result
+        finally:
+            for worker in workers:
+                worker.stop(kill=worker.task is not None)
+
+    def finished(self, result):
+        """Quarantine the input of result, if it's a failure that should be"""
+        if result.succeeded() or result.transient or \
+                self.quarantine_directory is None or \
+                not os.path.isfile(result.input_path):
+            return
+        try:
+            quarantine(result, self.quarantine_directory)
+        except EnvironmentError as e:
+            result.error += " (and it couldn't be quarantined: {0})".format(e)
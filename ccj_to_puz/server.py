@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""A long-running HTTP service for converting CCJ crosswords to .puz
+
+Starting the ccj-to-puz script for every conversion means paying for
+a new interpreter each time, which is far slower than the conversion
+itself.  This server (which needs Python 3.7 or later, and only uses
+the standard library) accepts the bytes of a .ccj file in the body of
+a request and sends back the .puz file:
+
+  POST /convert?title=...&author=...&number=...&copyright=...&date=...
+                &checksums=1
+
+All the query parameters are optional, and mean the same as the
+options of ccj-to-puz.  The responses are:
+
+  200  the .puz file, as application/x-crossword
+  400  a malformed request or query parameter
+  411  a request without a Content-Length
+  413  a body larger than --max-body-size
+  422  a body that couldn't be parsed as a CCJ file (the message,
+       with the offset of the problem in the file, is in the body of
+       the response)
+  500  the conversion failed in some other way
+  503  too many conversions are already waiting, so try again later
+  504  the conversion took longer than --timeout
+
+The parsing is done in a pool of worker processes (or threads, with
+--threads) by an AsyncConverter (see aio.py), so that the event loop
+is never blocked by it.  At most --max-pending conversions are
+accepted at once, including those being worked on; beyond that new
+ones are refused straight away with 503 rather than being queued up
+indefinitely.  A conversion that got a 504 still counts until its
+worker has finished with it.
+
+  GET /health    responds with 200 "ok" while the server is running
+  GET /metrics   returns JSON with counts of responses by status,
+                 the number of conversions in progress, and
+                 percentiles of the latency of recent conversions"""
+
+import asyncio
+import json
+import re
+import sys
+import time
+from collections import deque
+from optparse import OptionParser
+from urllib.parse import parse_qs, urlsplit
+
+from ccj_to_puz.aio import AsyncConverter, ConversionError, \
+    ConversionTimeout, ConverterBusy
+from ccj_to_puz.batch import default_number_of_processes
+from ccj_to_puz.commonccj import CCJParseError
+
+DEFAULT_MAX_BODY_SIZE = 4 * 1024 * 1024
+# The number of recent conversions whose latency is kept for the
+# percentiles reported by /metrics:
+LATENCY_WINDOW = 4096
+PERCENTILES = (50, 90, 99, 99.9)
+
+REASONS = {200: "OK",
+           400: "Bad Request",
+           404: "Not Found",
+           405: "Method Not Allowed",
+           408: "Request Timeout",
+           411: "Length Required",
+           413: "Payload Too Large",
+           422: "Unprocessable Entity",
+           500: "Internal Server Error",
+           503: "Service Unavailable",
+           504: "Gateway Timeout"}
+
+QUERY_PARAMETERS = {'title': 'title',
+                    'author': 'author',
+                    'number': 'puzzle_number',
+                    'copyright': 'copyright_message',
+                    'date': 'date_string'}
+
+class HTTPError(Exception):
+    """An exception for a request that should get an error response"""
+    def __init__(self, status, message=None):
+        Exception.__init__(self, message or REASONS[status])
+        self.status = status
+
+def metadata_from_query(query, defaults):
+    """Return the metadata for a conversion from a URL's query string"""
+    metadata = dict(defaults)
+    for k, values in parse_qs(query, strict_parsing=False).items():
+        if k == 'checksums':
+            metadata['checksums'] = values[-1] not in ('', '0', 'false')
+        elif k in QUERY_PARAMETERS:
+            metadata[QUERY_PARAMETERS[k]] = values[-1]
+        else:
+            raise HTTPError(400, "Unknown query parameter: " + k)
+    date_string = metadata.get('date_string')
+    if date_string and not re.search(r'^\d{4}-\d{2}-\d{2}', date_string):
+        raise HTTPError(400, "Unknown date format, must be YYYY-MM-DD")
+    return metadata
+
+def percentile(sorted_values, p):
+    """Return the p-th percentile (nearest rank) of sorted_values"""
+    if not sorted_values:
+        return None
+    rank = int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1
+    return sorted_values[min(max(rank, 0), len(sorted_values) - 1)]
+
+class Metrics:
+    """A class for the counters and latencies reported by /metrics"""
+    def __init__(self):
+        self.started = time.time()
+        self.responses = {}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, status):
+        self.responses[status] = self.responses.get(status, 0) + 1
+
+    def to_dictionary(self, in_progress):
+        latencies = sorted(self.latencies)
+        result = {'uptime_seconds': time.time() - self.started,
+                  'in_progress': in_progress,
+                  'responses': dict((str(k), v) for k, v in
+                                    sorted(self.responses.items())),
+                  'latency_samples': len(latencies)}
+        for p in PERCENTILES:
+            value = percentile(latencies, p)
+            key = 'latency_ms_p{0}'.format(p).replace('.', '_')
+            result[key] = None if value is None else value * 1000
+        return result
+
+class ConversionServer:
+    """A class for the state of the server: its converter and metrics"""
+
+    def __init__(self,
+                 workers=None,
+                 use_threads=False,
+                 max_pending=None,
+                 timeout=10.0,
+                 max_body_size=DEFAULT_MAX_BODY_SIZE,
+                 defaults=None):
+        if workers is None:
+            workers = default_number_of_processes()
+        if max_pending is None:
+            max_pending = workers * 4
+        self.timeout = timeout
+        self.max_body_size = max_body_size
+        self.defaults = defaults or {}
+        self.metrics = Metrics()
+        self.converter = AsyncConverter(workers,
+                                        use_threads=use_threads,
+                                        max_pending=max_pending,
+                                        timeout=timeout)
+
+    def shutdown(self):
+        self.converter.shutdown(wait=False)
+
+    async def convert(self, data, metadata):
+        """Convert data in the pool, returning the .puz file's bytes
+
+        A conversion counts towards --max-pending until the pool has
+        actually finished with it, even if the request has already
+        had a 504, so that slow conversions can't pile up unbounded."""
+        start = time.time()
+        try:
+            result = await self.converter.convert(data, **metadata)
+        except ConverterBusy as e:
+            raise HTTPError(503, str(e))
+        except ConversionTimeout:
+            # A worker process can't be interrupted, so it will carry
+            # on with this one, but we don't wait for it:
+            raise HTTPError(504, "The conversion timed out")
+        except CCJParseError as e:
+            raise HTTPError(422, "{0}: {1}".format(e.__class__.__name__, e))
+        except ConversionError as e:
+            raise HTTPError(500, str(e))
+        self.metrics.latencies.append(time.time() - start)
+        return result
+
+    async def handle_request(self, method, target, headers, reader):
+        """Return (status, content type, body) for one request"""
+        url = urlsplit(target)
+        if url.path == '/health':
+            if method != 'GET':
+                raise HTTPError(405)
+            return 200, 'text/plain; charset=utf-8', b"ok\n"
+        elif url.path == '/metrics':
+            if method != 'GET':
+                raise HTTPError(405)
+            body = json.dumps(
+                self.metrics.to_dictionary(self.converter.pending),
+                indent=2, sort_keys=True)
+            return 200, 'application/json', body.encode('utf-8') + b"\n"
+        elif url.path == '/convert':
+            if method != 'POST':
+                raise HTTPError(405)
+            metadata = metadata_from_query(url.query, self.defaults)
+            if 'content-length' not in headers:
+                raise HTTPError(411)
+            try:
+                length = int(headers['content-length'])
+            except ValueError:
+                raise HTTPError(400, "Bad Content-Length")
+            if length < 0:
+                raise HTTPError(400, "Bad Content-Length")
+            if length > self.max_body_size:
+                raise HTTPError(413)
+            try:
+                data = await asyncio.wait_for(reader.readexactly(length),
+                                              self.timeout)
+            except asyncio.TimeoutError:
+                raise HTTPError(408)
+            puz = await self.convert(data, metadata)
+            return 200, 'application/x-crossword', puz
+        raise HTTPError(404)
+
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one connection until it's closed"""
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b"\r\n\r\n"), self.timeout)
+                except (asyncio.IncompleteReadError,
+                        asyncio.TimeoutError,
+                        asyncio.LimitOverrunError,
+                        ConnectionError):
+                    break
+                keep_alive = await self.respond(head, reader, writer)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, head, reader, writer):
+        """Parse a request's head and write the response to writer
+
+        Returns whether the connection can be used for another
+        request."""
+        keep_alive = False
+        try:
+            lines = head.decode('latin_1').split("\r\n")
+            try:
+                method, target, version = lines[0].split(" ")
+            except ValueError:
+                raise HTTPError(400, "Malformed request line")
+            headers = {}
+            for line in lines[1:]:
+                if line:
+                    k, _, v = line.partition(":")
+                    headers[k.strip().lower()] = v.strip()
+            connection = headers.get('connection', '').lower()
+            if version == 'HTTP/1.1':
+                keep_alive = connection != 'close'
+            else:
+                keep_alive = connection == 'keep-alive'
+            status, content_type, body = \
+                await self.handle_request(method, target, headers, reader)
+        except HTTPError as e:
+            status = e.status
+            content_type = 'text/plain; charset=utf-8'
+            body = (str(e) + "\n").encode('utf-8')
+            # The body of the request may not have been read, so the
+            # connection can't be reused:
+            if status not in (422, 500, 503, 504):
+                keep_alive = False
+        except Exception as e:
+            status = 500
+            content_type = 'text/plain; charset=utf-8'
+            body = "{0}: {1}\n".format(e.__class__.__name__, e).encode('utf-8')
+            keep_alive = False
+        self.metrics.record(status)
+        response_head = ["HTTP/1.1 {0} {1}".format(status, REASONS[status]),
+                         "Content-Type: " + content_type,
+                         "Content-Length: {0}".format(len(body)),
+                         "Connection: " + ("keep-alive" if keep_alive
+                                           else "close")]
+        if status == 503:
+            response_head.append("Retry-After: 1")
+        writer.write(("\r\n".join(response_head) + "\r\n\r\n")
+                     .encode('latin_1') + body)
+        return keep_alive
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection,
+                                            host,
+                                            port)
+        addresses = ", ".join(str(s.getsockname()[:2])
+                              for s in server.sockets)
+        print("Listening on " + addresses, file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option('--host', dest='host', default='127.0.0.1',
+                      help="address to listen on (default: 127.0.0.1)")
+    parser.add_option('-p', '--port', dest='port', type='int', default=8080,
+                      help="port to listen on (default: 8080)")
+    parser.add_option('-j', '--jobs', dest='jobs', type='int',
+                      help="number of workers (default: one per core)")
+    parser.add_option('--threads', dest='threads', action="store_true",
+                      default=False,
+                      help="use a pool of threads rather than processes")
+    parser.add_option('--max-pending', dest='max_pending', type='int',
+                      help="conversions to accept at once before "
+                      "responding 503 (default: four per worker)")
+    parser.add_option('--timeout', dest='timeout', type='float',
+                      default=10.0,
+                      help="seconds to allow for reading a request and "
+                      "for each conversion (default: 10)")
+    parser.add_option('--max-body-size', dest='max_body_size', type='int',
+                      default=DEFAULT_MAX_BODY_SIZE,
+                      help="largest .ccj file to accept, in bytes")
+    parser.add_option('-k', '--checksums', dest='checksums',
+                      action="store_true", default=False,
+                      help="include the AcrossLite checksums by default")
+    parser.add_option('-c', '--copyright', dest='copyright_message',
+                      help="specify the default copyright message")
+    parser.add_option('--cache-dir', dest='cache_directory', metavar='DIR',
+                      help="reuse parsed crosswords cached in DIR")
+    parser.add_option('--cache-size', dest='cache_size', type='int',
+                      default=256, metavar='MB',
+                      help="maximum size of the cache in megabytes")
+
+    (options, args) = parser.parse_args()
+
+    if len(args) > 0:
+        raise Exception("Unknown arguments: " + "\n".join(args))
+
+    defaults = {'checksums': options.checksums,
+                'copyright_message': options.copyright_message,
+                'cache_directory': options.cache_directory,
+                'cache_max_bytes': options.cache_size * 1024 * 1024}
+
+    server = ConversionServer(workers=options.jobs,
+                              use_threads=options.threads,
+                              max_pending=options.max_pending,
+                              timeout=options.timeout,
+                              max_body_size=options.max_body_size,
+                              defaults=defaults)
+    try:
+        asyncio.run(server.serve(options.host, options.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
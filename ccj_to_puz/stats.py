@@ -0,0 +1,91 @@
+"""Timings and counters for the stages of converting a crossword
+
+If you pass a ParseStats object to ParsedCCJ.read_from_ccj (or
+read_from_bytes) and to_puz_bytes (or the methods that write files),
+it records the wall time spent in each stage of parsing and writing,
+and counts things like the number of bytes skipped and placeholder
+clues added.  When no ParseStats is passed, all that's left in the
+parser is a check for None at the end of each stage, so it's fine to
+leave the hooks in place in production.
+
+The stages of parsing are:
+
+  header     - the button labels, congratulations message, dimensions,
+               and the bytes skipped before the grid
+  grid       - the block grid, the grid of unknown purpose and answers
+  numbering  - working out the clue numbers and entries of the grid
+  clues      - the across and down clues
+  metadata   - working out the title, author and so on
+
+... and of writing:
+
+  placeholders - adding the "See N" clues
+  puz          - assembling the .puz file
+"""
+
+import time
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
+
+class ParseStats(object):
+    """A class for accumulating timings and counters over conversions
+
+    stage_seconds maps each stage name to the total wall time spent
+    in it, counters maps a name to a count, and encodings_used maps
+    the name of each text encoding to the number of strings that
+    needed it.  One instance can be used for many puzzles, and
+    instances from different processes can be combined with merge()."""
+
+    def __init__(self):
+        self.stage_seconds = {}
+        self.counters = {}
+        self.encodings_used = {}
+        self.last_mark = None
+
+    def start(self):
+        """Mark the start of the first stage of parsing or writing"""
+        self.last_mark = clock()
+
+    def stage(self, name):
+        """Record the time since the last mark as being spent in name"""
+        now = clock()
+        self.stage_seconds[name] = \
+            self.stage_seconds.get(name, 0.0) + now - self.last_mark
+        self.last_mark = now
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_encodings(self, encodings):
+        for k, v in encodings.items():
+            self.encodings_used[k] = self.encodings_used.get(k, 0) + v
+
+    def merge(self, other):
+        """Add the timings and counts of other to this instance"""
+        if isinstance(other, dict):
+            other = ParseStats.from_dictionary(other)
+        for k, v in other.stage_seconds.items():
+            self.stage_seconds[k] = self.stage_seconds.get(k, 0.0) + v
+        for k, v in other.counters.items():
+            self.count(k, v)
+        self.add_encodings(other.encodings_used)
+
+    def to_dictionary(self):
+        return {'stage_seconds': dict(self.stage_seconds),
+                'counters': dict(self.counters),
+                'encodings_used': dict(self.encodings_used)}
+
+    @classmethod
+    def from_dictionary(cls, d):
+        result = cls()
+        result.stage_seconds.update(d.get('stage_seconds', {}))
+        result.counters.update(d.get('counters', {}))
+        result.encodings_used.update(d.get('encodings_used', {}))
+        return result
+
+    def to_json(self):
+        import json
+        return json.dumps(self.to_dictionary(), indent=2, sort_keys=True)
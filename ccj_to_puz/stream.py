@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Convert a stream of many CCJ crosswords read from standard input
+
+Normally ccj-to-puz converts a single crossword from standard input
+and exits, so a pipeline that converts many has to start a new
+process for each one.  With --stream, it instead reads a sequence of
+framed records from standard input and, as soon as each record is
+complete, converts it and writes a framed result to standard output
+(which is flushed after every result, so that the next stage of the
+pipeline can start on it straight away).  There are two framings:
+
+  binary  Each input record is a 4 byte big-endian length followed
+          by that many bytes of a .ccj file.  Each output record is
+          a tag byte, a 4 byte big-endian length and a payload: the
+          tag is 'P' if the payload is a .puz file, or 'E' if the
+          conversion failed, in which case the payload is an error
+          record encoded as UTF-8 JSON.
+
+  base64  Each input line is a .ccj file encoded in base64; blank
+          lines are ignored.  Each output line is a JSON object with
+          the "index" of the record (counting from 0) and either
+          "puz", the .puz file in base64, or the keys of an error
+          record.
+
+An error record is a JSON object with the keys "index", "type" (the
+class of the exception) and "message", and "offset" (the byte of the
+.ccj file where the problem was found) if it's known.  One bad record doesn't stop
+the stream, but a truncated binary record at the end of the input
+produces an error record and ends it."""
+
+from __future__ import print_function
+
+import base64
+import binascii
+import io
+import json
+import sys
+from struct import Struct
+
+from ccj_to_puz.batch import parse_with_metadata
+
+FRAMINGS = ('binary', 'base64')
+LENGTH = Struct('>I')
+PUZ_TAG = b'P'
+ERROR_TAG = b'E'
+
+class TruncatedRecord(Exception):
+    pass
+
+def read_exactly(stream, n):
+    """Read exactly n bytes from stream, or fewer at the end of input
+
+    (A pipe may return fewer bytes than asked for from a single
+    read, so this keeps reading until it has them all.)"""
+    chunks = []
+    remaining = n
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+def read_binary_records(stream):
+    """Generate the payload of each length-prefixed record in stream
+
+    If the input ends part way through a record, a TruncatedRecord
+    exception is generated (rather than raised) as the last item."""
+    while True:
+        prefix = read_exactly(stream, LENGTH.size)
+        if not prefix:
+            return
+        if len(prefix) < LENGTH.size:
+            yield TruncatedRecord("The input ended in a length prefix")
+            return
+        length = LENGTH.unpack(prefix)[0]
+        payload = read_exactly(stream, length)
+        if len(payload) < length:
+            message = "The input ended after {0} of {1} bytes of a record"
+            yield TruncatedRecord(message.format(len(payload), length))
+            return
+        yield payload
+
+def read_base64_records(stream):
+    """Generate the decoded bytes of each base64 line of stream
+
+    A line that isn't valid base64 is generated as the exception
+    from decoding it, so that it can be reported in order."""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield base64.b64decode(line)
+        except (binascii.Error, TypeError, ValueError) as e:
+            yield e
+
+def error_record(index, e):
+    record = {'index': index,
+              'type': e.__class__.__name__,
+              'message': "{0}".format(e)}
+    if getattr(e, 'offset', None) is not None:
+        record['offset'] = e.offset
+    return record
+
+def write_binary_result(stream, tag, payload):
+    stream.write(tag + LENGTH.pack(len(payload)) + payload)
+    stream.flush()
+
+def write_line_result(stream, record):
+    stream.write(json.dumps(record, sort_keys=True).encode('utf-8') + b"\n")
+    stream.flush()
+
+def convert_stream(input_stream,
+                   output_stream,
+                   metadata=None,
+                   framing='binary',
+                   stats=None):
+    """Convert each framed CCJ file in input_stream to output_stream
+
+    Both streams must be binary.  metadata is a dictionary as for
+    batch.convert_file.  Returns a tuple of the number of records
+    converted and the number that failed."""
+    if metadata is None:
+        metadata = {}
+    if framing not in FRAMINGS:
+        raise Exception("Unknown framing: " + framing)
+    converted = 0
+    failed = 0
+    if framing == 'binary':
+        records = read_binary_records(input_stream)
+    else:
+        records = read_base64_records(input_stream)
+    for index, data in enumerate(records):
+        try:
+            if isinstance(data, Exception):
+                raise data
+            parsed = parse_with_metadata(data, metadata, stats)
+            puz = parsed.to_puz_bytes(checksums=metadata.get('checksums',
+                                                             False),
+                                      stats=stats)
+        except Exception as e:
+            failed += 1
+            if framing == 'binary':
+                payload = json.dumps(error_record(index, e), sort_keys=True)
+                write_binary_result(output_stream,
+                                    ERROR_TAG,
+                                    payload.encode('utf-8'))
+            else:
+                write_line_result(output_stream, error_record(index, e))
+        else:
+            converted += 1
+            if framing == 'binary':
+                write_binary_result(output_stream, PUZ_TAG, puz)
+            else:
+                encoded = base64.b64encode(puz).decode('ascii')
+                write_line_result(output_stream, {'index': index,
+                                                  'puz': encoded})
+    return converted, failed
+
+def convert_standard_streams(metadata=None, framing='binary', stats=None):
+    """Run convert_stream on (binary versions of) stdin and stdout"""
+    # Make sys.stdin and sys.stdout binary, and don't buffer stdin
+    # beyond what's been asked for so that each record is converted
+    # as soon as it's complete:
+    input_stream = io.open(sys.stdin.fileno(), 'rb', buffering=0,
+                           closefd=False)
+    output_stream = io.open(sys.stdout.fileno(), 'wb', closefd=False)
+    if framing == 'base64':
+        input_stream = io.BufferedReader(input_stream)
+    try:
+        return convert_stream(input_stream,
+                              output_stream,
+                              metadata,
+                              framing,
+                              stats)
+    finally:
+        output_stream.flush()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Generate synthetic crosswords in CCJ format
+
+Since I only have a handful of real CCJ files, this module can make
+any number of made-up ones, which are useful for checking the parser
+and for benchmarking it.  They follow the layout that ccj_parse.py
+expects, which is (as far as I can tell):
+
+  - two bytes I don't understand
+  - the length-prefixed labels of the buttons, terminated by a NUL
+  - the length-prefixed congratulations message
+  - a byte that's 0x02 in the Independent (0x00 in the Herald)
+  - the width and height of the grid
+  - some bytes of unknown purpose, none of which are '?' or '#'
+  - the grid, with '?' (or occasionally 'M') for a light and '#' for
+    a block
+  - a grid of small numbers of unknown purpose
+  - 0x01, then the answer letter for each light
+  - possibly some ignorable blocks of four bytes, like 00 ff ff ff
+  - a block of 16 bytes, the first of which is 0x02
+  - the across clues and then the down clues; each list is a label,
+    three unknown bytes, the number of clues and then each clue.  A
+    clue is the coordinates of the start of each of its entries (two
+    bytes, or for several entries, each coordinate with 0x80 added
+    and then a NUL), the clue number (e.g. "33/16/12/2A/28D"), a NUL,
+    and the clue text, which may have 0x03 and 0x01 around italics.
+
+The coordinates are written starting from 0, but that's a guess."""
+
+from __future__ import print_function
+
+import io
+import os
+import random
+import sys
+from optparse import OptionParser
+
+from ccj_to_puz.numbering import number_grid
+
+# Some characters that need each encoding to be tried, since UTF-8
+# fails on both, and 0x97 is a control character in ISO-8859-1:
+ENCODING_EXTRAS = {
+    'ascii': [],
+    'utf_8': [u'\xe9', u'—'],
+    'latin_1': [u'\xe9', u'\xfc'],
+    'cp1252': [u'—', u'’']}
+
+WORDS = ["about", "after", "again", "beast", "board", "chalk", "cross",
+         "dance", "early", "earth", "flame", "grain", "heart", "house",
+         "irony", "jewel", "knife", "lemon", "maker", "north", "ocean",
+         "paper", "queen", "river", "stone", "tiger", "under", "voice",
+         "water", "young", "zebra", "one", "in", "the", "for", "a"]
+
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+def length_prefixed(b):
+    """Return b (which must be at most 255 bytes) with a length byte"""
+    if len(b) > 255:
+        raise ValueError("Strings in a CCJ file must be at most 255 bytes")
+    return bytearray([len(b)]) + bytearray(b)
+
+class SyntheticCCJ(object):
+    """A made-up crossword, and its bytes in CCJ format
+
+    The grid has a block wherever both the row and column are odd, as
+    in many British cryptic grids, plus a random sprinkling of
+    further blocks if block_density is more than 0.  linked_clues is
+    the number of clues whose answers are made of several entries in
+    the grid, and encoding is the encoding of the clue texts, which
+    is one of the keys of ENCODING_EXTRAS.
+
+    The CCJ file is in the data attribute, and each of the encoded
+    strings in it (including the formatting bytes) is in strings."""
+
+    def __init__(self, width=15, height=15, linked_clues=2,
+                 encoding='utf_8', block_density=0.0, seed=0,
+                 skippable_blocks=1, setter="Bloggs", puzzle_number=1234):
+        if not (2 <= width < 0x80 and 2 <= height < 0x80):
+            raise ValueError("Grid dimensions must be from 2 to 127")
+        if encoding not in ENCODING_EXTRAS:
+            raise ValueError("Unknown encoding: " + encoding)
+        self.width = width
+        self.height = height
+        self.encoding = encoding
+        self.random = random.Random(seed)
+        self.strings = []
+
+        size = width * height
+        self.lights = bytearray(size)
+        for y in range(height):
+            for x in range(width):
+                if (x % 2 == 1 and y % 2 == 1) or \
+                        self.random.random() < block_density:
+                    continue
+                self.lights[y * width + x] = 1
+        self.letters = bytearray(
+            ord(self.random.choice(LETTERS)) if l else 0x20
+            for l in self.lights)
+        self.numbering = number_grid(width, height, self.lights, self.letters)
+
+        self.clue_lists = self.make_clues(linked_clues)
+        for across in (True, False):
+            if not self.clue_lists[across]:
+                raise ValueError("This grid has no {0} clues".format(
+                    "across" if across else "down"))
+            if len(self.clue_lists[across]) > 255:
+                raise ValueError("A CCJ list can have at most 255 clues")
+
+        out = bytearray(b'\x00\x00')
+        for label in ("Check", "Cheat", "Solution"):
+            out += self.string(label)
+        out += b'\x00'
+        out += self.string("Well done!")
+        out += bytearray([0x02, width, height])
+        out += b'\x00\x01\x00'
+        out += bytearray(0x3f if l else 0x23 for l in self.lights)
+        out += bytearray(self.random.randint(0, 12) if l else 0
+                         for l in self.lights)
+        out += b'\x01'
+        out += bytearray(c for c, l in zip(self.letters, self.lights) if l)
+        out += b'\x00\xff\xff\xff' * skippable_blocks
+        out += b'\x02' + bytearray(15)
+        out += self.clue_list(u"{0}-{1} Across".format(setter, puzzle_number),
+                              self.clue_lists[True])
+        out += self.clue_list(u"Down", self.clue_lists[False])
+        self.data = bytes(out)
+
+    def string(self, text, formatting=False):
+        """Encode text as a length-prefixed string, remembering it"""
+        b = text.encode(self.encoding)
+        if formatting:
+            # Put the first word in italics, and some stray 0x01
+            # bytes before the enumeration:
+            words = b.split(b' ', 1)
+            b = b'\x03' + words[0] + b'\x01'
+            if len(words) > 1:
+                b += b' ' + words[1].replace(b' (', b'\x01\x01 (')
+        self.strings.append(b)
+        return length_prefixed(b)
+
+    def make_clues(self, linked_clues):
+        """Decide which entries are clued, returning them by direction
+
+        The result maps True (across) and False (down) to a list of
+        lists of entries - each inner list is the entries for one
+        clue, the first of which determines where the clue goes."""
+        entries = list(self.numbering.entries)
+        groups = [[e] for e in entries]
+        self.random.shuffle(groups)
+        for _ in range(linked_clues):
+            if len(groups) < 2:
+                break
+            # Merge some groups into one clue:
+            n = self.random.randint(2, min(4, len(groups)))
+            merged = []
+            for g in groups[:n]:
+                merged += g
+            groups = [merged] + groups[n:]
+            self.random.shuffle(groups)
+        # Each list has to have at least one clue, so if there's none
+        # in one direction, take one of its entries out of a linked
+        # clue and give it a clue of its own:
+        for across in (True, False):
+            if any(g[0].across == across for g in groups):
+                continue
+            for g in groups:
+                matching = [e for e in g if e.across == across]
+                if matching:
+                    g.remove(matching[0])
+                    groups.append([matching[0]])
+                    break
+        result = {True: [], False: []}
+        for g in groups:
+            result[g[0].across].append(g)
+        for across in (True, False):
+            result[across].sort(key=lambda g: g[0].number)
+        return result
+
+    def clue_number_string(self, group, across):
+        """Return a clue number like "12" or "33/16/12/2A/28D" """
+        parts = []
+        for e in group:
+            part = str(e.number)
+            # Only say which direction an entry is if it's ambiguous
+            # or it's different from the list the clue is in:
+            if len(self.numbering.directions[e.number]) > 1 or \
+                    e.across != across:
+                part += "A" if e.across else "D"
+            parts.append(part)
+        return "/".join(parts)
+
+    def clue_text(self, group):
+        """Make up the text of a clue, including its enumeration"""
+        words = [self.random.choice(WORDS)
+                 for _ in range(self.random.randint(2, 7))]
+        extras = ENCODING_EXTRAS[self.encoding]
+        if extras:
+            words.insert(self.random.randint(0, len(words)),
+                         self.random.choice(extras))
+        enumeration = ",".join(str(e.length) for e in group)
+        return u" ".join(words).capitalize() + u" (" + enumeration + u")"
+
+    def clue_list(self, label, groups):
+        out = self.string(label)
+        out += b'\x00\x00\x00'
+        out += bytearray([len(groups)])
+        across = groups[0][0].across
+        for group in groups:
+            if len(group) == 1:
+                out += bytearray([group[0].x, group[0].y])
+            else:
+                for e in group:
+                    out += bytearray([e.x + 0x80, e.y + 0x80])
+                out += b'\x00'
+            out += self.string(self.clue_number_string(group, across))
+            out += b'\x00'
+            out += self.string(self.clue_text(group), formatting=True)
+        return out
+
+def make_ccj(**kwargs):
+    """Return the bytes of a SyntheticCCJ made with these arguments"""
+    return SyntheticCCJ(**kwargs).data
+
+def make_corpus(count, **kwargs):
+    """Return a list of count SyntheticCCJ objects with different seeds"""
+    seed = kwargs.pop('seed', 0)
+    return [SyntheticCCJ(seed=seed + k, **kwargs) for k in range(count)]
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option('-o', '--output-directory', dest='output_directory',
+                      help="write the .ccj files to this directory")
+    parser.add_option('-n', '--count', dest='count', type='int', default=1,
+                      help="number of crosswords to generate")
+    parser.add_option('-W', '--width', dest='width', type='int', default=15,
+                      help="width of the grid")
+    parser.add_option('-H', '--height', dest='height', type='int',
+                      default=15, help="height of the grid")
+    parser.add_option('-l', '--linked-clues', dest='linked_clues',
+                      type='int', default=2,
+                      help="number of clues that cover several entries")
+    parser.add_option('-e', '--encoding', dest='encoding', default='utf_8',
+                      help="encoding of the clue text: " +
+                      ", ".join(sorted(ENCODING_EXTRAS)))
+    parser.add_option('-b', '--block-density', dest='block_density',
+                      type='float', default=0.0,
+                      help="probability of extra blocks in the grid")
+    parser.add_option('-s', '--seed', dest='seed', type='int', default=0,
+                      help="seed for the random number generator")
+
+    (options, args) = parser.parse_args()
+
+    if len(args) > 0:
+        raise Exception("Unknown arguments: " + "\n".join(args))
+
+    corpus = make_corpus(options.count,
+                         width=options.width,
+                         height=options.height,
+                         linked_clues=options.linked_clues,
+                         encoding=options.encoding,
+                         block_density=options.block_density,
+                         seed=options.seed)
+
+    if options.output_directory:
+        if not os.path.isdir(options.output_directory):
+            os.makedirs(options.output_directory)
+        for k, puzzle in enumerate(corpus):
+            filename = "synthetic-{0:06d}.ccj".format(options.seed + k)
+            path = os.path.join(options.output_directory, filename)
+            with io.open(path, 'wb') as f:
+                f.write(puzzle.data)
+    elif len(corpus) == 1:
+        getattr(sys.stdout, 'buffer', sys.stdout).write(corpus[0].data)
+    else:
+        raise Exception("Use -o to generate more than one crossword")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Diagnostic output for the parser, which is off unless asked for
+
+All the diagnostics that used to be printed go through a Tracer for
+each module instead, which sits on top of the standard logging module
+with a logger called "ccj_to_puz.<module>".  Messages use the same
+str.format style as the rest of the code, but they're only formatted
+(and written anywhere) if tracing is enabled for that module, so a
+quiet run does no formatting or I/O per clue.  Anything that's
+expensive to compute just for a message should be guarded with
+"if tracer.enabled():".
+
+Use enable() to switch tracing on for the whole package or for
+particular modules, e.g. enable(['ccj_parse', 'commonccj']).  The
+--verbose option of ccj-to-puz enables it for everything.
+
+The logging module is only imported once something needs it: if
+nothing else has imported it, nothing can have configured it to
+output these messages, so tracing is off without having to ask it.
+(That saves a good fraction of the start-up time of ccj-to-puz.)"""
+
+import sys
+
+PACKAGE = 'ccj_to_puz'
+# The same values as logging.DEBUG and logging.WARNING:
+DEBUG = 10
+WARNING = 30
+
+def get_logger(name):
+    """Return the logger called name, importing logging if necessary"""
+    import logging
+    package_logger = logging.getLogger(PACKAGE)
+    if not package_logger.handlers:
+        # Give the package a handler that ignores everything, so that
+        # there are no complaints about messages without a handler
+        # (logging.NullHandler is 2.7+):
+        handler = logging.Handler()
+        handler.emit = lambda record: None
+        package_logger.addHandler(handler)
+    return logging.getLogger(name)
+
+class FormatMessage(object):
+    """A message that's only formatted with str.format if it's output"""
+    __slots__ = ('format_string', 'args')
+    def __init__(self, format_string, args):
+        self.format_string = format_string
+        self.args = args
+    def __str__(self):
+        if sys.version_info >= (3, 0):
+            return self.format_string.format(*self.args)
+        # On Python 2, format as Unicode in case any of the arguments
+        # are, but logging needs a byte string back:
+        format_string = self.format_string
+        if isinstance(format_string, str):
+            format_string = format_string.decode('UTF-8')
+        return format_string.format(*self.args).encode('UTF-8')
+
+class Tracer(object):
+    """Lazily formatted, level-gated diagnostics for one module"""
+
+    def __init__(self, module):
+        self.name = PACKAGE + '.' + module
+        self.logger = None
+
+    def enabled(self, level=DEBUG):
+        if self.logger is None:
+            if 'logging' not in sys.modules:
+                return False
+            self.logger = get_logger(self.name)
+        return self.logger.isEnabledFor(level)
+
+    def debug(self, format_string, *args):
+        if self.enabled(DEBUG):
+            self.logger.debug(FormatMessage(format_string, args))
+
+    def warning(self, format_string, *args):
+        if self.enabled(WARNING):
+            self.logger.warning(FormatMessage(format_string, args))
+
+def get_tracer(module):
+    """Return the Tracer for module, which is e.g. 'ccj_parse'"""
+    return Tracer(module)
+
+def enable(modules=None, level=DEBUG, stream=None):
+    """Switch on tracing for modules (or the whole package if None)
+
+    The messages are written to stream, which is standard output by
+    default, with nothing but the message on each line.  Calling this
+    again just changes which modules are traced."""
+    import logging
+    package_logger = get_logger(PACKAGE)
+    if not any(getattr(h, 'ccj_to_puz_tracing', False)
+               for h in package_logger.handlers):
+        handler = logging.StreamHandler(stream or sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        handler.ccj_to_puz_tracing = True
+        package_logger.addHandler(handler)
+    if modules is None:
+        package_logger.setLevel(level)
+    else:
+        for module in modules:
+            logging.getLogger(PACKAGE + '.' + module).setLevel(level)
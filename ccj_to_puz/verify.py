@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Check that converting CCJ files to .puz loses nothing, across a corpus
+
+For each .ccj file (or .ccj member of an archive) this parses it,
+writes the .puz file in memory, reads that back with puz_read and
+compares the two: the dimensions, the solution and the empty grid,
+the number of clues in the header, the title, author and copyright,
+and the label, text and order of every clue, and (with --checksums)
+that the checksums are right.  The files are spread over one worker
+process per core, so a whole archive can be checked before a deploy:
+
+  ccj-to-puz-verify ~/crosswords/*.ccj ~/crosswords/old.tar.gz
+
+Files that can't be parsed at all are reported separately from those
+that round-trip wrongly; the exit status is non-zero if there are any
+of the latter (or of the former, unless --ignore-unparseable)."""
+
+from __future__ import print_function
+
+import sys
+import time
+from optparse import OptionParser
+
+from ccj_to_puz.archive import iterate_inputs
+from ccj_to_puz.batch import find_ccj_files, map_in_batches, \
+    parse_with_metadata
+from ccj_to_puz.ccj_parse import MASK_TO_EMPTY_PUZ_GRID, \
+    ensure_sys_argv_is_decoded
+from ccj_to_puz.puz_read import PuzReadError, read_puz_bytes
+
+# Stop listing the clues that differ after this many, per puzzle:
+MAXIMUM_CLUE_DIFFERENCES = 5
+
+class VerificationResult(object):
+    """What was found for one input
+
+    error is set if the CCJ file couldn't be converted at all, and
+    differences is a list of descriptions of what didn't match."""
+    def __init__(self, source):
+        self.source = source
+        self.error = None
+        self.differences = []
+        self.seconds = 0.0
+
+    def matched(self):
+        return self.error is None and not self.differences
+
+def clue_tuples(ordered_clues):
+    """Return (number, across, label, text) for each of ordered_clues"""
+    return [(c.all_clue_numbers[0][0], c.across, label, text)
+            for c, label, text in ordered_clues]
+
+def describe_clue(t):
+    if t is None:
+        return "nothing"
+    number, across, label, text = t
+    return u"{0}{1} [{2}] {3}".format(number, "A" if across else "D",
+                                     label, text)
+
+def compare(parsed, ordered_clues, puz):
+    """Return a list of the differences between parsed and puz
+
+    parsed is the ParsedCCJ that was written out, ordered_clues the
+    result of its ordered_clues(), and puz the ParsedPuz read back."""
+    differences = []
+    def differ(what, expected, found):
+        differences.append(u"{0}: expected {1!r}, found {2!r}".format(
+            what, expected, found))
+    if (parsed.width, parsed.height) != (puz.width, puz.height):
+        differ("dimensions", (parsed.width, parsed.height),
+               (puz.width, puz.height))
+        return differences
+    if puz.number_of_clues != len(ordered_clues):
+        differ("number of clues in the header", len(ordered_clues),
+               puz.number_of_clues)
+    lights = bytes(parsed.grid.light_mask())
+    if lights != bytes(puz.grid.light_mask()):
+        differences.append("the pattern of blocks differs")
+    elif bytes(parsed.grid.letter_bytes()) != bytes(puz.grid.letter_bytes()):
+        differences.append("the solution differs")
+    if puz.player_grid != lights.translate(MASK_TO_EMPTY_PUZ_GRID):
+        differences.append("the empty grid differs")
+    for name in ('title', 'author', 'copyright_message'):
+        if getattr(parsed, name) != getattr(puz, name):
+            differ(name, getattr(parsed, name), getattr(puz, name))
+    expected = clue_tuples(ordered_clues)
+    found = clue_tuples(puz.ordered_clues())
+    clue_differences = [(e, f) for e, f in
+                        zip(expected + [None] * (len(found) - len(expected)),
+                            found + [None] * (len(expected) - len(found)))
+                        if e != f]
+    for e, f in clue_differences[:MAXIMUM_CLUE_DIFFERENCES]:
+        differences.append(u"clue: expected {0}, found {1}".format(
+            describe_clue(e), describe_clue(f)))
+    if len(clue_differences) > MAXIMUM_CLUE_DIFFERENCES:
+        differences.append("... and {0} more clues differ".format(
+            len(clue_differences) - MAXIMUM_CLUE_DIFFERENCES))
+    for name in puz.bad_checksums:
+        differences.append("the {0} checksum is wrong".format(name))
+    return differences
+
+def verify_job(job):
+    """Convert and verify one input, returning a VerificationResult
+
+    job is as generated by archive.iterate_inputs, with a metadata
+    dictionary (as for batch.convert_file) added."""
+    source, _, data, metadata = job
+    result = VerificationResult(source)
+    start = time.time()
+    try:
+        if isinstance(data, Exception):
+            raise data
+        parsed = parse_with_metadata(data, metadata)
+        ordered_clues = parsed.ordered_clues()
+        puz_bytes = parsed.to_puz_bytes(
+            checksums=metadata.get('checksums', False),
+            ordered_clues=ordered_clues)
+    except Exception as e:
+        result.error = "{0}: {1}".format(e.__class__.__name__, e)
+    else:
+        try:
+            puz = read_puz_bytes(puz_bytes)
+        except PuzReadError as e:
+            result.differences.append("couldn't read the .puz file back: " +
+                                      str(e))
+        else:
+            result.differences = compare(parsed, ordered_clues, puz)
+            if metadata.get('checksums') and not puz.has_checksums:
+                result.differences.append("the checksums are missing")
+    result.seconds = time.time() - start
+    return result
+
+def verify_inputs(paths, metadata=None, processes=None):
+    """Generate a VerificationResult for each .ccj file in paths
+
+    Archives among paths are read as for ccj-to-puz-batch."""
+    if metadata is None:
+        metadata = {}
+    jobs = (source + (metadata,) for source in iterate_inputs(paths))
+    return map_in_batches(verify_job, jobs, processes)
+
+def main():
+    parser = OptionParser(usage="%prog [options] DIRECTORY-OR-GLOB...")
+    parser.add_option('-j', '--jobs', dest='jobs', type='int',
+                      help="number of worker processes (default: one per core)")
+    parser.add_option('-k', '--checksums', dest='checksums',
+                      action="store_true", default=False,
+                      help="write and check the AcrossLite checksums")
+    parser.add_option('-t', '--title', dest='title',
+                      help="specify the crossword title")
+    parser.add_option('-a', '--author', dest='author',
+                      help="specify the crossword author or setter")
+    parser.add_option('-c', '--copyright', dest='copyright_message',
+                      help="specify the copyright message")
+    parser.add_option('--ignore-unparseable', dest='ignore_unparseable',
+                      action="store_true", default=False,
+                      help="don't fail because of files that can't be "
+                      "parsed at all")
+    parser.add_option('-q', '--quiet', dest='quiet', action="store_true",
+                      default=False,
+                      help="only print the summary")
+
+    ensure_sys_argv_is_decoded()
+    (options, args) = parser.parse_args()
+
+    if not args:
+        parser.error("You must specify at least one directory or glob")
+    input_paths = find_ccj_files(args)
+    if not input_paths:
+        raise Exception("No .ccj files found in: " + ", ".join(args))
+
+    metadata = {'title': options.title,
+                'author': options.author,
+                'copyright_message': options.copyright_message,
+                'checksums': options.checksums}
+
+    start = time.time()
+    verified = mismatched = unparseable = 0
+    for result in verify_inputs(input_paths, metadata, options.jobs):
+        if result.error:
+            unparseable += 1
+            if not options.quiet:
+                print("UNPARSEABLE {0}: {1}".format(result.source,
+                                                    result.error))
+        elif result.differences:
+            mismatched += 1
+            if not options.quiet:
+                print("MISMATCH " + result.source)
+                for d in result.differences:
+                    print("  " + d)
+        else:
+            verified += 1
+    elapsed = time.time() - start
+    message = "Checked {0} puzzles in {1:.2f}s: {2} mismatched, " + \
+        "{3} couldn't be parsed"
+    print(message.format(verified + mismatched + unparseable, elapsed,
+                         mismatched, unparseable))
+    if mismatched or (unparseable and not options.ignore_unparseable):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
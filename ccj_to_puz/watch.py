@@ -0,0 +1,467 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Watch directories for new or changed CCJ files and convert just those
+
+Feed fetchers drop .ccj files into directories throughout the day, and
+running ccj-to-puz-batch over the whole of each directory every time
+converts everything again.  A Watcher instead keeps a manifest (a JSON
+file) of the size, modification time and SHA-256 of every file it has
+seen, and on each poll:
+
+  - lists the watched directories, getting the size and modification
+    time of each .ccj file from the same scan (os.scandir, where the
+    Python has it)
+  - skips any file whose size and modification time match the
+    manifest, without reading it
+  - reads and hashes the rest, and skips those whose contents haven't
+    actually changed (e.g. a feed fetched again)
+  - converts what's left with a scheduler.Scheduler, so a file that
+    hangs or crashes its worker process fails on its own (and can be
+    quarantined) rather than stopping the daemon, writing each .puz
+    file atomically, and records the results in the manifest (where a
+    file from another watched directory already has an output of the
+    same name, a number is added, e.g. 2020-01-02-2.puz)
+
+A file that fails to convert isn't tried again until it changes, but
+one that couldn't be read or whose .puz file couldn't be written is
+tried again on the next poll.  Files modified in the last few seconds
+are left until the next poll, in case they're still being written.
+The manifest is written (atomically) after every few hundred
+conversions, so a daemon that's restarted carries on where it left
+off without converting anything again.
+
+From the command line:
+
+  ccj-to-puz-watch -o ~/puz ~/feeds/guardian ~/feeds/herald
+  ccj-to-puz-watch --once -o ~/puz ~/feeds/guardian   # e.g. from cron"""
+
+from __future__ import print_function
+
+import hashlib
+import io
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from optparse import OptionParser
+
+from ccj_to_puz.archive import convert_member
+from ccj_to_puz.batch import default_number_of_processes, output_path_for
+from ccj_to_puz.ccj_parse import ensure_sys_argv_is_decoded
+from ccj_to_puz.fingerprint import release_for_job
+from ccj_to_puz.fsutil import atomic_write, makedirs_if_missing
+from ccj_to_puz.scheduler import DEFAULT_RETRIES, DEFAULT_TIMEOUT, Scheduler
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = '.ccj-to-puz-manifest.json'
+DEFAULT_INTERVAL = 10.0
+# Files modified more recently than this may still be being written:
+DEFAULT_SETTLE_SECONDS = 2.0
+# How many files to convert between writes of the manifest, per
+# worker process:
+FILES_PER_PROCESS = 64
+
+def scan_directory(directory):
+    """Generate (path, size, mtime) for each .ccj file in directory"""
+    if hasattr(os, 'scandir'):
+        for entry in os.scandir(directory):
+            if not entry.name.lower().endswith('.ccj'):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+            except OSError:
+                # It's been removed since the directory was listed:
+                continue
+            yield entry.path, st.st_size, st.st_mtime
+    else:
+        for name in os.listdir(directory):
+            if not name.lower().endswith('.ccj'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if os.path.isfile(path):
+                yield path, st.st_size, st.st_mtime
+
+def sha256_of(data):
+    return hashlib.sha256(data).hexdigest()
+
+class Manifest(object):
+    """The files a Watcher has seen, kept in a JSON file
+
+    files maps the path of each .ccj file to a dictionary with the
+    keys 'size', 'mtime', 'sha256', 'output' (the .puz file written
+    for it, or None if it wasn't because it failed or duplicates
+    another puzzle) and 'error' (None if it was converted)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        self.dirty = False
+
+    def load(self):
+        """Read the manifest, if it's there, returning self"""
+        try:
+            with io.open(self.path, 'r', encoding='utf-8') as f:
+                contents = json.load(f)
+        except EnvironmentError:
+            return self
+        if contents.get('version') != MANIFEST_VERSION:
+            message = "Unknown manifest version {0} in {1}"
+            raise Exception(message.format(contents.get('version'),
+                                           self.path))
+        self.files = contents['files']
+        return self
+
+    def save(self):
+        """Write the manifest atomically, if anything has changed"""
+        if not self.dirty:
+            return
+        contents = {'version': MANIFEST_VERSION, 'files': self.files}
+        text = json.dumps(contents, indent=1, separators=(',', ': '),
+                          sort_keys=True)
+        makedirs_if_missing(os.path.dirname(self.path) or '.')
+        atomic_write(self.path, text.encode('utf-8'))
+        self.dirty = False
+
+    def unchanged(self, path, size, mtime):
+        entry = self.files.get(path)
+        return entry is not None and \
+            entry['size'] == size and entry['mtime'] == mtime
+
+    def record(self, path, size, mtime, digest, output=None, error=None):
+        self.files[path] = {'size': size,
+                            'mtime': mtime,
+                            'sha256': digest,
+                            'output': output,
+                            'error': error}
+        self.dirty = True
+
+    def forget_missing(self, paths, unscanned_directories=()):
+        """Drop the entries of files that aren't in paths any more
+
+        Entries for files in unscanned_directories (e.g. ones that
+        couldn't be listed because a share was unmounted) are kept,
+        since their files may well still be there."""
+        prefixes = tuple(os.path.join(d, '') for d in unscanned_directories)
+        for path in set(self.files) - set(paths):
+            if prefixes and path.startswith(prefixes):
+                continue
+            del self.files[path]
+            self.dirty = True
+
+class Watcher(object):
+    """A class for converting the new and changed .ccj files in directories
+
+    metadata is a dictionary as for batch.convert_file, and timeout,
+    memory_limit, retries and quarantine_directory are as for
+    scheduler.Scheduler.  Call poll() to convert whatever has changed,
+    or run() to keep polling, and close() when you've finished."""
+
+    def __init__(self,
+                 directories,
+                 output_directory,
+                 manifest_path=None,
+                 metadata=None,
+                 processes=None,
+                 settle_seconds=DEFAULT_SETTLE_SECONDS,
+                 timeout=DEFAULT_TIMEOUT,
+                 memory_limit=None,
+                 retries=DEFAULT_RETRIES,
+                 quarantine_directory=None,
+                 out=sys.stdout):
+        self.directories = directories
+        self.output_directory = output_directory
+        if manifest_path is None:
+            manifest_path = os.path.join(output_directory, MANIFEST_NAME)
+        self.manifest = Manifest(manifest_path).load()
+        self.metadata = metadata or {}
+        if processes is None:
+            processes = default_number_of_processes()
+        self.processes = processes
+        self.scheduler = Scheduler(processes,
+                                   timeout=timeout,
+                                   memory_limit=memory_limit,
+                                   retries=retries,
+                                   quarantine_directory=quarantine_directory,
+                                   function=convert_member)
+        self.settle_seconds = settle_seconds
+        self.out = out
+        # The path of the .ccj file that each output belongs to:
+        self.output_owners = {}
+        self.stopping = threading.Event()
+        makedirs_if_missing(output_directory)
+
+    def scan(self):
+        """Return (path, size, mtime) for the watched files, and failures
+
+        The result is a tuple of that list and a list of the
+        directories that couldn't be scanned."""
+        found = []
+        failed = []
+        for directory in self.directories:
+            try:
+                found.extend(scan_directory(directory))
+            except OSError as e:
+                print("Couldn't scan {0}: {1}".format(directory, e),
+                      file=self.out)
+                failed.append(directory)
+        return found, failed
+
+    def find_output_owners(self):
+        """Work out which file each output in the manifest belongs to
+
+        If several files share an output (as they could before output
+        names were made unique), the output belongs to the first of
+        them, and they're all marked as changed so that they're
+        converted again: the others under names of their own."""
+        sharing = {}
+        for path in sorted(self.manifest.files):
+            output = self.manifest.files[path]['output']
+            if output:
+                sharing.setdefault(output, []).append(path)
+        self.output_owners = {}
+        for output, paths in sharing.items():
+            self.output_owners[output] = paths[0]
+            if len(paths) == 1:
+                continue
+            for k, path in enumerate(paths):
+                entry = self.manifest.files[path]
+                if k > 0:
+                    entry['output'] = None
+                entry['mtime'] = None
+                entry['sha256'] = None
+            self.manifest.dirty = True
+
+    def output_path_for(self, path):
+        """Return where to write the .puz file for the .ccj file path
+
+        Files with the same name in different watched directories
+        would overwrite each other's output, so, as in
+        archive.ZipWriter, a number is added to the name of an output
+        that belongs to another file.  The manifest keeps each file's
+        output the same from one poll to the next."""
+        entry = self.manifest.files.get(path)
+        if entry is not None and entry['output'] and \
+                self.output_owners.get(entry['output']) == path:
+            return entry['output']
+        output_path = output_path_for(path, self.output_directory)
+        base, extension = os.path.splitext(output_path)
+        n = 1
+        while self.output_owners.get(output_path, path) != path:
+            n += 1
+            output_path = "{0}-{1}{2}".format(base, n, extension)
+        self.output_owners[output_path] = path
+        return output_path
+
+    def jobs(self, candidates):
+        """Generate a conversion job for each candidate that has changed
+
+        The files are read and hashed here, one at a time as jobs
+        are taken; any whose contents match the manifest just have
+        their size and modification time updated."""
+        for path, size, mtime in candidates:
+            try:
+                with io.open(path, 'rb') as f:
+                    data = f.read()
+            except EnvironmentError:
+                # It's gone; the next scan will notice.
+                continue
+            digest = sha256_of(data)
+            entry = self.manifest.files.get(path)
+            if entry is not None and entry['sha256'] == digest:
+                self.manifest.record(path, size, mtime, digest,
+                                     entry['output'], entry['error'])
+                continue
+            output_path = self.output_path_for(path)
+            yield ((path, output_path, data, self.metadata),
+                   (size, mtime, digest))
+
+    def poll(self):
+        """Convert anything new or changed, returning the ConversionResults"""
+        scanned, failed_directories = self.scan()
+        self.manifest.forget_missing([p for p, _, _ in scanned],
+                                     failed_directories)
+        self.find_output_owners()
+        settled_before = time.time() - self.settle_seconds
+        candidates = [(p, size, mtime) for p, size, mtime in scanned
+                      if mtime <= settled_before and
+                      not self.manifest.unchanged(p, size, mtime)]
+        results = []
+        if not candidates:
+            self.manifest.save()
+            return results
+        # The size, mtime and SHA-256 of each job handed to the
+        # scheduler, by its index:
+        pending = {}
+        def jobs():
+            for index, (job, info) in enumerate(self.jobs(candidates)):
+                if self.stopping.is_set():
+                    # Let the conversions in progress finish:
+                    return
+                pending[index] = info
+                yield job
+        save_every = FILES_PER_PROCESS * max(1, self.processes)
+        for index, result in self.scheduler.results(jobs()):
+            size, mtime, digest = pending.pop(index)
+            write_failed = False
+            if result.output_data is not None:
+                try:
+                    atomic_write(result.output_path, result.output_data)
+                except EnvironmentError as e:
+                    result.error = "{0}: {1}".format(
+                        e.__class__.__name__, e)
+                    write_failed = True
+                    release_for_job(result.input_path, self.metadata)
+                result.output_data = None
+            # A failed write (e.g. a full disk) or an I/O error reading
+            # the file says nothing about the file itself, so leave it
+            # out of the manifest to be tried again on the next poll:
+            if not (write_failed or result.transient):
+                output = None
+                if result.succeeded() and result.duplicate_of is None:
+                    output = result.output_path
+                self.manifest.record(result.input_path,
+                                     size,
+                                     mtime,
+                                     digest,
+                                     output,
+                                     result.error)
+            self.report(result)
+            results.append(result)
+            if len(results) % save_every == 0:
+                self.manifest.save()
+        self.manifest.save()
+        return results
+
+    def report(self, result):
+        if result.duplicate_of is not None:
+            print("Skipped {0}, a duplicate of {1}".format(
+                result.input_path, result.duplicate_of), file=self.out)
+        elif result.succeeded():
+            print("Converted {0} -> {1}".format(result.input_path,
+                                                result.output_path),
+                  file=self.out)
+        else:
+            print("FAILED {0}: {1}".format(result.input_path, result.error),
+                  file=self.out)
+        self.out.flush()
+
+    def run(self, interval=DEFAULT_INTERVAL):
+        """Poll every interval seconds until stop() is called"""
+        while not self.stopping.is_set():
+            self.poll()
+            self.stopping.wait(interval)
+
+    def stop(self, *args):
+        """Stop once the conversions in progress have finished
+
+        This can be a signal handler."""
+        self.stopping.set()
+
+    def close(self):
+        self.manifest.save()
+
+def main():
+    parser = OptionParser(usage="%prog -o OUTPUT-DIRECTORY [options] "
+                          "DIRECTORY...")
+    parser.add_option('-o', '--output-directory', dest='output_directory',
+                      help="write the .puz files to this directory")
+    parser.add_option('-m', '--manifest', dest='manifest',
+                      help="keep the manifest in this file (default: "
+                      + MANIFEST_NAME + " in the output directory)")
+    parser.add_option('-i', '--interval', dest='interval', type='float',
+                      default=DEFAULT_INTERVAL,
+                      help="seconds between polls (default: %default)")
+    parser.add_option('--settle', dest='settle', type='float',
+                      default=DEFAULT_SETTLE_SECONDS, metavar='SECONDS',
+                      help="leave files modified this recently until the "
+                      "next poll (default: %default)")
+    parser.add_option('--once', dest='once', action="store_true",
+                      default=False,
+                      help="poll once and exit, rather than running as a "
+                      "daemon")
+    parser.add_option('-j', '--jobs', dest='jobs', type='int',
+                      help="number of worker processes (default: one per core)")
+    parser.add_option('--timeout', dest='timeout', type='float',
+                      default=DEFAULT_TIMEOUT, metavar='SECONDS',
+                      help="give up on any file that takes longer than this "
+                      "(default: %default; 0 for no limit)")
+    parser.add_option('--memory-limit', dest='memory_limit', type='int',
+                      metavar='MB',
+                      help="limit each worker process to this much memory")
+    parser.add_option('--retries', dest='retries', type='int',
+                      default=DEFAULT_RETRIES,
+                      help="number of times to retry a file after an I/O "
+                      "error (default: %default)")
+    parser.add_option('--quarantine', dest='quarantine_directory',
+                      metavar='DIR',
+                      help="move inputs that fail to convert into DIR")
+    parser.add_option('-k', '--checksums', dest='checksums',
+                      action="store_true", default=False,
+                      help="include the AcrossLite checksums in the output")
+    parser.add_option('--fingerprints', dest='fingerprint_index',
+                      metavar='FILE',
+                      help="skip puzzles already converted from other "
+                      "sources, as recorded in this index")
+    parser.add_option('--ignore-clues', dest='ignore_clues',
+                      action="store_true", default=False,
+                      help="with --fingerprints, count puzzles with the same "
+                      "grid as duplicates even if their clues differ")
+    parser.add_option('-t', '--title', dest='title',
+                      help="specify the crossword title")
+    parser.add_option('-a', '--author', dest='author',
+                      help="specify the crossword author or setter")
+    parser.add_option('-c', '--copyright', dest='copyright_message',
+                      help="specify the copyright message")
+
+    ensure_sys_argv_is_decoded()
+    (options, args) = parser.parse_args()
+
+    if not args:
+        parser.error("You must specify at least one directory to watch")
+    if not options.output_directory:
+        parser.error("You must specify an output directory with -o")
+
+    metadata = {'title': options.title,
+                'author': options.author,
+                'copyright_message': options.copyright_message,
+                'checksums': options.checksums,
+                'fingerprint_index': options.fingerprint_index,
+                'ignore_clues': options.ignore_clues}
+
+    memory_limit = None
+    if options.memory_limit:
+        memory_limit = options.memory_limit * 1024 * 1024
+
+    watcher = Watcher(args,
+                      options.output_directory,
+                      options.manifest,
+                      metadata,
+                      options.jobs,
+                      options.settle,
+                      timeout=options.timeout or None,
+                      memory_limit=memory_limit,
+                      retries=options.retries,
+                      quarantine_directory=options.quarantine_directory)
+    try:
+        if options.once:
+            results = watcher.poll()
+            if any(not r.succeeded() for r in results):
+                sys.exit(1)
+        else:
+            signal.signal(signal.SIGTERM, watcher.stop)
+            signal.signal(signal.SIGINT, watcher.stop)
+            watcher.run(options.interval)
+    finally:
+        watcher.close()
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,14 @@ setup(
     url = "http://longair.net/blog/2009/07/24/avoiding-crossword-applets/",
     entry_points = {
         'console_scripts': [
-            'ccj-to-puz = ccj_to_puz.ccj_parse:main'
+            'ccj-to-puz = ccj_to_puz.ccj_parse:main',
+            'ccj-to-puz-batch = ccj_to_puz.batch:main',
+            'ccj-to-puz-server = ccj_to_puz.server:main',
+            'ccj-to-puz-index = ccj_to_puz.index:main',
+            'ccj-to-puz-columns = ccj_to_puz.columnar:main',
+            'ccj-to-puz-watch = ccj_to_puz.watch:main',
+            'ccj-to-puz-verify = ccj_to_puz.verify:main',
+            'ccj-to-puz-duplicates = ccj_to_puz.fingerprint:main'
         ]
     }
 )
@@ -0,0 +1,27 @@
+"""The sample crosswords in data/ that the tests share
+
+Each NAME.ccj is a synthetic crossword, and NAME.puz is what the
+original ccj_parse.py wrote for it when given METADATA as the title,
+author, puzzle number, copyright message and date.  NAME.numbers.json
+is the clue_numbers of the original Grid for it."""
+
+import io
+import os
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'data')
+NAMES = ['standard', 'linked', 'cp1252', 'small']
+METADATA = (u'Title', u'Setter', None, u'(c) Test', '2020-01-02')
+
+def sample_path(name, extension='.ccj'):
+    return os.path.join(DATA_DIRECTORY, name + extension)
+
+def read_sample(name, extension='.ccj'):
+    with io.open(sample_path(name, extension), 'rb') as f:
+        return f.read()
+
+def parse_sample(name):
+    from ccj_to_puz.ccj_parse import ParsedCCJ
+    parsed = ParsedCCJ()
+    parsed.read_from_bytes(read_sample(name), *METADATA)
+    return parsed
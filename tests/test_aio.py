@@ -0,0 +1,98 @@
+"""Tests for converting crosswords from asyncio code"""
+
+import json
+import sys
+import time
+
+import pytest
+
+if sys.version_info < (3, 7):
+    pytest.skip("aio needs Python 3.7", allow_module_level=True)
+
+import asyncio
+
+from ccj_to_puz import aio
+from ccj_to_puz.commonccj import CCJParseError
+from samples import METADATA, read_sample
+
+METADATA_DICTIONARY = dict(zip(['title', 'author', 'puzzle_number',
+                                'copyright_message', 'date_string'],
+                               METADATA))
+
+def slow_convert_to_bytes(data, metadata, output_format):
+    time.sleep(0.3)
+    return b'slow'
+
+@pytest.fixture
+def converter():
+    converter = aio.AsyncConverter(workers=1, use_threads=True,
+                                   max_pending=2)
+    yield converter
+    converter.shutdown()
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+def stream_of(loop, data):
+    reader = asyncio.StreamReader(loop=loop)
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+class Lines(object):
+    """An async iterable of the lines of data, without a read() method"""
+    def __init__(self, loop, data):
+        self.reader = stream_of(loop, data)
+
+    def __aiter__(self):
+        return self.reader.__aiter__()
+
+def test_bytes_and_an_async_iterable_give_the_same_output(converter, loop):
+    data = read_sample('linked')
+    from_bytes = loop.run_until_complete(
+        converter.convert(data, **METADATA_DICTIONARY))
+    from_lines = loop.run_until_complete(
+        converter.convert(Lines(loop, data), **METADATA_DICTIONARY))
+    assert from_bytes == from_lines == read_sample('linked', '.puz')
+
+def test_a_stream_reader(converter, loop):
+    reader = stream_of(loop, read_sample('standard'))
+    ipuz = loop.run_until_complete(
+        converter.convert(reader, output_format='ipuz',
+                          **METADATA_DICTIONARY))
+    ipuz = json.loads(ipuz.decode('utf-8'))
+    assert ipuz['title'].startswith(METADATA[0])
+
+def test_errors(converter, loop):
+    with pytest.raises(CCJParseError):
+        loop.run_until_complete(converter.convert(b'junk'))
+    with pytest.raises(TypeError):
+        loop.run_until_complete(converter.convert(b'', colour='red'))
+    converter.max_input_size = 10
+    with pytest.raises(aio.InputTooLarge):
+        loop.run_until_complete(
+            converter.convert(stream_of(loop, b'x' * 20)))
+    assert converter.pending == 0
+
+def test_a_timed_out_conversion_keeps_its_slot(monkeypatch, converter, loop):
+    monkeypatch.setattr(aio, 'convert_to_bytes', slow_convert_to_bytes)
+    converter.timeout = 0.05
+    with pytest.raises(aio.ConversionTimeout):
+        loop.run_until_complete(converter.convert(b''))
+    # The worker is still busy with it:
+    assert converter.pending == 1
+    converter.timeout = 1.0
+    start = time.time()
+    # This waits for the abandoned conversion to finish, so another
+    # is one too many:
+    first = loop.create_task(converter.convert(b''))
+    loop.run_until_complete(asyncio.sleep(0))
+    with pytest.raises(aio.ConverterBusy):
+        loop.run_until_complete(converter.convert(b''))
+    assert loop.run_until_complete(first) == b'slow'
+    # (That's the rest of the abandoned conversion and all of this one.)
+    assert time.time() - start > 0.4
+    assert converter.pending == 0
@@ -0,0 +1,128 @@
+"""Tests for converting the .ccj files in zip and tar archives"""
+
+import io
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from ccj_to_puz.archive import DirectoryWriter, ZipWriter, convert_inputs, \
+    iterate_archive, map_file, output_name_for, stored_zip_member
+from samples import METADATA, NAMES, read_sample
+
+METADATA_DICTIONARY = dict(zip(['title', 'author', 'puzzle_number',
+                                'copyright_message', 'date_string'],
+                               METADATA))
+
+def make_zip(path, compression):
+    with zipfile.ZipFile(path, 'w', compression) as archive:
+        for name in NAMES:
+            archive.writestr('puzzles/' + name + '.ccj', read_sample(name))
+        archive.writestr('README.txt', b'Not a crossword')
+
+def make_tar(path, mode):
+    archive = tarfile.open(path, mode)
+    try:
+        for name in NAMES:
+            data = read_sample(name)
+            info = tarfile.TarInfo('puzzles/' + name + '.ccj')
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    finally:
+        archive.close()
+
+ARCHIVES = [('stored.zip', make_zip, zipfile.ZIP_STORED),
+            ('deflated.zip', make_zip, zipfile.ZIP_DEFLATED),
+            ('plain.tar', make_tar, 'w'),
+            ('compressed.tar.gz', make_tar, 'w:gz')]
+
+@pytest.mark.parametrize('filename, make, mode', ARCHIVES)
+def test_the_members_are_read(tmpdir, filename, make, mode):
+    path = str(tmpdir.join(filename))
+    make(path, mode)
+    members = [(name, bytes(data)) for name, data in iterate_archive(path)]
+    assert members == [('puzzles/' + name + '.ccj', read_sample(name))
+                       for name in NAMES]
+
+def test_a_stored_member_with_the_wrong_crc_is_not_sliced(tmpdir):
+    path = str(tmpdir.join('stored.zip'))
+    make_zip(path, zipfile.ZIP_STORED)
+    with open(path, 'rb') as f:
+        mapped = map_file(f)
+        try:
+            archive = zipfile.ZipFile(f)
+            info = archive.infolist()[0]
+            assert stored_zip_member(mapped, info) == read_sample(NAMES[0])
+            info.CRC ^= 1
+            assert stored_zip_member(mapped, info) is None
+        finally:
+            mapped.close()
+
+def test_output_names_stay_inside_the_output_directory():
+    assert output_name_for('a/b/c.ccj') == 'a/b/c.puz'
+    assert output_name_for('/etc/../../x.ccj') == 'etc/x.puz'
+    assert output_name_for('..\\..\\y.CCJ') == 'y.puz'
+
+def test_converting_into_a_directory(tmpdir):
+    path = str(tmpdir.join('plain.tar'))
+    make_tar(path, 'w')
+    output = tmpdir.mkdir('output')
+    writer = DirectoryWriter(str(output))
+    results = convert_inputs([path], writer, METADATA_DICTIONARY, 1)
+    assert [r.error for r in results] == [None] * len(NAMES)
+    for name in NAMES:
+        with open(str(output.join('puzzles', name + '.puz')), 'rb') as f:
+            assert f.read() == read_sample(name, '.puz')
+
+def test_converting_into_a_zip_file(tmpdir):
+    paths = []
+    for filename, make, mode in ARCHIVES[:2]:
+        paths.append(str(tmpdir.join(filename)))
+        make(paths[-1], mode)
+    output = str(tmpdir.join('output.zip'))
+    writer = ZipWriter(output)
+    try:
+        results = convert_inputs(paths, writer, METADATA_DICTIONARY, 1)
+    finally:
+        writer.close()
+    assert [r.error for r in results] == [None] * (2 * len(NAMES))
+    with zipfile.ZipFile(output) as archive:
+        names = sorted(archive.namelist())
+        assert names == sorted(['puzzles/{0}{1}.puz'.format(name, suffix)
+                                for name in NAMES for suffix in ('', '-2')])
+        for name in NAMES:
+            assert archive.read('puzzles/' + name + '-2.puz') == \
+                read_sample(name, '.puz')
+
+def test_an_unreadable_archive_is_reported(tmpdir):
+    path = str(tmpdir.join('broken.zip'))
+    with open(path, 'wb') as f:
+        f.write(b'PK not really')
+    results = convert_inputs([path], DirectoryWriter(str(tmpdir)), {}, 1)
+    assert len(results) == 1
+    assert results[0].error_type in ('BadZipFile', 'BadZipfile')
+
+def test_a_bad_crc_fails_the_archive_but_not_the_batch(tmpdir):
+    data = read_sample('standard')
+    bad_path = str(tmpdir.join('bad.zip'))
+    with zipfile.ZipFile(bad_path, 'w', zipfile.ZIP_STORED) as archive:
+        archive.writestr('bad.ccj', data)
+    with open(bad_path, 'rb') as f:
+        contents = bytearray(f.read())
+    contents[bytes(contents).index(data) + len(data) // 2] ^= 0xff
+    with open(bad_path, 'wb') as f:
+        f.write(contents)
+    good_path = str(tmpdir.join('good.ccj'))
+    with open(good_path, 'wb') as f:
+        f.write(read_sample('small'))
+    output = tmpdir.mkdir('output')
+    results = convert_inputs([bad_path, good_path],
+                             DirectoryWriter(str(output)),
+                             METADATA_DICTIONARY,
+                             processes=1)
+    assert [r.input_path for r in results] == [bad_path, good_path]
+    # (zipfile.BadZipfile was renamed BadZipFile in Python 3.2.)
+    assert results[0].error_type in ('BadZipFile', 'BadZipfile')
+    assert results[1].succeeded()
+    assert output.join('good.puz').exists()
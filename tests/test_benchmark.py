@@ -0,0 +1,25 @@
+"""Tests for timing the import of the ccj-to-puz script's module"""
+
+import os
+import subprocess
+import sys
+
+import ccj_to_puz
+from ccj_to_puz.benchmark import ENTRY_POINT_MODULE, time_import
+
+def test_the_script_module_defers_slow_imports():
+    seconds, deferred_imported = time_import(ENTRY_POINT_MODULE, 1)
+    assert seconds >= 0
+    assert deferred_imported == []
+
+def test_tracing_still_works_once_logging_is_configured():
+    script = ("import logging, sys\n"
+              "logging.basicConfig(stream=sys.stdout, level=logging.DEBUG,"
+              " format='%(message)s')\n"
+              "from ccj_to_puz import tracing\n"
+              "tracing.get_tracer('test').warning('{0} warning', 'a')\n")
+    package_parent = os.path.dirname(os.path.dirname(
+        os.path.abspath(ccj_to_puz.__file__)))
+    output = subprocess.check_output([sys.executable, '-c', script],
+                                     cwd=package_parent)
+    assert output.decode('ascii').strip() == 'a warning'
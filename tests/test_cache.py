@@ -0,0 +1,61 @@
+"""Tests for the on-disk cache of parsed crosswords"""
+
+import os
+import zlib
+
+import pytest
+
+from ccj_to_puz.cache import ConversionCache, decode_entry, encode_entry
+from ccj_to_puz.ccj_parse import ParsedCCJ
+from samples import METADATA, NAMES, parse_sample, read_sample
+
+@pytest.mark.parametrize('name', NAMES)
+def test_entries_round_trip(name):
+    record = parse_sample(name).to_record()
+    assert decode_entry(encode_entry(record)) == record
+
+@pytest.mark.parametrize('name', NAMES)
+def test_a_hit_gives_the_same_output(tmpdir, name):
+    data = read_sample(name)
+    cache = ConversionCache(str(tmpdir))
+    assert cache.get(data) is None
+    cache.parse(data, *METADATA)
+    parsed = cache.get(data)
+    assert parsed is not None
+    parsed.set_metadata(*METADATA)
+    assert parsed.to_puz_bytes() == read_sample(name, '.puz')
+
+def corrupt_entry(kind, record):
+    if kind == 'empty':
+        return b''
+    elif kind == 'header':
+        return zlib.compress(b'CCJC')
+    elif kind == 'truncated':
+        return zlib.compress(zlib.decompress(encode_entry(record))[:-1])
+
+@pytest.mark.parametrize('kind', ['empty', 'header', 'truncated'])
+def test_a_corrupt_entry_is_a_miss(tmpdir, kind):
+    data = read_sample('standard')
+    cache = ConversionCache(str(tmpdir))
+    cache.parse(data, *METADATA)
+    path = cache.path_for(cache.key_for(data))
+    serialized = corrupt_entry(kind, parse_sample('standard').to_record())
+    with open(path, 'wb') as f:
+        f.write(serialized)
+    assert cache.get(data) is None
+    assert not os.path.exists(path)
+
+def test_the_least_recently_used_entries_are_evicted(tmpdir):
+    cache = ConversionCache(str(tmpdir))
+    paths = []
+    for k, name in enumerate(NAMES):
+        data = read_sample(name)
+        cache.parse(data, *METADATA)
+        path = cache.path_for(cache.key_for(data))
+        os.utime(path, (1000000 + k, 1000000 + k))
+        paths.append(path)
+    sizes = [os.path.getsize(p) for p in paths]
+    cache.max_bytes = int(sum(sizes[-2:]) / 0.9) + 1
+    cache.evict()
+    assert [os.path.exists(p) for p in paths] == [False, False, True, True]
+    assert cache.total_size() <= cache.max_bytes
@@ -0,0 +1,119 @@
+"""Tests for parsing CCJ files and writing them out as .puz files"""
+
+import io
+import random
+import re
+import unicodedata
+
+import pytest
+
+from ccj_to_puz.ccj_parse import ParsedCCJ, ParsedClue, \
+    ccj_bytes_to_puz_bytes, decode_bytes, decode_bytes_with_encoding
+from ccj_to_puz.commonccj import CCJParseError
+from samples import METADATA, NAMES, parse_sample, read_sample
+
+def written_puz(parsed, tmpdir):
+    path = str(tmpdir.join('out.puz'))
+    parsed.write_to_puz_file(path)
+    with io.open(path, 'rb') as f:
+        return f.read()
+
+@pytest.mark.parametrize('name', NAMES)
+def test_output_matches_the_original(name, tmpdir):
+    assert written_puz(parse_sample(name), tmpdir) == \
+        read_sample(name, '.puz')
+
+@pytest.mark.parametrize('name', NAMES)
+def test_reading_from_a_file(name, tmpdir):
+    parsed = ParsedCCJ()
+    parsed.read_from_ccj(io.BytesIO(read_sample(name)), *METADATA)
+    assert written_puz(parsed, tmpdir) == read_sample(name, '.puz')
+
+def test_any_buffer_can_be_parsed(tmpdir):
+    parsed = ParsedCCJ()
+    parsed.read_from_bytes(bytearray(read_sample('linked')), *METADATA)
+    assert written_puz(parsed, tmpdir) == read_sample('linked', '.puz')
+
+@pytest.mark.parametrize('name', NAMES)
+def test_in_memory_conversion(name):
+    expected = read_sample(name, '.puz')
+    parsed = parse_sample(name)
+    assert parsed.to_puz_bytes() == expected
+    stream = io.BytesIO()
+    parsed.write_to_stream(stream)
+    assert stream.getvalue() == expected
+    assert ccj_bytes_to_puz_bytes(read_sample(name), *METADATA) == expected
+
+def test_the_placeholders_are_not_kept():
+    parsed = parse_sample('linked')
+    across = dict(parsed.across_clues.clue_dictionary)
+    down = dict(parsed.down_clues.clue_dictionary)
+    groups = parsed.clue_dictionaries_with_placeholders()
+    assert len(groups[True]) + len(groups[False]) > len(across) + len(down)
+    for clues, group in ((across, groups[True]), (down, groups[False])):
+        for n, clue in clues.items():
+            assert group[n] is clue
+    assert parsed.to_puz_bytes() == parsed.to_puz_bytes()
+    assert parsed.across_clues.clue_dictionary == across
+    assert parsed.down_clues.clue_dictionary == down
+
+@pytest.mark.parametrize('length', [0, 1, 10, 200, 600])
+def test_a_truncated_file_is_rejected(length):
+    parsed = ParsedCCJ()
+    with pytest.raises(CCJParseError) as e:
+        parsed.read_from_bytes(read_sample('standard')[:length], *METADATA)
+    assert e.value.offset is not None
+
+def test_other_parse_errors_are_typed():
+    with pytest.raises(CCJParseError):
+        ParsedClue().set_number('1', parse_sample('standard').grid)
+    record = parse_sample('standard').to_record()
+    with pytest.raises(CCJParseError):
+        ParsedCCJ.from_record((record[0] + 1,) + tuple(record[1:]))
+
+def original_decode_bytes(b):
+    """Decode b as the original decode_bytes did"""
+    b = bytes(bytearray(c for c in bytearray(b) if c not in (1, 2, 3)))
+    for encoding in ('utf_8', 'latin_1', 'cp1252'):
+        try:
+            s = b.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+        s = re.sub(r'\s+', ' ', s)
+        if not any(unicodedata.category(c) == 'Cc' for c in s):
+            return s
+    raise Exception("Couldn't guess the character set.")
+
+@pytest.mark.parametrize('b, expected, encoding', [
+    (b'Unwise\x02r\x01?\x01\x01 (9)', u'Unwiser? (9)', 'ascii'),
+    (b'Caf\xc3\xa9\n  society (4,7)', u'Caf\xe9 society (4,7)', 'utf_8'),
+    (b'Caf\xe9 (4)', u'Caf\xe9 (4)', 'latin_1'),
+    (b'Dash \x97 it (4)', u'Dash \u2014 it (4)', 'cp1252'),
+])
+def test_decoding(b, expected, encoding):
+    assert decode_bytes_with_encoding(b) == (expected, encoding)
+    encodings = {}
+    assert decode_bytes(b, encodings) == expected
+    assert encodings == {encoding: 1}
+
+@pytest.mark.parametrize('b', [b'Bell\x07 (4)', b'\x81\x8d\x8f'])
+def test_control_characters_are_rejected(b):
+    with pytest.raises(Exception):
+        decode_bytes(b)
+
+def test_decoding_is_unchanged():
+    r = random.Random(1)
+    alphabets = [bytearray(b'abc XYZ(),\t\n\x01\x03'),
+                 bytearray(b'abc \x01\x03\xc3\xa9\xe2\x80\x94'),
+                 bytearray(range(256))]
+    for _ in range(2000):
+        alphabet = r.choice(alphabets)
+        b = bytes(bytearray(r.choice(alphabet)
+                            for _ in range(r.randint(0, 12))))
+        try:
+            expected = original_decode_bytes(b)
+        except Exception:
+            with pytest.raises(Exception):
+                decode_bytes(b)
+        else:
+            assert decode_bytes(b) == expected
@@ -0,0 +1,70 @@
+"""Tests for the columnar store of parsed crosswords"""
+
+import io
+import sys
+
+import pytest
+
+from ccj_to_puz.columnar import ColumnarStore, ColumnarWriter, \
+    columns_record, summarize
+from samples import NAMES, parse_sample
+
+def record_from_store(store, cursor):
+    """Put a puzzle's record back together from the columns"""
+    entries = [(store.entry_number[i],
+                bool(store.entry_across[i]),
+                store.entry_x[i],
+                store.entry_y[i],
+                store.entry_length[i]) for i in cursor.entry_range()]
+    clues = [(bool(store.clue_across[i]),
+              store.clue_numbers[i],
+              store.clue_texts[i],
+              store.all_clue_numbers(i)) for i in cursor.clue_range()]
+    return (cursor.title,
+            cursor.setter,
+            cursor.puzzle_number,
+            cursor.date_string,
+            cursor.width,
+            cursor.height,
+            bytes(cursor.plane('lights')),
+            bytes(cursor.plane('letters')),
+            bytes(cursor.plane('hints')),
+            entries,
+            clues)
+
+@pytest.fixture
+def store(tmpdir):
+    writer = ColumnarWriter()
+    for name in NAMES:
+        writer.add(name, parse_sample(name))
+    path = str(tmpdir.join('test.columns'))
+    writer.write(path)
+    with ColumnarStore(path) as store:
+        yield store
+
+def test_puzzles_round_trip(store):
+    assert len(store) == len(NAMES)
+    # (The same cursor is moved along, so don't zip it with anything.)
+    for cursor in store.puzzles():
+        name = NAMES[cursor.index]
+        assert cursor.name == name
+        expected = columns_record(parse_sample(name))
+        # The entries and clues come back as lists of tuples:
+        expected = expected[:9] + ([tuple(e) for e in expected[9]],
+                                   [tuple(c) for c in expected[10]])
+        assert record_from_store(store, cursor) == expected
+
+def test_linked_clues_keep_their_references(store):
+    linked = parse_sample('linked')
+    cursor = store.puzzle(NAMES.index('linked'))
+    references = [store.all_clue_numbers(i) for i in cursor.clue_range()]
+    assert any(len(r) > 1 for r in references)
+    expected = [[tuple(x) for x in c.all_clue_numbers]
+                for clue_list in (linked.across_clues, linked.down_clues)
+                for c in clue_list.ordered_list_of_clues()]
+    assert references == expected
+
+def test_summarize(store):
+    out = io.StringIO() if sys.version_info >= (3, 0) else io.BytesIO()
+    summarize(store, out)
+    assert "Puzzles: {0}\n".format(len(NAMES)) in out.getvalue()
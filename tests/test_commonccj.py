@@ -0,0 +1,66 @@
+"""Tests for the grid classes"""
+
+import pytest
+
+from ccj_to_puz.commonccj import Cell, CompactGrid, Grid
+from samples import NAMES, parse_sample, read_sample
+
+# Where the solution starts in a .puz file:
+PUZ_SOLUTION_OFFSET = 0x34
+
+def plain_copy(compact):
+    """Return a Grid with a Cell for each light of compact"""
+    grid = Grid(compact.width, compact.height)
+    for y, row in enumerate(compact.cells):
+        for x, cell in enumerate(row):
+            if cell is not None:
+                grid.cells[y][x] = Cell(y, x)
+                grid.cells[y][x].set_letter(cell.letter)
+    return grid
+
+@pytest.mark.parametrize('name', NAMES)
+def test_the_solution_matches_the_original(name):
+    grid = parse_sample(name).grid
+    size = grid.width * grid.height
+    solution = read_sample(name, '.puz')[
+        PUZ_SOLUTION_OFFSET:PUZ_SOLUTION_OFFSET + size]
+    expected = bytearray(0x20 if c == ord('.') else c
+                         for c in bytearray(solution))
+    assert grid.letters == expected
+    assert list(grid.lights) == [0 if c == ord('.') else 1
+                                 for c in bytearray(solution)]
+
+@pytest.mark.parametrize('name', NAMES)
+def test_a_compact_grid_behaves_like_a_grid(name):
+    compact = parse_sample(name).grid
+    grid = plain_copy(compact)
+    for empty in (True, False):
+        assert compact.to_grid_string(empty) == grid.to_grid_string(empty)
+    compact.set_numbers()
+    grid.set_numbers()
+    assert dict(compact.clue_numbers) == dict(grid.clue_numbers)
+    for n in range(len(grid.clue_numbers) + 2):
+        assert compact.clue_directions(n) == grid.clue_directions(n)
+
+def test_cells_read_and_write_the_buffers():
+    grid = CompactGrid.from_buffers(3, 2, bytearray([1, 1, 0, 0, 1, 1]),
+                                    bytearray(b'AB  CD'))
+    assert grid.cells[0][2] is None
+    assert grid.cells[-1][-1].letter == 'D'
+    grid.cells[1][1].set_letter('X')
+    assert grid.letters == bytearray(b'AB  XD')
+    grid.cells[0][0] = None
+    assert grid.lights == bytearray([0, 1, 0, 0, 1, 1])
+    cell = Cell(0, 2)
+    cell.set_letter('Q')
+    grid.cells[0][2] = cell
+    assert grid.to_grid_string(False) == " BQ\n XD\n"
+    assert grid.to_grid_string(True) == " ++\n ++\n"
+    with pytest.raises(IndexError):
+        grid.cells[2]
+    with pytest.raises(IndexError):
+        grid.cells[0][3]
+
+def test_buffers_must_match_the_dimensions():
+    with pytest.raises(Exception):
+        CompactGrid.from_buffers(3, 2, bytearray(6), bytearray(5))
@@ -0,0 +1,115 @@
+"""Tests for claiming puzzles in the fingerprint index"""
+
+import io
+import multiprocessing
+import os
+import sys
+
+from ccj_to_puz.batch import convert_file
+from ccj_to_puz.ccj_parse import ParsedCCJ
+from ccj_to_puz.fingerprint import FingerprintIndex, claim_for_job, \
+    fingerprint
+from ccj_to_puz.synthetic import make_ccj
+from ccj_to_puz.watch import Watcher
+from samples import METADATA, read_sample, sample_path
+
+METADATA_DICTIONARY = dict(zip(['title', 'author', 'puzzle_number',
+                                'copyright_message', 'date_string'],
+                               METADATA))
+
+def parse(data):
+    parsed = ParsedCCJ()
+    parsed.read_from_bytes(data, None, None, None, u'(c) Test', None)
+    return parsed
+
+def claim_when_started(index_path, source, start, results):
+    parsed = parse(make_ccj(seed=7))
+    start.wait()
+    original = claim_for_job(parsed, source, source + '.puz',
+                             {'fingerprint_index': index_path})
+    results.put((source, original))
+
+def test_only_one_of_two_processes_claims_a_puzzle(tmpdir):
+    index_path = str(tmpdir.join('fingerprints.sqlite'))
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=claim_when_started,
+                                         args=(index_path, source, start,
+                                               results))
+                 for source in ('guardian.ccj', 'herald.ccj')]
+    for p in processes:
+        p.start()
+    start.set()
+    claims = dict(results.get(timeout=60) for _ in processes)
+    for p in processes:
+        p.join()
+    winners = [s for s, original in claims.items() if original is None]
+    assert len(winners) == 1
+    loser, = [s for s in claims if s not in winners]
+    assert claims[loser] == winners[0]
+    index = FingerprintIndex(index_path)
+    try:
+        f = fingerprint(parse(make_ccj(seed=7)))
+        assert [p.source for p in index.duplicates(f)] == winners
+    finally:
+        index.close()
+
+def test_claiming_the_same_source_again_replaces_it(tmpdir):
+    index = FingerprintIndex(str(tmpdir.join('fingerprints.sqlite')))
+    try:
+        f = fingerprint(parse(make_ccj(seed=8)))
+        assert index.claim(f, 'a.ccj', 'a.puz') is None
+        assert index.claim(f, 'a.ccj', 'a.puz') is None
+        assert index.claim(f, 'b.ccj', 'b.puz').source == 'a.ccj'
+        index.release('a.ccj')
+        assert index.claim(f, 'b.ccj', 'b.puz') is None
+    finally:
+        index.close()
+
+def test_convert_file_skips_a_duplicate(tmpdir):
+    # The same puzzle from another source:
+    copy_path = str(tmpdir.join('copy.ccj'))
+    with open(copy_path, 'wb') as f:
+        f.write(read_sample('standard'))
+    metadata = dict(METADATA_DICTIONARY,
+                    fingerprint_index=str(tmpdir.join('fingerprints.sqlite')))
+    first = convert_file((sample_path('standard'),
+                          str(tmpdir.join('first.puz')),
+                          metadata))
+    assert first.succeeded() and first.duplicate_of is None
+    second = convert_file((copy_path, str(tmpdir.join('second.puz')),
+                           metadata))
+    assert second.succeeded()
+    assert second.duplicate_of == sample_path('standard')
+    assert not os.path.exists(str(tmpdir.join('second.puz')))
+    with open(str(tmpdir.join('first.puz')), 'rb') as f:
+        assert f.read() == read_sample('standard', '.puz')
+
+def test_the_watcher_records_no_output_for_a_duplicate(tmpdir):
+    feeds = [tmpdir.mkdir('guardian'), tmpdir.mkdir('herald')]
+    for feed in feeds:
+        path = str(feed.join('puzzle.ccj'))
+        with open(path, 'wb') as f:
+            f.write(read_sample('linked'))
+        os.utime(path, (1000000, 1000000))
+    metadata = dict(METADATA_DICTIONARY,
+                    fingerprint_index=str(tmpdir.join('fingerprints.sqlite')))
+    out = io.StringIO() if sys.version_info >= (3, 0) else io.BytesIO()
+    watcher = Watcher([str(feed) for feed in feeds],
+                      str(tmpdir.join('output')),
+                      metadata=metadata,
+                      processes=1,
+                      settle_seconds=0,
+                      retries=0,
+                      out=out)
+    try:
+        results = watcher.poll()
+        duplicates = [r for r in results if r.duplicate_of is not None]
+        assert len(results) == 2 and len(duplicates) == 1
+        entry = watcher.manifest.files[duplicates[0].input_path]
+        assert entry['output'] is None and entry['error'] is None
+        assert [name for name in os.listdir(str(tmpdir.join('output')))
+                if name.endswith('.puz')] == ['puzzle.puz']
+        assert watcher.poll() == []
+    finally:
+        watcher.close()
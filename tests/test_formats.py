@@ -0,0 +1,71 @@
+"""Tests for the registry of output formats"""
+
+import json
+import os
+
+import pytest
+
+from ccj_to_puz.batch import convert_file
+from ccj_to_puz.formats import SERIALIZERS, PreparedPuzzle, serializer_for
+from samples import METADATA, NAMES, parse_sample, read_sample, sample_path
+
+METADATA_DICTIONARY = dict(zip(['title', 'author', 'puzzle_number',
+                                'copyright_message', 'date_string'],
+                               METADATA))
+
+@pytest.mark.parametrize('name', NAMES)
+def test_puz_is_unchanged(name):
+    prepared = PreparedPuzzle(parse_sample(name))
+    assert prepared.serialize('puz') == read_sample(name, '.puz')
+
+@pytest.mark.parametrize('name', NAMES)
+def test_ipuz_has_the_grid_and_every_clue(name):
+    parsed = parse_sample(name)
+    prepared = PreparedPuzzle(parsed)
+    ipuz = json.loads(prepared.serialize('ipuz').decode('utf-8'))
+    assert ipuz['dimensions'] == {'width': parsed.width,
+                                  'height': parsed.height}
+    assert ipuz['date'] == '01/02/2020'
+    letters = parsed.grid.letter_bytes()
+    lights = parsed.grid.light_mask()
+    for y, row in enumerate(ipuz['solution']):
+        for x, square in enumerate(row):
+            i = y * parsed.width + x
+            if lights[i]:
+                assert square == chr(letters[i])
+            else:
+                assert square == '#'
+    assert len(ipuz['clues']['Across']) + len(ipuz['clues']['Down']) == \
+        len(prepared.clues)
+
+def test_ipuz_links_continued_clues():
+    prepared = PreparedPuzzle(parse_sample('linked'))
+    ipuz = json.loads(prepared.serialize('ipuz').decode('utf-8'))
+    linked = [c for clues in ipuz['clues'].values() for c in clues
+              if isinstance(c, dict)]
+    assert linked
+    for clue in linked:
+        assert clue['continued']
+        assert ',' in clue['label']
+
+def test_text_has_both_directions_and_the_solution():
+    prepared = PreparedPuzzle(parse_sample('standard'))
+    lines = prepared.serialize('text').decode('utf-8').splitlines()
+    for heading in ('ACROSS', 'DOWN', 'SOLUTION'):
+        assert heading in lines
+    assert lines[0].startswith(METADATA[0])
+
+def test_an_unknown_format_is_an_error():
+    with pytest.raises(Exception):
+        serializer_for('pdf')
+
+def test_convert_file_writes_each_format(tmpdir):
+    output_path = os.path.join(str(tmpdir), 'standard.puz')
+    metadata = dict(METADATA_DICTIONARY, formats=sorted(SERIALIZERS))
+    result = convert_file((sample_path('standard'), output_path, metadata))
+    assert result.succeeded()
+    for s in SERIALIZERS.values():
+        assert os.path.exists(os.path.join(str(tmpdir), 'standard' +
+                                           s.extension))
+    with open(output_path, 'rb') as f:
+        assert f.read() == read_sample('standard', '.puz')
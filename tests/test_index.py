@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Tests for the memory-mapped index of answers and clues"""
+
+import random
+
+import pytest
+
+from ccj_to_puz.index import CorpusIndex, IndexBuilder, matches_pattern
+from samples import NAMES, parse_sample
+
+# Answers with characters other than A to Z, which all share a code in
+# the pattern postings:
+OTHER_ANSWERS = [u'CAFÉ', u'CAF-', u'CAF1', u'CAFE', u'ÉCLAT', u'-CLAT']
+
+def other_record():
+    entries = [(n + 1, True, a) for n, a in enumerate(OTHER_ANSWERS)]
+    clues = [(str(n), True, u'Clue with the word café ({0})'.format(len(a)))
+             for n, _, a in entries]
+    return (u'Others', u'Someone', u'1', u'2021-03-04', entries, clues)
+
+@pytest.fixture
+def index(tmpdir):
+    builder = IndexBuilder()
+    for k, name in enumerate(NAMES):
+        parsed = parse_sample(name)
+        parsed.date_string = '2020-01-{0:02d}'.format(k + 1)
+        builder.add(name, parsed)
+    builder.add_record('others', other_record())
+    path = str(tmpdir.join('test.idx'))
+    builder.write(path)
+    with CorpusIndex(path) as index:
+        yield index
+
+def all_answers(index):
+    return [index.answer_of_entry(e) for e in
+            range(index.number_of_entries())]
+
+def brute_force(index, pattern):
+    pattern = pattern.upper()
+    return sorted(e for e, a in enumerate(all_answers(index))
+                  if matches_pattern(a, pattern))
+
+def test_patterns_match_a_brute_force_scan(index):
+    answers = sorted(set(all_answers(index)))
+    r = random.Random(1)
+    patterns = [u'CAF?', u'CAFÉ', u'CAF-', u'?CLAT', u'-CLAT', u'É????',
+                u'....', u'ZZZZ']
+    for _ in range(200):
+        answer = r.choice(answers)
+        patterns.append(u''.join(c if r.random() < 0.4 else u'?'
+                                 for c in answer).lower())
+    for pattern in patterns:
+        assert sorted(index.match_pattern(pattern)) == \
+            brute_force(index, pattern), pattern
+
+def test_characters_other_than_letters_are_told_apart(index):
+    def answers(pattern):
+        return sorted(index.answer_of_entry(e)
+                      for e in index.match_pattern(pattern))
+    assert answers(u'CAFÉ') == [u'CAFÉ']
+    assert answers(u'CAF-') == [u'CAF-']
+    assert answers(u'CAF?') == sorted([u'CAFÉ', u'CAF-', u'CAF1', u'CAFE'])
+    assert answers(u'-CLAT') == [u'-CLAT']
+
+def test_exact_answers(index):
+    for answer in OTHER_ANSWERS:
+        assert [index.entry(e).answer for e in index.find_answer(answer)] == \
+            [answer]
+    assert index.find_answer(u'NOTHERE') == []
+
+def test_clues_setters_and_dates(index):
+    clue_ids = index.search_clues(u'CAFÉ word')
+    assert len(clue_ids) == len(OTHER_ANSWERS)
+    assert all(index.clue(c).puzzle.name == 'others' for c in clue_ids)
+    assert [index.puzzle(p).name for p in index.puzzles_by_setter(u'SOMEONE')] \
+        == ['others']
+    assert sorted(index.puzzle(p).name for p in
+                  index.puzzles_by_date(u'2020-01-02', u'2020-01-03')) == \
+        sorted(NAMES[1:3])
+
+def test_the_index_can_be_reloaded(index, tmpdir):
+    builder = IndexBuilder.from_index(index)
+    path = str(tmpdir.join('again.idx'))
+    builder.write(path)
+    with CorpusIndex(path) as again:
+        assert list(again.records()) == list(index.records())
@@ -0,0 +1,40 @@
+"""Tests for lazy section-by-section parsing"""
+
+import pytest
+
+from ccj_to_puz.ccj_parse import byte_view, locate_sections, \
+    parse_list_of_clues, skip_list_of_clues
+from ccj_to_puz.lazy import LazyParsedCCJ, metadata_only
+from samples import METADATA, NAMES, parse_sample, read_sample
+
+@pytest.mark.parametrize('name', NAMES)
+def test_metadata_only_decodes_nothing_else(name):
+    full = parse_sample(name)
+    lazy = metadata_only(read_sample(name), *METADATA)
+    assert (lazy.width, lazy.height) == (full.width, full.height)
+    assert (lazy.title, lazy.setter, lazy.puzzle_number) == \
+        (full.title, full.setter, full.puzzle_number)
+    assert bytes(lazy.light_mask()) == bytes(full.grid.light_mask())
+    assert lazy.lazy_values == {}
+
+@pytest.mark.parametrize('name', NAMES)
+def test_lazy_output_is_the_same(name):
+    lazy = LazyParsedCCJ()
+    lazy.read_from_bytes(read_sample(name), *METADATA)
+    # Decode the down clues first, which needs the across clues skipped:
+    assert lazy.down_clues.label == parse_sample(name).down_clues.label
+    assert 'across_clues' not in lazy.lazy_values
+    assert lazy.to_puz_bytes() == read_sample(name, '.puz')
+    full = parse_sample(name)
+    assert lazy.button_labels == full.button_labels
+    assert lazy.congratulations_message == full.congratulations_message
+
+@pytest.mark.parametrize('name', NAMES)
+def test_skipping_the_across_clues_finds_the_down_clues(name):
+    data = read_sample(name)
+    sections = locate_sections(data)
+    grid = parse_sample(name).grid
+    end = parse_list_of_clues(byte_view(data), sections.across_clues,
+                              grid)[1]
+    assert skip_list_of_clues(byte_view(data), sections.across_clues) == end
+    assert sections.locate_down_clues(data) == end
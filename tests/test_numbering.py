@@ -0,0 +1,83 @@
+"""Tests for working out the clue numbers and entries of grids"""
+
+import json
+import random
+
+import pytest
+
+from ccj_to_puz.numbering import number_grid
+from samples import NAMES, parse_sample, read_sample
+
+def original_clue_numbers(name):
+    numbers = json.loads(read_sample(name, '.numbers.json').decode('utf-8'))
+    return dict((int(n), details) for n, details in numbers.items())
+
+def number_each_cell(width, height, lights):
+    """Number a grid as the original Grid.set_numbers did"""
+    def light(x, y):
+        return 0 <= x < width and 0 <= y < height and lights[y * width + x]
+    clue_numbers = {}
+    n = 1
+    for y in range(height):
+        for x in range(width):
+            if not light(x, y):
+                continue
+            details = {}
+            if light(x + 1, y) and not light(x - 1, y):
+                details['across'] = True
+            if light(x, y + 1) and not light(x, y - 1):
+                details['down'] = True
+            if details:
+                details.update(x=x, y=y)
+                clue_numbers[n] = details
+                n += 1
+    return clue_numbers
+
+def random_lights(width, height, seed):
+    r = random.Random(seed)
+    return bytearray(1 if r.random() < 0.7 else 0
+                     for _ in range(width * height))
+
+@pytest.mark.parametrize('name', NAMES)
+def test_the_clue_numbers_match_the_original(name):
+    grid = parse_sample(name).grid
+    assert dict(grid.clue_numbers) == original_clue_numbers(name)
+
+@pytest.mark.parametrize('name', NAMES)
+def test_each_entry_has_its_answer(name):
+    grid = parse_sample(name).grid
+    for entry in grid.numbering.entries:
+        step = (1, 0) if entry.across else (0, 1)
+        letters = [grid.cells[entry.y + k * step[1]][entry.x + k * step[0]]
+                   for k in range(entry.length)]
+        assert entry.answer == "".join(c.letter for c in letters)
+        assert grid.numbering.entry(entry.number, entry.across) is entry
+
+def test_a_missing_number_has_no_details():
+    grid = parse_sample('small').grid
+    missing = max(grid.clue_numbers) + 1
+    assert grid.clue_directions(missing) == ()
+    # As with the original Grid, clue_numbers is a defaultdict:
+    assert grid.clue_numbers[missing] == {}
+
+@pytest.mark.parametrize('seed', range(20))
+def test_the_same_as_numbering_each_cell(seed):
+    width, height = 3 + seed % 11, 2 + seed % 7
+    lights = random_lights(width, height, seed)
+    numbering = number_grid(width, height, lights)
+    assert dict(numbering.clue_numbers) == \
+        number_each_cell(width, height, lights)
+    for n, details in numbering.clue_numbers.items():
+        expected = [d for d, k in (('A', 'across'), ('D', 'down'))
+                    if k in details]
+        assert list(numbering.directions[n]) == expected
+
+@pytest.mark.parametrize('seed', range(20))
+def test_numpy_gives_the_same_numbering(seed):
+    pytest.importorskip('numpy')
+    width, height = 2 + seed * 3, 2 + seed * 2
+    lights = random_lights(width, height, seed)
+    with_regexps = number_grid(width, height, lights, use_numpy=False)
+    with_numpy = number_grid(width, height, lights, use_numpy=True)
+    assert [(e.number, e.across, e.cells) for e in with_numpy.entries] == \
+        [(e.number, e.across, e.cells) for e in with_regexps.entries]
@@ -0,0 +1,88 @@
+"""Tests for reading .puz files back, and for the round-trip verifier"""
+
+import pytest
+
+from ccj_to_puz.puz_read import LABEL_RE, LABELLED_CLUE_RE, \
+    PuzReadError, read_puz_bytes
+from ccj_to_puz.verify import clue_tuples, compare, verify_inputs
+from samples import METADATA, NAMES, parse_sample, read_sample, \
+    sample_path
+
+METADATA_DICTIONARY = dict(zip(['title', 'author', 'puzzle_number',
+                                'copyright_message', 'date_string'],
+                               METADATA))
+
+def clue_strings(puz):
+    """Return the clues of puz as they were written in the .puz file"""
+    return [u"[{0}] {1}".format(label, text)
+            for _, label, text in puz.ordered_clues()]
+
+@pytest.mark.parametrize('name', NAMES)
+def test_the_samples_round_trip(name):
+    parsed = parse_sample(name)
+    puz = read_puz_bytes(read_sample(name, '.puz'))
+    assert not puz.has_checksums
+    assert compare(parsed, parsed.ordered_clues(), puz) == []
+
+@pytest.mark.parametrize('name', NAMES)
+def test_checksums_are_verified(name):
+    data = bytearray(parse_sample(name).to_puz_bytes(checksums=True))
+    puz = read_puz_bytes(bytes(data))
+    assert puz.has_checksums
+    assert puz.bad_checksums == []
+    # Change the first letter of the title:
+    data[data.index(b'Title')] = ord('t')
+    puz = read_puz_bytes(bytes(data))
+    assert puz.bad_checksums == ['global', 'masked']
+
+def test_linked_clues_keep_their_labels():
+    parsed = parse_sample('linked')
+    puz = read_puz_bytes(read_sample('linked', '.puz'))
+    linked = [(c.all_clue_numbers, label)
+              for c, label, _ in parsed.ordered_clues()
+              if len(c.all_clue_numbers) > 1]
+    assert linked
+    assert linked == [(c.all_clue_numbers, label)
+                      for c, label, _ in puz.ordered_clues()
+                      if len(c.all_clue_numbers) > 1]
+
+@pytest.mark.parametrize('name', ['standard', 'linked'])
+def test_clues_are_matched_by_label_not_position(name):
+    puz = read_puz_bytes(read_sample(name, '.puz'))
+    expected = clue_tuples(puz.ordered_clues())
+    # Labels without a direction (like those of the "See N" clues)
+    # can only be told apart by their order, so the clues for each
+    # number are kept in order, but the numbers are reversed:
+    strings = sorted(clue_strings(puz), reverse=True,
+                     key=lambda s: int(LABEL_RE.search(s[1:]).group(1)))
+    puz.read_clues(strings)
+    assert clue_tuples(puz.ordered_clues()) == expected
+    assert puz.unmatched_clues == []
+
+def test_unlabelled_clues_are_matched_in_grid_order():
+    puz = read_puz_bytes(read_sample('standard', '.puz'))
+    texts = [LABELLED_CLUE_RE.search(s).group(2) for s in clue_strings(puz)]
+    puz.read_clues(texts)
+    entries = puz.grid.numbering.entries
+    found = [(c.all_clue_numbers[0], label, text)
+             for c, label, text in puz.ordered_clues()]
+    assert found == [((e.number, e.across), str(e.number), text)
+                     for e, text in zip(entries, texts)]
+
+def test_extra_clues_are_kept_aside():
+    puz = read_puz_bytes(read_sample('standard', '.puz'))
+    strings = clue_strings(puz)
+    puz.read_clues(strings + [u"[1] One too many"])
+    assert puz.unmatched_clues == [u"[1] One too many"]
+    assert len(puz.ordered_clues()) == len(strings)
+
+def test_a_truncated_file_is_an_error():
+    data = read_sample('standard', '.puz')
+    with pytest.raises(PuzReadError):
+        read_puz_bytes(data[:-40])
+
+def test_verify_inputs_finds_no_differences():
+    results = list(verify_inputs([sample_path(name) for name in NAMES],
+                                 METADATA_DICTIONARY, processes=1))
+    assert len(results) == len(NAMES)
+    assert all(r.matched() for r in results)
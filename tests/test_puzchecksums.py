@@ -0,0 +1,71 @@
+"""Tests for the .puz checksums, against the published algorithm
+
+See http://joshisanerd.com/puz/ for the layout of the header and how
+the checksums are worked out."""
+
+import struct
+
+import pytest
+
+from ccj_to_puz.puzchecksums import checksum_region
+from samples import NAMES, parse_sample, read_sample
+
+HEADER_SIZE = 0x34
+
+def reference_checksum(data, cksum=0):
+    for b in bytearray(data):
+        if cksum & 1:
+            cksum = (cksum >> 1) + 0x8000
+        else:
+            cksum = cksum >> 1
+        cksum = (cksum + b) & 0xffff
+    return cksum
+
+def reference_text_checksum(strings, number_of_clues, cksum=0):
+    title, author, copyright_message = strings[:3]
+    for s in (title, author, copyright_message):
+        if s:
+            cksum = reference_checksum(s + b'\x00', cksum)
+    for clue in strings[3:3 + number_of_clues]:
+        cksum = reference_checksum(clue, cksum)
+    notes = strings[3 + number_of_clues]
+    if notes:
+        cksum = reference_checksum(notes + b'\x00', cksum)
+    return cksum
+
+def reference_checksums(puz):
+    """Return the global, CIB and masked checksums that puz should have"""
+    width, height, number_of_clues = struct.unpack_from('<BBH', puz, 0x2C)
+    size = width * height
+    solution = puz[HEADER_SIZE:HEADER_SIZE + size]
+    grid = puz[HEADER_SIZE + size:HEADER_SIZE + 2 * size]
+    strings = puz[HEADER_SIZE + 2 * size:].split(b'\x00')
+    cib = reference_checksum(puz[0x2C:0x34])
+    total = reference_checksum(grid, reference_checksum(solution, cib))
+    total = reference_text_checksum(strings, number_of_clues, total)
+    parts = [cib, reference_checksum(solution), reference_checksum(grid),
+             reference_text_checksum(strings, number_of_clues)]
+    masked = bytearray(ord(m) ^ (c & 0xff) for m, c in zip('ICHE', parts))
+    masked += bytearray(ord(m) ^ (c >> 8) for m, c in zip('ATED', parts))
+    return total, cib, bytes(masked)
+
+@pytest.mark.parametrize('data', [b'', b'\x00', b'ACROSS&DOWN', bytes(
+    bytearray(range(256)) * 3)])
+def test_checksum_region(data):
+    assert checksum_region(data) == reference_checksum(data)
+    assert checksum_region(data, 0x1234) == reference_checksum(data, 0x1234)
+
+@pytest.mark.parametrize('name', NAMES)
+def test_the_checksums_are_right(name):
+    puz = parse_sample(name).to_puz_bytes(checksums=True)
+    total, cib, masked = reference_checksums(puz)
+    assert struct.unpack_from('<H', puz, 0x00)[0] == total
+    assert puz[0x02:0x0E] == b'ACROSS&DOWN\x00'
+    assert struct.unpack_from('<H', puz, 0x0E)[0] == cib
+    assert puz[0x10:0x18] == masked
+    assert puz[0x18:0x1C] == b'1.3\x00'
+    # The only other change is the standard value for the bitmask:
+    baseline = read_sample(name, '.puz')
+    assert struct.unpack_from('<H', puz, 0x30)[0] == 1
+    assert puz[0x2C:0x30] == baseline[0x2C:0x30]
+    assert puz[0x32:] == baseline[0x32:]
@@ -0,0 +1,72 @@
+"""Tests for resolving clue numbers and adding the placeholder clues"""
+
+import io
+import logging
+import sys
+
+import pytest
+
+from ccj_to_puz import tracing
+from ccj_to_puz.commonccj import CCJParseError
+from ccj_to_puz.resolver import resolver_for
+from ccj_to_puz.stats import ParseStats
+from samples import parse_sample
+
+def test_placeholders_point_at_the_clue_covering_them():
+    parsed = parse_sample('linked')
+    clue_groups = parsed.clue_dictionaries_with_placeholders()
+    resolver = resolver_for(parsed.grid)
+    placeholders = [c for group in clue_groups.values()
+                    for c in group.values() if c.placeholder_for is not None]
+    assert placeholders
+    for placeholder in placeholders:
+        clue = placeholder.placeholder_for
+        duple, = placeholder.all_clue_numbers
+        assert duple in clue.all_clue_numbers
+        assert resolver.clue_for_entry[duple] is clue
+        assert placeholder.text_including_enumeration.startswith(
+            "See {0}".format(clue.all_clue_numbers[0][0]))
+    assert resolver.coordinate_base == 0
+    assert resolver.mismatched_starts == []
+
+def test_the_resolver_is_kept_until_the_grid_is_renumbered():
+    parsed = parse_sample('standard')
+    resolver = resolver_for(parsed.grid)
+    assert resolver_for(parsed.grid) is resolver
+    parsed.grid.set_numbers()
+    assert resolver_for(parsed.grid) is not resolver
+
+def test_a_number_that_isnt_in_the_grid_is_an_error():
+    parsed = parse_sample('linked')
+    clue = parsed.across_clues.clue_dictionary[14]
+    # The direction is believed, so this only fails when the
+    # placeholder for 99 across is made:
+    clue.set_number('14/99A', parsed.grid)
+    assert clue.all_clue_numbers == [(14, True), (99, True)]
+    with pytest.raises(CCJParseError) as e:
+        parsed.to_puz_bytes()
+    assert 'clue number 99' in str(e.value)
+
+def test_coordinates_counting_from_one_are_warned_about():
+    parsed = parse_sample('linked')
+    for clues in (parsed.across_clues, parsed.down_clues):
+        for clue in clues.clue_dictionary.values():
+            clue.start_coordinates = [(x + 1, y + 1)
+                                      for x, y in clue.start_coordinates]
+    stream = io.StringIO() if sys.version_info >= (3, 0) else io.BytesIO()
+    package_logger = logging.getLogger('ccj_to_puz')
+    handlers = list(package_logger.handlers)
+    stats = ParseStats()
+    try:
+        tracing.enable(['resolver'], stream=stream)
+        output = parsed.to_puz_bytes(stats=stats)
+    finally:
+        package_logger.handlers = handlers
+        logging.getLogger('ccj_to_puz.resolver').setLevel(logging.NOTSET)
+    resolver = resolver_for(parsed.grid)
+    assert resolver.coordinate_base == 1
+    assert resolver.mismatched_starts == []
+    assert stats.counters['start_coordinates_from_one'] == 1
+    assert 'count from 1' in stream.getvalue()
+    # The coordinates aren't in the .puz file, so it's unchanged:
+    assert output == parse_sample('linked').to_puz_bytes()
@@ -0,0 +1,54 @@
+"""Tests for scheduler.Scheduler's handling of jobs that hang or crash"""
+
+import os
+import time
+
+from ccj_to_puz.batch import ConversionResult
+from ccj_to_puz.scheduler import Scheduler
+
+def pretend_to_convert(job):
+    """Convert nothing, after sleeping or exiting as job says"""
+    input_path, output_path, behaviour = job
+    if behaviour == 'hang':
+        time.sleep(60)
+    elif behaviour == 'crash':
+        os._exit(3)
+    return ConversionResult(input_path, output_path)
+
+def run(jobs, **options):
+    scheduler = Scheduler(2, function=pretend_to_convert, **options)
+    return scheduler.run(jobs)
+
+def test_a_job_that_hangs_is_killed_and_the_rest_finish():
+    jobs = [('a.ccj', 'a.puz', None),
+            ('hangs.ccj', 'hangs.puz', 'hang'),
+            ('b.ccj', 'b.puz', None),
+            ('c.ccj', 'c.puz', None)]
+    start = time.time()
+    results = run(jobs, timeout=1.0)
+    assert time.time() - start < 30
+    assert [r.input_path for r in results] == [j[0] for j in jobs]
+    assert results[1].error_type == 'Timeout'
+    assert not results[1].transient
+    assert all(r.succeeded() for i, r in enumerate(results) if i != 1)
+
+def test_a_worker_that_dies_is_replaced():
+    jobs = [('crashes.ccj', 'crashes.puz', 'crash')] + \
+        [('{0}.ccj'.format(i), '{0}.puz'.format(i), None) for i in range(5)]
+    results = run(jobs, timeout=30.0)
+    assert results[0].error_type == 'WorkerCrashed'
+    assert 'code 3' in results[0].error
+    assert all(r.succeeded() for r in results[1:])
+
+def test_a_timed_out_input_is_quarantined(tmpdir):
+    hanging = tmpdir.join('hangs.ccj')
+    hanging.write('')
+    quarantine_directory = tmpdir.join('quarantine')
+    results = run([(str(hanging), 'hangs.puz', 'hang')],
+                  timeout=0.5,
+                  quarantine_directory=str(quarantine_directory))
+    assert results[0].error_type == 'Timeout'
+    assert not hanging.exists()
+    assert results[0].quarantined_path == \
+        str(quarantine_directory.join('hangs.ccj'))
+    assert quarantine_directory.join('hangs.ccj.error.json').exists()
@@ -0,0 +1,58 @@
+"""Tests for the conversion server's handling of its pool"""
+
+import sys
+import time
+
+import pytest
+
+if sys.version_info < (3, 7):
+    pytest.skip("the server needs Python 3.7", allow_module_level=True)
+
+import asyncio
+
+from ccj_to_puz import aio, server
+from samples import METADATA, read_sample
+
+def slow_convert_to_bytes(data, metadata, output_format):
+    time.sleep(0.3)
+    return b'puz'
+
+def status_of(loop, coroutine):
+    try:
+        loop.run_until_complete(coroutine)
+    except server.HTTPError as e:
+        return e.status
+    return 200
+
+@pytest.fixture
+def conversion_server():
+    s = server.ConversionServer(workers=1, use_threads=True, max_pending=1)
+    yield s
+    s.shutdown()
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+def test_a_conversion(conversion_server, loop):
+    metadata = dict(zip(['title', 'author', 'puzzle_number',
+                         'copyright_message', 'date_string'], METADATA))
+    result = loop.run_until_complete(
+        conversion_server.convert(read_sample('standard'), metadata))
+    assert result == read_sample('standard', '.puz')
+    assert status_of(loop, conversion_server.convert(b'junk', {})) == 422
+
+def test_a_timed_out_conversion_keeps_its_slot(monkeypatch, conversion_server,
+                                               loop):
+    monkeypatch.setattr(aio, 'convert_to_bytes', slow_convert_to_bytes)
+    conversion_server.converter.timeout = 0.05
+    assert status_of(loop, conversion_server.convert(b'', {})) == 504
+    # The worker is still busy with it, so there's no room:
+    assert conversion_server.converter.pending == 1
+    assert status_of(loop, conversion_server.convert(b'', {})) == 503
+    loop.run_until_complete(asyncio.sleep(0.4))
+    assert conversion_server.converter.pending == 0
+    conversion_server.converter.timeout = 1.0
+    assert status_of(loop, conversion_server.convert(b'', {})) == 200
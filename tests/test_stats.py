@@ -0,0 +1,37 @@
+"""Tests for the per-stage timings and counters"""
+
+import json
+
+from ccj_to_puz.ccj_parse import ParsedCCJ
+from ccj_to_puz.stats import ParseStats
+from samples import METADATA, read_sample
+
+PARSE_STAGES = ['clues', 'grid', 'header', 'metadata', 'numbering']
+WRITE_STAGES = ['placeholders', 'puz']
+
+def test_the_stages_are_recorded():
+    stats = ParseStats()
+    data = read_sample('linked')
+    parsed = ParsedCCJ()
+    parsed.read_from_bytes(data, *METADATA, stats=stats)
+    assert sorted(stats.stage_seconds) == PARSE_STAGES
+    puz = parsed.to_puz_bytes(stats=stats)
+    assert sorted(stats.stage_seconds) == sorted(PARSE_STAGES + WRITE_STAGES)
+    assert all(t >= 0 for t in stats.stage_seconds.values())
+    assert stats.counters['bytes_read'] == len(data)
+    assert stats.counters['puzzles_parsed'] == 1
+    assert stats.counters['puzzles_written'] == 1
+    assert stats.counters['bytes_written'] == len(puz)
+    assert stats.counters['placeholder_clues'] > 0
+
+def test_stats_can_be_merged_through_json():
+    a = ParseStats()
+    a.stage_seconds['grid'] = 1.5
+    a.count('puzzles_parsed')
+    a.add_encodings({'cp1252': 2})
+    b = ParseStats()
+    b.merge(json.loads(a.to_json()))
+    b.merge(a)
+    assert b.stage_seconds == {'grid': 3.0}
+    assert b.counters == {'puzzles_parsed': 2}
+    assert b.encodings_used == {'cp1252': 4}
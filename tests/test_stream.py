@@ -0,0 +1,75 @@
+"""Tests for the framed streaming mode"""
+
+import base64
+import io
+import json
+import struct
+
+from ccj_to_puz.stream import convert_stream
+from samples import METADATA, NAMES, read_sample
+
+METADATA_DICTIONARY = dict(zip(['title', 'author', 'puzzle_number',
+                                'copyright_message', 'date_string'],
+                               METADATA))
+
+class TrickleStream(object):
+    """A binary stream that gives at most 3 bytes per read, like a pipe"""
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+    def read(self, n):
+        return self.stream.read(min(n, 3))
+
+def frame(data):
+    return struct.pack('>I', len(data)) + data
+
+def read_results(data):
+    results = []
+    i = 0
+    while i < len(data):
+        tag = data[i:(i + 1)]
+        length = struct.unpack('>I', data[(i + 1):(i + 5)])[0]
+        results.append((tag, data[(i + 5):(i + 5 + length)]))
+        i += 5 + length
+    return results
+
+def convert(data, framing):
+    output = io.BytesIO()
+    if framing == 'binary':
+        input_stream = TrickleStream(data)
+    else:
+        input_stream = io.BytesIO(data)
+    counts = convert_stream(input_stream, output, METADATA_DICTIONARY,
+                            framing)
+    return counts, output.getvalue()
+
+def test_binary_records_round_trip():
+    inputs = [read_sample(name) for name in NAMES]
+    inputs.insert(2, b'not a crossword')
+    data = b''.join(frame(d) for d in inputs)
+    counts, output = convert(data + frame(b'truncated')[:-2], 'binary')
+    assert counts == (len(NAMES), 2)
+    results = read_results(output)
+    assert len(results) == len(NAMES) + 2
+    puz_results = [payload for tag, payload in results if tag == b'P']
+    assert puz_results == [read_sample(name, '.puz') for name in NAMES]
+    errors = [json.loads(payload.decode('utf-8'))
+              for tag, payload in results if tag == b'E']
+    assert [e['index'] for e in errors] == [2, len(NAMES) + 1]
+    assert errors[1]['type'] == 'TruncatedRecord'
+
+def test_base64_records_round_trip():
+    lines = [base64.b64encode(read_sample(name)) for name in NAMES]
+    lines.insert(1, b'')
+    lines.insert(3, b'!!!')
+    data = b'\n'.join(lines) + b'\n'
+    counts, output = convert(data, 'base64')
+    assert counts == (len(NAMES), 1)
+    records = [json.loads(line.decode('utf-8'))
+               for line in output.splitlines()]
+    assert [r['index'] for r in records] == list(range(len(NAMES) + 1))
+    assert 'puz' not in records[2]
+    puz_results = [base64.b64decode(r['puz']) for r in records if 'puz' in r]
+    assert puz_results == [read_sample(name, '.puz') for name in NAMES]
+
+def test_an_empty_stream():
+    assert convert(b'', 'binary') == ((0, 0), b'')
@@ -0,0 +1,30 @@
+"""Tests that the synthetic crosswords can be parsed"""
+
+import pytest
+
+from ccj_to_puz.ccj_parse import ParsedCCJ
+from ccj_to_puz.synthetic import ENCODING_EXTRAS, SyntheticCCJ, make_corpus
+
+def parse(synthetic):
+    parsed = ParsedCCJ()
+    parsed.read_from_bytes(synthetic.data, u'Title', u'Setter', None,
+                           u'(c) Test', '2020-01-02')
+    return parsed
+
+@pytest.mark.parametrize('encoding', sorted(ENCODING_EXTRAS))
+def test_synthetic_crosswords_can_be_parsed(encoding):
+    synthetic = SyntheticCCJ(width=13, height=11, linked_clues=3,
+                             encoding=encoding, block_density=0.1, seed=7,
+                             skippable_blocks=2)
+    parsed = parse(synthetic)
+    assert (parsed.width, parsed.height) == (13, 11)
+    assert bytes(parsed.grid.light_mask()) == bytes(synthetic.lights)
+    assert bytes(parsed.grid.letter_bytes()) == bytes(synthetic.letters)
+    assert parsed.across_clues.number_of_clues == len(synthetic.clue_lists[True])
+    assert parsed.down_clues.number_of_clues == len(synthetic.clue_lists[False])
+
+def test_the_corpus_is_varied_but_reproducible():
+    corpus = make_corpus(3, seed=10)
+    assert len(set(s.data for s in corpus)) == 3
+    assert [s.data for s in make_corpus(3, seed=10)] == \
+        [s.data for s in corpus]
@@ -0,0 +1,35 @@
+"""Tests that diagnostics are quiet and unformatted unless enabled"""
+
+import io
+import logging
+import sys
+
+from ccj_to_puz import tracing
+from samples import parse_sample
+
+class Unformattable(object):
+    def __format__(self, spec):
+        raise AssertionError("formatted a message that isn't output")
+
+def test_parsing_is_quiet_by_default(capsys):
+    parse_sample('linked')
+    out, err = capsys.readouterr()
+    assert out == ''
+
+def test_messages_are_only_formatted_when_enabled():
+    tracer = tracing.get_tracer('test_tracing')
+    assert not tracer.enabled()
+    tracer.debug("{0}", Unformattable())
+
+def test_enabling_one_module():
+    stream = io.StringIO() if sys.version_info >= (3, 0) else io.BytesIO()
+    package_logger = logging.getLogger('ccj_to_puz')
+    handlers = list(package_logger.handlers)
+    try:
+        tracing.enable(['test_tracing'], stream=stream)
+        tracing.get_tracer('test_tracing').debug("{0} and {1}", 1, u'two')
+        tracing.get_tracer('test_other').debug("not shown")
+    finally:
+        logging.getLogger('ccj_to_puz.test_tracing').setLevel(logging.NOTSET)
+        package_logger.handlers = handlers
+    assert stream.getvalue() == '1 and two\n'
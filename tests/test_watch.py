@@ -0,0 +1,131 @@
+"""Tests for watching directories and converting what changes"""
+
+import errno
+import io
+import os
+import shutil
+import sys
+
+import pytest
+
+from ccj_to_puz import watch
+from ccj_to_puz.archive import convert_member
+from ccj_to_puz.batch import ConversionResult
+from ccj_to_puz.watch import Watcher
+from samples import METADATA, read_sample
+
+METADATA_DICTIONARY = dict(zip(['title', 'author', 'puzzle_number',
+                                'copyright_message', 'date_string'],
+                               METADATA))
+
+def write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    # Make it old enough to have settled:
+    os.utime(path, (1000000, 1000000))
+
+def make_watcher(tmpdir, directories):
+    out = io.StringIO() if sys.version_info >= (3, 0) else io.BytesIO()
+    return Watcher([str(d) for d in directories],
+                   str(tmpdir.join('output')),
+                   metadata=METADATA_DICTIONARY,
+                   processes=1,
+                   settle_seconds=0,
+                   retries=0,
+                   out=out)
+
+@pytest.fixture
+def feed(tmpdir):
+    feed = tmpdir.mkdir('feed')
+    write_file(str(feed.join('a.ccj')), read_sample('standard'))
+    write_file(str(feed.join('b.ccj')), read_sample('linked'))
+    return feed
+
+def converted(results):
+    return sorted(os.path.basename(r.input_path) for r in results)
+
+def test_only_new_and_changed_files_are_converted(tmpdir, feed):
+    watcher = make_watcher(tmpdir, [feed])
+    assert converted(watcher.poll()) == ['a.ccj', 'b.ccj']
+    with open(str(tmpdir.join('output', 'a.puz')), 'rb') as f:
+        assert f.read() == read_sample('standard', '.puz')
+    assert watcher.poll() == []
+    # Touched, but not changed:
+    os.utime(str(feed.join('a.ccj')), (2000000, 2000000))
+    assert watcher.poll() == []
+    write_file(str(feed.join('b.ccj')), read_sample('small'))
+    assert converted(watcher.poll()) == ['b.ccj']
+    watcher.close()
+    # A new Watcher carries on from the manifest:
+    assert make_watcher(tmpdir, [feed]).poll() == []
+
+def test_a_file_that_fails_is_recorded_without_an_output(tmpdir, feed):
+    write_file(str(feed.join('bad.ccj')), b'not a crossword')
+    watcher = make_watcher(tmpdir, [feed])
+    results = watcher.poll()
+    assert converted(results) == ['a.ccj', 'b.ccj', 'bad.ccj']
+    entry = watcher.manifest.files[str(feed.join('bad.ccj'))]
+    assert entry['error'] is not None
+    assert entry['output'] is None
+    assert not os.path.exists(str(tmpdir.join('output', 'bad.puz')))
+    assert watcher.poll() == []
+
+def test_a_failed_write_is_tried_again(tmpdir, feed, monkeypatch):
+    atomic_write = watch.atomic_write
+    def failing_write(path, data):
+        if path.endswith('a.puz'):
+            raise IOError("No space left on device")
+        atomic_write(path, data)
+    monkeypatch.setattr(watch, 'atomic_write', failing_write)
+    watcher = make_watcher(tmpdir, [feed])
+    succeeded = dict((os.path.basename(r.input_path), r.succeeded())
+                     for r in watcher.poll())
+    assert succeeded == {'a.ccj': False, 'b.ccj': True}
+    assert str(feed.join('a.ccj')) not in watcher.manifest.files
+    monkeypatch.setattr(watch, 'atomic_write', atomic_write)
+    assert converted(watcher.poll()) == ['a.ccj']
+
+def test_same_named_files_get_their_own_outputs(tmpdir, feed):
+    other = tmpdir.mkdir('other')
+    write_file(str(other.join('a.ccj')), read_sample('small'))
+    watcher = make_watcher(tmpdir, [feed, other])
+    watcher.poll()
+    outputs = dict((os.path.basename(os.path.dirname(p)), e['output'])
+                   for p, e in watcher.manifest.files.items()
+                   if p.endswith('a.ccj'))
+    assert sorted(os.path.basename(o) for o in outputs.values()) == \
+        ['a-2.puz', 'a.puz']
+    with open(outputs['other'], 'rb') as f:
+        assert f.read() == read_sample('small', '.puz')
+    # They keep their names when one changes:
+    write_file(str(other.join('a.ccj')), read_sample('cp1252'))
+    watcher.poll()
+    assert watcher.manifest.files[str(other.join('a.ccj'))]['output'] == \
+        outputs['other']
+
+def test_entries_survive_a_directory_that_cant_be_scanned(tmpdir, feed):
+    watcher = make_watcher(tmpdir, [feed])
+    watcher.poll()
+    moved = str(tmpdir.join('moved'))
+    shutil.move(str(feed), moved)
+    assert watcher.poll() == []
+    assert len(watcher.manifest.files) == 2
+    shutil.move(moved, str(feed))
+    assert watcher.poll() == []
+
+def flaky_convert_member(job):
+    if job[0].endswith('a.ccj'):
+        result = ConversionResult(job[0], job[1])
+        result.set_error(IOError(errno.EIO, "Input/output error"))
+        return result
+    return convert_member(job)
+
+def test_a_transient_failure_is_tried_again(tmpdir, feed):
+    watcher = make_watcher(tmpdir, [feed])
+    watcher.scheduler.function = flaky_convert_member
+    results = dict((os.path.basename(r.input_path), r)
+                   for r in watcher.poll())
+    assert results['a.ccj'].transient
+    assert str(feed.join('a.ccj')) not in watcher.manifest.files
+    watcher.scheduler.function = convert_member
+    assert converted(watcher.poll()) == ['a.ccj']